@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
+from soul.llm.provider import llm_scheduler
 from ..websockets.manager import manager
 
 router = APIRouter(prefix="/agent", tags=["agent"])
@@ -11,7 +12,7 @@ class AgentGoalsUpdate(BaseModel):
 
 @router.put("/{user_id}/goals")
 async def update_agent_goals(user_id: str, goals: AgentGoalsUpdate):
-    agent = manager.get_agent(user_id)
+    agent = await manager.get_agent(user_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found (is the websocket connected?)")
     
@@ -36,7 +37,7 @@ async def update_agent_goals(user_id: str, goals: AgentGoalsUpdate):
 
 @router.delete("/{user_id}/thinking-pool/{item_id}")
 async def delete_thinking_pool_item(user_id: str, item_id: str):
-    agent = manager.get_agent(user_id)
+    agent = await manager.get_agent(user_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found (is the websocket connected?)")
     
@@ -56,3 +57,13 @@ async def delete_thinking_pool_item(user_id: str, item_id: str):
     })
     
     return {"status": "deleted", "item_id": item_id}
+
+@router.get("/llm/scheduler")
+async def get_llm_scheduler_stats():
+    """Per-endpoint LLM concurrency, queue depth and queue-wait stats (shared by all agents)."""
+    return llm_scheduler.snapshot()
+
+@router.get("/lifecycle")
+async def get_agent_lifecycle_stats():
+    """Live / running / hibernated agent counts and rehydration times."""
+    return manager.lifecycle.snapshot()
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from memory.blob_store import blob_store
+
+router = APIRouter(prefix="/blobs", tags=["blobs"])
+
+@router.get("/{name}")
+async def get_blob(name: str):
+    """Full payload referenced from a working memory history entry (actionData["$blobs"] or the entry's "$blobs")."""
+    resolved = blob_store.resolve(name)
+    if not resolved:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    path, media_type = resolved
+    # Content-addressed: never changes
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": "public, max-age=31536000, immutable"})
@@ -39,7 +39,7 @@ def get_store():
 
 @router.get("/actions")
 async def get_actions(user_id: str):
-    agent = manager.get_agent(user_id)
+    agent = await manager.get_agent(user_id)
     if agent:
         return agent.action_registry.get_all_schemas()
     else:
@@ -0,0 +1,18 @@
+from typing import Optional
+from fastapi import APIRouter
+from pydantic import BaseModel
+from memory.sense_bus import deliver
+
+router = APIRouter(prefix="/senses", tags=["senses"])
+
+class SenseEvent(BaseModel):
+    sense: str
+    content: str
+
+@router.post("")
+async def post_sense(event: SenseEvent, user_id: Optional[str] = None):
+    """
+    Delivers sense lines to the agent of `user_id` in this process (every agent without it).
+    Behind the multi-process gateway the request is routed to the worker owning the user.
+    """
+    return {"delivered": deliver(user_id, event.sense, event.content)}
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Query
+from typing import Optional
+from soul.llm.usage import usage_tracker
+
+router = APIRouter(prefix="/usage", tags=["usage"])
+
+@router.get("/")
+async def get_usage_summary(
+    window: float = Query(300, gt=0, description="Rolling window in seconds"),
+    group_by: str = Query("node", description="Comma-separated: node, model, user_id"),
+    user_id: Optional[str] = None
+):
+    """Tokens, latency, TTFT and estimated cost of LLM calls in the last `window` seconds."""
+    fields = [g.strip() for g in group_by.split(",") if g.strip()]
+    return usage_tracker.summary(window=window, group_by=fields, user_id=user_id)
+
+@router.get("/totals")
+async def get_usage_totals():
+    """Lifetime totals per (node, model, user_id) since the backend started."""
+    return usage_tracker.lifetime()
+
+@router.get("/recent")
+async def get_recent_calls(limit: int = Query(50, ge=1, le=1000)):
+    return usage_tracker.recent(limit)
@@ -0,0 +1,2 @@
+from .hashring import HashRing
+from .gateway import create_gateway, route_key
@@ -0,0 +1,104 @@
+"""
+Multi-process mode: N worker processes behind a routing gateway.
+
+    cd backend && python -m app.cluster --workers 4 --port 8000
+
+Each worker is the regular app (app.main:app) served by uvicorn on a unix socket
+in --socket-dir; the gateway listens on --host/--port and forwards every user's
+websocket and REST traffic to the worker that owns the user (see gateway.py).
+Workers that exit are restarted.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Dict
+import uvicorn
+from config.settings import settings
+from .gateway import create_gateway, socket_path
+
+class WorkerSupervisor:
+    def __init__(self, workers: int, socket_dir: str):
+        self.names = [f"worker-{i}" for i in range(workers)]
+        self.socket_dir = socket_dir
+        self.processes: Dict[str, subprocess.Popen] = {}
+        self.restarts: Dict[str, int] = {name: 0 for name in self.names}
+        self.started_at: Dict[str, float] = {}
+
+    def spawn(self, name: str):
+        path = socket_path(self.socket_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+        env = {
+            **os.environ,
+            "ALICE_WORKER_ID": name,
+            # Lets workers compute the ring (user ownership) and reach each other
+            "ALICE_WORKERS": ",".join(self.names),
+            "CLUSTER_SOCKET_DIR": self.socket_dir
+        }
+        self.processes[name] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--uds", path],
+            env=env
+        )
+        self.started_at[name] = time.time()
+        print(f"Started {name} (pid {self.processes[name].pid}) on {path}")
+
+    def start(self):
+        os.makedirs(self.socket_dir, exist_ok=True)
+        for name in self.names:
+            self.spawn(name)
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(settings.CLUSTER_WATCH_INTERVAL)
+            for name, process in list(self.processes.items()):
+                if process.poll() is not None:
+                    print(f"{name} exited with {process.returncode}, restarting")
+                    self.restarts[name] += 1
+                    self.spawn(name)
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def status(self):
+        return {
+            name: {
+                "pid": process.pid,
+                "alive": process.poll() is None,
+                "restarts": self.restarts[name],
+                "uptime": round(time.time() - self.started_at[name], 1),
+                "socket": socket_path(self.socket_dir, name)
+            }
+            for name, process in self.processes.items()
+        }
+
+async def serve(args):
+    supervisor = WorkerSupervisor(args.workers, args.socket_dir)
+    supervisor.start()
+    gateway = create_gateway(supervisor.names, args.socket_dir, replicas=settings.CLUSTER_RING_REPLICAS, status=supervisor.status)
+    server = uvicorn.Server(uvicorn.Config(gateway, host=args.host, port=args.port))
+    watcher = asyncio.create_task(supervisor.watch())
+    try:
+        await server.serve()
+    finally:
+        watcher.cancel()
+        supervisor.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=settings.CLUSTER_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket-dir", default=settings.CLUSTER_SOCKET_DIR)
+    asyncio.run(serve(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
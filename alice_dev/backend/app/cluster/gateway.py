@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+import httpx
+import websockets
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+from .hashring import HashRing
+
+# /agent/<name>/... paths that are process-level endpoints, not user ids
+AGENT_PROCESS_ROUTES = {"llm", "lifecycle"}
+
+# Process-level endpoints whose answer differs per worker: sent to every worker and
+# returned as {"workers": {worker: response}} (/senses without user_id is a broadcast)
+PER_WORKER_PREFIXES = ("/health", "/usage", "/agent/llm", "/agent/lifecycle", "/senses")
+
+# Hop-by-hop headers (and headers httpx recomputes) are not forwarded
+SKIPPED_HEADERS = {"host", "connection", "keep-alive", "transfer-encoding", "upgrade", "content-length", "content-encoding"}
+
+def socket_path(socket_dir: str, worker: str) -> str:
+    return os.path.join(socket_dir, f"{worker}.sock")
+
+def route_key(path: str, query_string: str = "") -> Optional[str]:
+    """
+    The user_id a request belongs to, or None for process-level requests.
+      /ws/{user_id}
+      /agent/{user_id}/...
+      /memories/social_state/{user_id}
+      any path with a ?user_id= query parameter (e.g. /memories/actions)
+    """
+    parts = [p for p in path.split("/") if p]
+    if len(parts) >= 2 and parts[0] == "ws":
+        return parts[1]
+    if len(parts) >= 3 and parts[0] == "agent" and parts[1] not in AGENT_PROCESS_ROUTES:
+        return parts[1]
+    if len(parts) >= 3 and parts[0] == "memories" and parts[1] == "social_state":
+        return parts[2]
+    user_ids = parse_qs(query_string).get("user_id")
+    if user_ids:
+        return user_ids[0]
+    return None
+
+def is_per_worker(path: str) -> bool:
+    return any(path == prefix or path.startswith(prefix + "/") for prefix in PER_WORKER_PREFIXES)
+
+def merge_metrics(texts: Dict[str, str]) -> str:
+    """
+    Prometheus text of all workers in one exposition: every sample gets a worker label,
+    the samples of a metric family stay together under a single HELP/TYPE header.
+    """
+    families: Dict[str, Dict[str, List[str]]] = {}
+    for worker, text in texts.items():
+        family = ""
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith("#"):
+                parts = line.split(None, 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = parts[2]
+                    entry = families.setdefault(family, {"header": [], "samples": []})
+                    if line not in entry["header"]:
+                        entry["header"].append(line)
+                continue
+            name, brace, rest = line.partition("{")
+            if brace:
+                sample = f'{name}{{worker="{worker}",{rest}' if not rest.startswith("}") else f'{name}{{worker="{worker}"{rest}'
+            else:
+                name, _, value = line.partition(" ")
+                sample = f'{name}{{worker="{worker}"}} {value}'
+            families.setdefault(family, {"header": [], "samples": []})["samples"].append(sample)
+    lines = []
+    for entry in families.values():
+        lines.extend(entry["header"])
+        lines.extend(entry["samples"])
+    return "\n".join(lines) + "\n"
+
+def create_gateway(workers: List[str], socket_dir: str, replicas: int = 160, status=None) -> FastAPI:
+    """
+    Front app of the multi-process mode. Every agent lives in exactly one worker
+    (consistent hash of user_id); websocket and REST traffic of a user is forwarded
+    to that worker over its unix socket. Per-process endpoints (health, usage, metrics,
+    LLM scheduler, lifecycle) are asked of every worker and labeled per worker; other
+    process-level requests go to the first worker; /cluster/workers/{worker}/... reaches
+    a specific one. `status` is an optional callable returning per-worker process info.
+    """
+    app = FastAPI(title="Alice AI Gateway")
+    ring = HashRing(workers, replicas=replicas)
+    clients: Dict[str, httpx.AsyncClient] = {}
+
+    def client(worker: str) -> httpx.AsyncClient:
+        if worker not in clients:
+            transport = httpx.AsyncHTTPTransport(uds=socket_path(socket_dir, worker))
+            clients[worker] = httpx.AsyncClient(transport=transport, base_url="http://worker", timeout=None)
+        return clients[worker]
+
+    def owner(path: str, query_string: str = "") -> str:
+        key = route_key(path, query_string)
+        return ring.get_node(key) if key is not None else workers[0]
+
+    @app.on_event("shutdown")
+    async def close_clients():
+        for c in clients.values():
+            await c.aclose()
+
+    @app.get("/cluster")
+    async def cluster_status():
+        return {
+            "workers": status() if status else {w: {"socket": socket_path(socket_dir, w)} for w in workers},
+            "replicas": replicas
+        }
+
+    @app.get("/cluster/route/{user_id}")
+    async def cluster_route(user_id: str):
+        return {"user_id": user_id, "worker": ring.get_node(user_id)}
+
+    async def forward(worker: str, request: Request, path: str) -> Response:
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in SKIPPED_HEADERS}
+        url = path if not request.url.query else f"{path}?{request.url.query}"
+        try:
+            upstream = await client(worker).request(request.method, url, headers=headers, content=await request.body())
+        except httpx.TransportError as e:
+            return Response(content=f"Worker {worker} unavailable: {e}", status_code=503)
+        response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in SKIPPED_HEADERS}
+        return Response(content=upstream.content, status_code=upstream.status_code, headers=response_headers)
+
+    async def fan_out(request: Request, path: str) -> Response:
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in SKIPPED_HEADERS}
+        url = path if not request.url.query else f"{path}?{request.url.query}"
+        body = await request.body()
+
+        async def ask(worker: str):
+            try:
+                return await client(worker).request(request.method, url, headers=headers, content=body)
+            except httpx.TransportError as e:
+                return e
+
+        responses = dict(zip(workers, await asyncio.gather(*(ask(w) for w in workers))))
+        if path == "/metrics":
+            texts = {w: r.text for w, r in responses.items() if isinstance(r, httpx.Response) and r.status_code == 200}
+            return Response(content=merge_metrics(texts), media_type="text/plain; version=0.0.4; charset=utf-8")
+        results = {}
+        for worker, r in responses.items():
+            if not isinstance(r, httpx.Response):
+                results[worker] = {"error": f"Worker {worker} unavailable: {r}"}
+                continue
+            try:
+                results[worker] = r.json()
+            except ValueError:
+                results[worker] = {"status_code": r.status_code, "error": r.text}
+        return Response(content=json.dumps({"workers": results}), media_type="application/json")
+
+    @app.api_route("/cluster/workers/{worker}/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
+    async def proxy_to_worker(worker: str, path: str, request: Request):
+        if worker not in workers:
+            return Response(content=f"Unknown worker {worker}", status_code=404)
+        return await forward(worker, request, "/" + path)
+
+    @app.websocket("/ws/{user_id}")
+    async def proxy_websocket(websocket: WebSocket, user_id: str):
+        worker = ring.get_node(user_id)
+        try:
+            upstream = await websockets.unix_connect(socket_path(socket_dir, worker), f"ws://worker/ws/{user_id}", max_size=None)
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            print(f"Gateway: worker {worker} unavailable for {user_id}: {e}")
+            await websocket.close(code=1013)
+            return
+        await websocket.accept()
+
+        async def client_to_worker():
+            try:
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        break
+                    await upstream.send(message["text"] if message.get("text") is not None else message["bytes"])
+            except WebSocketDisconnect:
+                pass
+
+        async def worker_to_client():
+            async for message in upstream:
+                if isinstance(message, str):
+                    await websocket.send_text(message)
+                else:
+                    await websocket.send_bytes(message)
+
+        tasks = [asyncio.create_task(client_to_worker()), asyncio.create_task(worker_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+            try:
+                await websocket.close()
+            except RuntimeError:
+                # Already closed by the client
+                pass
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
+    async def proxy_http(path: str, request: Request):
+        path = "/" + path
+        if route_key(path, request.url.query) is None and (path == "/metrics" or is_per_worker(path)):
+            return await fan_out(request, path)
+        return await forward(owner(path, request.url.query), request, path)
+
+    return app
@@ -0,0 +1,43 @@
+import bisect
+import hashlib
+from typing import Dict, List
+
+class HashRing:
+    """
+    Consistent hash ring with virtual nodes.
+
+    Each node is placed `replicas` times on the ring, so keys spread evenly and
+    adding or removing a worker only moves the keys of that worker.
+    """
+    def __init__(self, nodes: List[str], replicas: int = 160):
+        self.replicas = replicas
+        self._ring: Dict[int, str] = {}
+        self._keys: List[int] = []
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def add_node(self, node: str):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            self._ring[h] = node
+            bisect.insort(self._keys, h)
+
+    def remove_node(self, node: str):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            if self._ring.pop(h, None) is not None:
+                self._keys.remove(h)
+
+    def get_node(self, key: str) -> str:
+        if not self._keys:
+            raise ValueError("HashRing has no nodes")
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._ring[self._keys[index]]
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._ring.values()))
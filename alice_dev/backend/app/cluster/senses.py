@@ -0,0 +1,45 @@
+from typing import Dict, List, Optional
+import httpx
+from memory.sense_bus import deliver_local
+from .hashring import HashRing
+from .gateway import socket_path
+
+class SenseForwarder:
+    """
+    Sense adapter sink of a worker in multi-process mode.
+
+    The external sense adapters run only in the first worker (one socket bind, one
+    reader of the spool directory). Each line is delivered locally when this worker
+    owns the user, else POSTed to /senses of the owning worker over its unix socket;
+    broadcasts (no user_id) go to every worker.
+    """
+    def __init__(self, worker_id: str, workers: List[str], socket_dir: str, replicas: int):
+        self.worker_id = worker_id
+        self.workers = workers
+        self.socket_dir = socket_dir
+        self.ring = HashRing(workers, replicas=replicas)
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _client(self, worker: str) -> httpx.AsyncClient:
+        if worker not in self._clients:
+            transport = httpx.AsyncHTTPTransport(uds=socket_path(self.socket_dir, worker))
+            self._clients[worker] = httpx.AsyncClient(transport=transport, base_url="http://worker", timeout=10)
+        return self._clients[worker]
+
+    async def __call__(self, user_id: Optional[str], sense: str, content: str):
+        targets = self.workers if user_id is None else [self.ring.get_node(user_id)]
+        for worker in targets:
+            if worker == self.worker_id:
+                await deliver_local(user_id, sense, content)
+                continue
+            params = {"user_id": user_id} if user_id is not None else {}
+            try:
+                response = await self._client(worker).post("/senses", params=params, json={"sense": sense, "content": content})
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                print(f"Sense data for {user_id or 'all agents'} not forwarded to {worker}: {e}")
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
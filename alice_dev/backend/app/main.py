@@ -1,9 +1,45 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from fastapi.middleware.cors import CORSMiddleware
 from .websockets import connection
-from .api import memories, agent
+from .api import memories, agent, usage, blobs, senses
+from .websockets.manager import manager
+from soul.tracing import setup_tracing, shutdown_tracing
+from soul.recorder import recorder
+from memory.sense_bus import start_sense_adapters, stop_sense_adapters
+from config.settings import settings
 
 app = FastAPI(title="Alice AI Backend")
+# Forwards adapter sense lines to the owning worker (multi-process mode, first worker only)
+sense_forwarder = None
+
+@app.on_event("startup")
+async def startup():
+    setup_tracing()
+    # Hibernates idle agents
+    manager.lifecycle.start()
+    # External sense producers (socket / spool directory), if configured.
+    # In multi-process mode only the first worker runs them and forwards by user.
+    global sense_forwarder
+    if not settings.WORKER_ID:
+        await start_sense_adapters()
+    elif settings.CLUSTER_WORKER_NAMES and settings.WORKER_ID == settings.CLUSTER_WORKER_NAMES[0]:
+        from .cluster.senses import SenseForwarder
+        sense_forwarder = SenseForwarder(settings.WORKER_ID, settings.CLUSTER_WORKER_NAMES,
+                                         settings.CLUSTER_SOCKET_DIR, settings.CLUSTER_RING_REPLICAS)
+        await start_sense_adapters(sense_forwarder)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await manager.lifecycle.stop()
+    await stop_sense_adapters()
+    if sense_forwarder:
+        await sense_forwarder.close()
+    # State ops are written after STATE_FLUSH_DELAY; flush them before the process exits
+    await manager.close_all()
+    # Recorder lines still queued (LLM call logs, prompt blocks)
+    await recorder.flush()
+    shutdown_tracing()
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,7 +52,15 @@ app.add_middleware(
 app.include_router(connection.router)
 app.include_router(memories.router)
 app.include_router(agent.router)
+app.include_router(usage.router)
+app.include_router(blobs.router)
+app.include_router(senses.router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint (agent cycles, actions, LLM, Weaviate, websockets)."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
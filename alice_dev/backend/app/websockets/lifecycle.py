@@ -0,0 +1,100 @@
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Any, Optional, Set
+from config.settings import settings
+from prometheus_client import Gauge, Histogram
+
+AGENTS_LIVE = Gauge("alice_agents_live", "Agents loaded in memory")
+AGENTS_HIBERNATED = Gauge("alice_agents_hibernated", "Agents released from memory, state kept on disk")
+AGENT_REHYDRATE_SECONDS = Histogram("alice_agent_rehydrate_seconds", "Time to rebuild a hibernated agent")
+
+class AgentLifecycle:
+    """
+    Hibernates agents nobody uses and tracks their rehydration.
+
+    An agent is idle when it has no websocket subscriber and was not touched (connect,
+    disconnect, API access) for AGENT_HIBERNATE_AFTER seconds. A background sweep
+    every AGENT_SWEEP_INTERVAL seconds hands idle agents to `manager.hibernate`,
+    which stops them and releases their Weaviate client, LLM provider, actions and
+    graph. Persona and working memory stay on disk; the agent is rebuilt lazily the
+    next time somebody connects or an API call asks for it.
+    """
+    def __init__(self, manager):
+        self.manager = manager
+        self.last_active: Dict[str, float] = {}
+        self.hibernated: Set[str] = set()
+        self.rehydrate_times: deque = deque(maxlen=100)
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, user_id: str):
+        self.last_active[user_id] = time.monotonic()
+
+    def is_hibernated(self, user_id: str) -> bool:
+        return user_id in self.hibernated
+
+    def mark_hibernated(self, user_id: str):
+        self.hibernated.add(user_id)
+        self.last_active.pop(user_id, None)
+        self._update_gauges()
+
+    def mark_loaded(self, user_id: str, seconds: float):
+        """Called after an agent was built; `seconds` counts as a rehydration if it was hibernated."""
+        if user_id in self.hibernated:
+            self.hibernated.discard(user_id)
+            self.rehydrate_times.append(seconds)
+            AGENT_REHYDRATE_SECONDS.observe(seconds)
+            print(f"Rehydrated agent {user_id} in {seconds:.2f}s")
+        self.touch(user_id)
+        self._update_gauges()
+
+    def _update_gauges(self):
+        AGENTS_LIVE.set(len(self.manager.agents))
+        AGENTS_HIBERNATED.set(len(self.hibernated))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.AGENT_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Agent lifecycle sweep failed: {e}")
+
+    async def sweep(self):
+        now = time.monotonic()
+        for user_id in list(self.manager.agents):
+            if self.manager.subscriber_count(user_id):
+                self.touch(user_id)
+                continue
+            idle = now - self.last_active.get(user_id, now)
+            if idle >= settings.AGENT_HIBERNATE_AFTER:
+                print(f"Agent {user_id} idle for {idle:.0f}s, hibernating")
+                await self.manager.hibernate(user_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        times = list(self.rehydrate_times)
+        return {
+            "live": len(self.manager.agents),
+            "running": sum(1 for agent in self.manager.agents.values() if agent.is_running),
+            "hibernated": len(self.hibernated),
+            "hibernate_after": settings.AGENT_HIBERNATE_AFTER,
+            "rehydrations": len(times),
+            "rehydrate_seconds": {
+                "last": round(times[-1], 3) if times else None,
+                "avg": round(sum(times) / len(times), 3) if times else None,
+                "max": round(max(times), 3) if times else None
+            }
+        }
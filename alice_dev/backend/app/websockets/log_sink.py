@@ -0,0 +1,99 @@
+import asyncio
+import json
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, Awaitable
+from config.settings import settings
+from soul.logwriter import AsyncLogWriter
+
+# Log types that can be dropped first when the client falls behind
+LOW_PRIORITY_LOGS = {"cycle_start", "prompt_budget", "action"}
+
+def compact_log(log_data: Dict[str, Any], verbosity: str) -> Dict[str, Any]:
+    """
+    'compact' (default) drops the `_debug` block of thought logs (full system prompt,
+    raw response), which is most of their size; 'full' keeps everything.
+    """
+    if verbosity == "full":
+        return log_data
+    content = log_data.get("content")
+    if isinstance(content, dict) and "_debug" in content:
+        return {**log_data, "content": {k: v for k, v in content.items() if k != "_debug"}}
+    return log_data
+
+class AgentLogSink:
+    """
+    Per-agent log pipeline, used as the agent's log_callback.
+
+    Calling the sink never waits on disk or on the clients: the file copy goes through
+    an AsyncLogWriter, and events go through a bounded queue drained by a sender task
+    that hands them to `send` (the manager's fan-out to all subscribers). When the
+    queue is full, the oldest low-priority events are dropped first (then the oldest
+    of any type), and the clients get a `log_dropped` notice with the count.
+    """
+    def __init__(self, send: Callable[[Dict[str, Any]], Awaitable[None]], log_file: str):
+        self.send = send
+        self.file_writer = AsyncLogWriter(
+            log_file,
+            max_bytes=settings.AGENT_LOG_MAX_BYTES,
+            backups=settings.AGENT_LOG_BACKUPS
+        )
+        self.max_pending = settings.AGENT_LOG_QUEUE_SIZE
+        self._pending: deque = deque()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self._dropped_unreported = 0
+
+    async def __call__(self, log_data: Dict[str, Any]):
+        timestamp = datetime.now().isoformat()
+        self.file_writer.write(f"[{timestamp}] {json.dumps(compact_log(log_data, settings.AGENT_LOG_FILE_VERBOSITY), ensure_ascii=False, default=str)}")
+        self.enqueue(compact_log(log_data, settings.AGENT_LOG_VERBOSITY))
+
+    def enqueue(self, log_data: Dict[str, Any]):
+        if len(self._pending) >= self.max_pending:
+            self._drop_one()
+        self._pending.append(log_data)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._ready.set()
+
+    def _drop_one(self):
+        for i, pending in enumerate(self._pending):
+            if pending.get("type") in LOW_PRIORITY_LOGS:
+                del self._pending[i]
+                break
+        else:
+            self._pending.popleft()
+        self.dropped += 1
+        self._dropped_unreported += 1
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._pending:
+                if self._dropped_unreported:
+                    notice = {"type": "log_dropped", "content": self._dropped_unreported}
+                    self._dropped_unreported = 0
+                    await self._send(notice)
+                await self._send(self._pending.popleft())
+
+    async def _send(self, log_data: Dict[str, Any]):
+        try:
+            await self.send({
+                "type": "agent_log",
+                "log": log_data
+            })
+        except Exception as e:
+            print(f"Error sending log to clients: {e}")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.file_writer.close()
@@ -1,38 +1,337 @@
+import os
 import json
-from typing import Dict, Any
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Optional
 from fastapi import WebSocket
 from soul.agent import AliceAgent
+from .state_sync import StateSync
+from .log_sink import AgentLogSink
+from .lifecycle import AgentLifecycle
+from config.settings import settings
+from prometheus_client import Counter, Gauge
+
+WS_CONNECTIONS = Gauge("alice_ws_connections", "Open websocket connections")
+WS_SEND_QUEUE_DEPTH = Gauge("alice_ws_send_queue_depth", "Events queued for sending (all connections)")
+WS_EVENTS_COALESCED = Counter("alice_ws_events_coalesced_total", "Events merged into a pending event of the same type")
+WS_EVENTS_DROPPED = Counter("alice_ws_events_dropped_total", "Events dropped because a client's send queue was full")
+WS_SATURATED_DISCONNECTS = Counter("alice_ws_saturated_disconnects_total", "Clients disconnected for staying saturated")
+WS_BROADCAST_EVENTS = Counter("alice_ws_broadcast_events_total", "Events encoded once and fanned out to an agent's subscribers")
+
+# Dropped first when a queue is full
+DROPPABLE = {"agent_log"}
+# Never dropped: losing one leaves the client with wrong state or a garbled reply.
+# A client whose full queue holds only these is disconnected and resyncs on reconnect.
+UNDROPPABLE = {"state_snapshot", "state_patch", "agent_stream", "agent_response_start", "agent_response_end"}
+
+def encode_event(event: Dict[str, Any]) -> str:
+    # Same wire format as WebSocket.send_json
+    return json.dumps(event, separators=(",", ":"), ensure_ascii=False)
+
+class ConnectionWriter:
+    """
+    Outbound queue of one websocket, drained by its own writer task, so a slow
+    browser tab never stalls the agent loop that produces the events.
+
+    - A state_patch continuing a pending one (its base is the pending version) is
+      merged into it, so a slow client gets one patch with all ops, not a backlog.
+    - The queue is bounded (WS_SEND_QUEUE_SIZE); when full, the oldest droppable
+      event goes first, then the oldest event not in UNDROPPABLE. If every queued
+      event is undroppable the client is disconnected (it gets a snapshot on reconnect).
+    - A client whose queue stays full for WS_SATURATION_TIMEOUT seconds, or whose
+      single send takes longer than WS_SEND_TIMEOUT, is disconnected.
+    """
+    def __init__(self, websocket: WebSocket, user_id: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.max_size = settings.WS_SEND_QUEUE_SIZE
+        self._queue: deque = deque()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._saturated_since: Optional[float] = None
+        self.closed = False
+
+    def enqueue(self, event: Dict[str, Any], payload: Optional[str] = None):
+        """
+        `payload` is the already encoded event, shared by all subscribers of the agent.
+        Queued events are never mutated in place for the same reason; coalescing builds
+        a new event and drops the payload so it is re-encoded for this connection only.
+        """
+        if self.closed:
+            return
+        if self._coalesce(event):
+            return
+        if len(self._queue) >= self.max_size:
+            if not self._drop_one():
+                print(f"Client {self.user_id} queue full of state/stream events, disconnecting")
+                WS_SATURATED_DISCONNECTS.inc()
+                asyncio.create_task(self._disconnect())
+                return
+            if self._saturated_since is None:
+                self._saturated_since = time.monotonic()
+            elif time.monotonic() - self._saturated_since > settings.WS_SATURATION_TIMEOUT:
+                print(f"Client {self.user_id} saturated for {settings.WS_SATURATION_TIMEOUT}s, disconnecting")
+                WS_SATURATED_DISCONNECTS.inc()
+                asyncio.create_task(self._disconnect())
+                return
+        self._queue.append((event, payload))
+        WS_SEND_QUEUE_DEPTH.inc()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._ready.set()
+
+    def _coalesce(self, event: Dict[str, Any]) -> bool:
+        if event.get("type") != "state_patch":
+            return False
+        # Consecutive state patches still waiting to be sent become one patch
+        for i in range(len(self._queue) - 1, -1, -1):
+            pending = self._queue[i][0]
+            if pending.get("type") == "state_patch" and pending["version"] == event["base"]:
+                merged = {**pending, "ops": pending["ops"] + event["ops"], "version": event["version"]}
+                self._queue[i] = (merged, None)
+                WS_EVENTS_COALESCED.inc()
+                return True
+        return False
+
+    def _drop_one(self) -> bool:
+        """Drops the oldest droppable event, else the oldest one not in UNDROPPABLE. False if none."""
+        victim = next((i for i, (pending, _) in enumerate(self._queue) if pending.get("type") in DROPPABLE), None)
+        if victim is None:
+            victim = next((i for i, (pending, _) in enumerate(self._queue) if pending.get("type") not in UNDROPPABLE), None)
+        if victim is None:
+            return False
+        del self._queue[victim]
+        WS_SEND_QUEUE_DEPTH.dec()
+        WS_EVENTS_DROPPED.inc()
+        return True
+
+    async def _run(self):
+        while not self.closed:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queue and not self.closed:
+                event, payload = self._queue.popleft()
+                WS_SEND_QUEUE_DEPTH.dec()
+                if len(self._queue) < self.max_size // 2:
+                    self._saturated_since = None
+                try:
+                    if payload is None:
+                        payload = encode_event(event)
+                    await asyncio.wait_for(self.websocket.send_text(payload), settings.WS_SEND_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print(f"Send to {self.user_id} timed out, disconnecting")
+                    WS_SATURATED_DISCONNECTS.inc()
+                    await self._disconnect()
+                except Exception as e:
+                    print(f"Error sending {event.get('type')} to {self.user_id}: {e}")
+
+    async def _disconnect(self):
+        self.close()
+        try:
+            # 1013: try again later
+            await self.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        WS_SEND_QUEUE_DEPTH.dec(len(self._queue))
+        self._queue.clear()
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
 
 class ConnectionManager:
+    """
+    Agents and the websockets watching them.
+
+    One agent can have any number of subscribers (browser tabs, dashboards). Events
+    are encoded once and the same payload is queued on every subscriber's writer.
+    The agent is not tied to a socket: it keeps running while at least one
+    subscriber is connected, and is stopped AGENT_IDLE_GRACE seconds after the last
+    one leaves unless somebody reconnects in the meantime. Agents idle for longer are
+    hibernated and rebuilt on demand (see AgentLifecycle).
+    """
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+        # user_id -> {websocket: writer}
+        self.subscribers: Dict[str, Dict[WebSocket, ConnectionWriter]] = {}
         self.agents: Dict[str, AliceAgent] = {}
+        self.log_sinks: Dict[str, AgentLogSink] = {}
+        # Versioned agent_state/action_queue per user, sent as JSON-patch deltas
+        self.state_syncs: Dict[str, StateSync] = {}
+        # Pending delayed stops of agents without subscribers
+        self._idle_stops: Dict[str, asyncio.Task] = {}
+        # Set once an agent being hibernated has been closed (its state is on disk)
+        self._hibernating: Dict[str, asyncio.Event] = {}
+        self.lifecycle = AgentLifecycle(self)
 
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def connect(self, websocket: WebSocket, user_id: str) -> AliceAgent:
         await websocket.accept()
-        self.active_connections[user_id] = websocket
-        if user_id not in self.agents:
-            # Pass self as connection_manager
-            self.agents[user_id] = AliceAgent(user_id, connection_manager=self)
-            print(f"Initialized new agent for user {user_id}")
-        
-        # Send history to the newly connected user
-        agent = self.agents[user_id]
-        history = agent.working_memory.history
-        if history:
-            await self.send_event(user_id, {
-                "type": "history_update",
-                "history": history
-            })
-
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        # We might want to keep the agent alive for a bit, or persist state.
+        writer = ConnectionWriter(websocket, user_id)
+        self.subscribers.setdefault(user_id, {})[websocket] = writer
+        self._update_connection_gauge()
+
+        idle_stop = self._idle_stops.pop(user_id, None)
+        if idle_stop:
+            idle_stop.cancel()
+        agent = await self._get_or_create_agent(user_id)
+
+        # Full snapshot (state + history) for the new subscriber only; deltas follow
+        sync = self._state_sync(user_id)
+        current_state = agent.persona.get_state()
+        patch = sync.update_agent_state({
+            "emotions": current_state.get("emotions", {}),
+            "desires": current_state.get("desires", {}),
+            "goals": current_state.get("intent", {}),
+            "instant_memory": list(agent.working_memory.instant_memory_queue)
+        })
+        if patch:
+            # Subscribers already connected get the change as a patch instead of hitting a version gap
+            await self.send_event(user_id, patch, exclude=websocket)
+        history = list(agent.working_memory.history)
+        writer.enqueue(sync.snapshot(history))
+
+        await agent.start()
+        return agent
+
+    async def _get_or_create_agent(self, user_id: str) -> AliceAgent:
+        hibernating = self._hibernating.get(user_id)
+        if hibernating:
+            # Rebuild from disk only after the old agent has written its last ops
+            await hibernating.wait()
+        if user_id in self.agents:
+            self.lifecycle.touch(user_id)
+            return self.agents[user_id]
+        started = time.perf_counter()
+        # Pass self as connection_manager
+        agent = AliceAgent(user_id, connection_manager=self)
+
+        log_dir = settings.LOG_DIR_BACKEND
+        os.makedirs(log_dir, exist_ok=True)
+        log_file = os.path.join(log_dir, f"agent_{user_id}_{datetime.now().strftime('%Y%m%d')}.log")
+
+        async def send_log(event: Dict[str, Any]):
+            await self.send_event(user_id, event)
+
+        async def send_output(data: Dict[str, Any]):
+            if data["type"] == "response_start":
+                await self.send_event(user_id, {"type": "agent_response_start"})
+            elif data["type"] == "response_chunk":
+                await self.send_event(user_id, {"type": "agent_stream", "chunk": data["content"]})
+            elif data["type"] == "response_end":
+                await self.send_event(user_id, {"type": "agent_response_end"})
+
+        # Buffered file copy + bounded queue shared by all subscribers; never blocks the thinking loop
+        self.log_sinks[user_id] = AgentLogSink(send_log, log_file)
+        agent.set_output_callback(send_output)
+        agent.set_log_callback(self.log_sinks[user_id])
+        self.agents[user_id] = agent
+        self.lifecycle.mark_loaded(user_id, time.perf_counter() - started)
+        print(f"Initialized new agent for user {user_id}")
+        return agent
+
+    def _state_sync(self, user_id: str) -> StateSync:
+        if user_id not in self.state_syncs:
+            self.state_syncs[user_id] = StateSync()
+        return self.state_syncs[user_id]
+
+    def _update_connection_gauge(self):
+        WS_CONNECTIONS.set(sum(len(subs) for subs in self.subscribers.values()))
+
+    async def send_snapshot(self, user_id: str, websocket: WebSocket, include_history: bool = False):
+        """Sends the full synced state to one subscriber (e.g. when it asks for a resync)."""
+        writer = self.subscribers.get(user_id, {}).get(websocket)
+        if not writer:
+            return
+        history = None
+        if include_history and user_id in self.agents:
+            history = list(self.agents[user_id].working_memory.history)
+        writer.enqueue(self._state_sync(user_id).snapshot(history))
+
+    def disconnect(self, user_id: str, websocket: WebSocket):
+        subs = self.subscribers.get(user_id, {})
+        writer = subs.pop(websocket, None)
+        if writer:
+            writer.close()
+        self.lifecycle.touch(user_id)
+        if not subs:
+            self.subscribers.pop(user_id, None)
+            if user_id in self.agents and user_id not in self._idle_stops:
+                self._idle_stops[user_id] = asyncio.create_task(self._stop_when_idle(user_id))
+        self._update_connection_gauge()
+
+    def subscriber_count(self, user_id: str) -> int:
+        return len(self.subscribers.get(user_id, {}))
+
+    async def _stop_when_idle(self, user_id: str):
+        try:
+            await asyncio.sleep(settings.AGENT_IDLE_GRACE)
+        except asyncio.CancelledError:
+            # Somebody reconnected
+            return
+        self._idle_stops.pop(user_id, None)
+        if self.subscriber_count(user_id):
+            return
+        print(f"No subscribers for agent {user_id} for {settings.AGENT_IDLE_GRACE}s, stopping it")
+        agent = self.agents.get(user_id)
+        if agent:
+            await agent.stop()
+        sink = self.log_sinks.get(user_id)
+        if sink:
+            # Flushes the file copy; the sink restarts on the next log
+            await sink.close()
+
+    async def hibernate(self, user_id: str):
+        """Stops the agent and drops it from memory; persona and working memory stay on disk."""
+        if self.subscriber_count(user_id):
+            return
+        idle_stop = self._idle_stops.pop(user_id, None)
+        if idle_stop:
+            idle_stop.cancel()
+        agent = self.agents.get(user_id)
+        if not agent or user_id in self._hibernating:
+            return
+        done = self._hibernating[user_id] = asyncio.Event()
+        try:
+            # Pending ops reach disk before the agent can be rebuilt from it
+            agent.persona.flush()
+            agent.working_memory.flush()
+            self.agents.pop(user_id, None)
+            sink = self.log_sinks.pop(user_id, None)
+            # Rebuilt from the agent on the next connect
+            self.state_syncs.pop(user_id, None)
+            self.lifecycle.mark_hibernated(user_id)
+            # Stops the loop and flushes what the last cycle recorded
+            await agent.close()
+            if sink:
+                await sink.close()
+        finally:
+            self._hibernating.pop(user_id, None)
+            done.set()
+
+    async def close_all(self):
+        """Stops every agent and writes its pending persona / working memory ops (app shutdown)."""
+        for task in self._idle_stops.values():
+            task.cancel()
+        self._idle_stops.clear()
+        for hibernating in list(self._hibernating.values()):
+            await hibernating.wait()
+        for user_id in list(self.agents):
+            agent = self.agents.pop(user_id)
+            try:
+                await agent.close()
+            except Exception as e:
+                print(f"Error closing agent {user_id}: {e}")
+            sink = self.log_sinks.pop(user_id, None)
+            if sink:
+                await sink.close()
 
     async def send_personal_message(self, message: str, user_id: str):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_text(message)
+        for websocket in list(self.subscribers.get(user_id, {})):
+            await websocket.send_text(message)
 
     async def broadcast(self, message: Dict[str, Any]):
         # This method name is misleading if it's for a specific user, 
@@ -43,11 +342,30 @@ class ConnectionManager:
         # We should probably have a method send_to_user(user_id, data).
         pass
 
-    async def send_event(self, user_id: str, event_data: Dict[str, Any]):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_json(event_data)
+    async def send_event(self, user_id: str, event_data: Dict[str, Any], exclude: Optional[WebSocket] = None):
+        # Full agent_state / action_queue_update events become versioned deltas.
+        # The synced state is updated even while nobody is connected, so the
+        # snapshot on the next connect is current.
+        handled, patch = self._state_sync(user_id).translate(event_data)
+        if handled:
+            event_data = patch
+            if event_data is None:
+                return
+
+        # Encoded once, queued for every subscriber's writer task; returns immediately
+        subs = self.subscribers.get(user_id)
+        if not subs:
+            return
+        payload = encode_event(event_data)
+        for websocket, writer in list(subs.items()):
+            if websocket is not exclude:
+                writer.enqueue(event_data, payload)
+        WS_BROADCAST_EVENTS.inc()
 
-    def get_agent(self, user_id: str) -> AliceAgent:
-        return self.agents.get(user_id)
+    async def get_agent(self, user_id: str) -> Optional[AliceAgent]:
+        """Loaded agent of the user. A hibernated agent is rehydrated (its loop is not started)."""
+        if user_id in self.agents or user_id in self._hibernating or self.lifecycle.is_hibernated(user_id):
+            return await self._get_or_create_agent(user_id)
+        return None
 
 manager = ConnectionManager()
@@ -0,0 +1,104 @@
+import copy
+import json
+from typing import Dict, Any, List
+
+# Versioned state sync between an agent and its websocket clients.
+#
+# The synced state has two top-level keys:
+#   agent_state  - emotions, desires, goals (incl. thinking_pool), instant_memory
+#   action_queue - the current action queue with statuses
+# Clients get a `state_snapshot` on connect (or when they ask for a resync) and then
+# `state_patch` events with JSON-patch (RFC 6902 add/remove/replace) operations.
+# Every patch carries `base` (the version it applies to) and `version` (the result);
+# a client that sees base != its version requests a resync.
+
+def _escape(key: Any) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+def _size(value: Any) -> int:
+    return len(json.dumps(value, default=str))
+
+def _head_shift(old: List[Any], new: List[Any]) -> int:
+    """Number of entries dropped from the head of `old` when the rest is the start of `new`, else 0."""
+    if not old or not new or old[0] == new[0]:
+        return 0
+    for shift in range(1, len(old)):
+        kept = len(old) - shift
+        if kept <= len(new) and old[shift] == new[0] and old[shift:] == new[:kept]:
+            return shift
+    return 0
+
+def diff(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """JSON-patch operations turning `old` into `new`."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+            else:
+                ops.extend(diff(old[key], value, f"{path}/{_escape(key)}"))
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        # Window shift (entries dropped at the head, new ones appended): remove /0 per
+        # dropped entry instead of replacing every element with its successor
+        shift = _head_shift(old, new)
+        ops = [{"op": "remove", "path": f"{path}/0"} for _ in range(shift)]
+        old = old[shift:]
+        common = min(len(old), len(new))
+        for i in range(common):
+            ops.extend(diff(old[i], new[i], f"{path}/{i}"))
+        for i in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/-", "value": new[i]})
+        # Remove from the end so indexes stay valid
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        if len(ops) > 1 and _size(ops) > _size(new):
+            return [{"op": "replace", "path": path, "value": new}]
+        return ops
+    if old == new and type(old) == type(new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+class StateSync:
+    """Server-side copy of one agent's synced state and its version counter."""
+    def __init__(self):
+        self.version = 0
+        self.state: Dict[str, Any] = {"agent_state": {}, "action_queue": []}
+
+    def _update(self, key: str, value: Any) -> Dict[str, Any]:
+        new_value = copy.deepcopy(value)
+        ops = diff(self.state.get(key), new_value, f"/{key}")
+        if not ops:
+            return None
+        self.state[key] = new_value
+        self.version += 1
+        return {"type": "state_patch", "base": self.version - 1, "version": self.version, "ops": ops}
+
+    def update_agent_state(self, partial: Dict[str, Any]) -> Dict[str, Any]:
+        """Merges a (partial) agent_state update; returns the patch event or None if nothing changed."""
+        return self._update("agent_state", {**self.state["agent_state"], **partial})
+
+    def update_action_queue(self, action_queue: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return self._update("action_queue", action_queue)
+
+    def translate(self, event: Dict[str, Any]):
+        """
+        Turns a legacy full-state event (agent_state / action_queue_update) into a patch.
+        Returns (handled, patch_event_or_None); other events are not handled.
+        """
+        event_type = event.get("type")
+        if event_type == "agent_state" and isinstance(event.get("data"), dict):
+            return True, self.update_agent_state(event["data"])
+        if event_type == "action_queue_update" and isinstance(event.get("data"), list):
+            return True, self.update_action_queue(event["data"])
+        return False, None
+
+    def snapshot(self, history: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Copied: the event is serialized later by the connection writer
+        event = {"type": "state_snapshot", "version": self.version, "state": copy.deepcopy(self.state)}
+        if history is not None:
+            event["history"] = history
+        return event
@@ -0,0 +1,58 @@
+"""
+Agent creation benchmark: construction time and resident memory per AliceAgent.
+
+Run inside the backend container (needs Weaviate, like the app itself):
+    python benchmarks/agent_creation.py --agents 50
+or from alice_dev/ with PYTHONPATH=. for a local setup.
+
+The first agent pays for the process-wide shared pieces (compiled graph, stateless
+actions, parsed configs); the numbers after it are the marginal per-agent cost.
+"""
+import argparse
+import gc
+import resource
+import statistics
+import time
+from soul.agent import AliceAgent
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # Peak RSS (kB on Linux) where /proc is not available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=20, help="number of agents to create")
+    args = parser.parse_args()
+
+    agents = []
+    times = []
+    rss_deltas = []
+    for i in range(args.agents):
+        gc.collect()
+        rss_before = rss_kb()
+        started = time.perf_counter()
+        agents.append(AliceAgent(f"bench_{i}"))
+        times.append(time.perf_counter() - started)
+        rss_deltas.append(rss_kb() - rss_before)
+
+    print(f"\n{'':<16}{'time (ms)':>12}{'RSS (kB)':>12}")
+    print(f"{'first agent':<16}{times[0] * 1000:>12.1f}{rss_deltas[0]:>12}")
+    if len(times) > 1:
+        rest_t, rest_m = times[1:], rss_deltas[1:]
+        print(f"{'per agent avg':<16}{statistics.mean(rest_t) * 1000:>12.1f}{statistics.mean(rest_m):>12.0f}")
+        print(f"{'per agent p50':<16}{statistics.median(rest_t) * 1000:>12.1f}{statistics.median(rest_m):>12.0f}")
+        print(f"{'per agent max':<16}{max(rest_t) * 1000:>12.1f}{max(rest_m):>12}")
+    print(f"{'total RSS':<16}{'':>12}{rss_kb():>12}")
+
+    for agent in agents:
+        agent.memory_store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Working memory rendering micro-benchmark: cost of the prompt strings per cycle for
+large histories, incremental (current WorkingMemory) vs. a full re-render.
+
+Run inside the backend container:
+    python benchmarks/working_memory.py --history 200 1000 5000
+or from alice_dev/ with PYTHONPATH=. for a local setup.
+
+Entries are applied in memory only (no journal writes), so the numbers are the
+rendering cost alone. "cached" is a second call without changes (e.g. observe after
+_run_loop), "append+render" one new message followed by both renderings.
+"""
+import argparse
+import os
+import tempfile
+import timeit
+
+# Keep benchmark state out of /storage; size eviction off so only max_history applies
+os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="alice_bench_state_"))
+os.environ.setdefault("HISTORY_MAX_BYTES", str(1 << 40))
+
+from memory.working_memory import WorkingMemory
+
+def full_render(wm: WorkingMemory) -> str:
+    """The previous implementation: every call walks the whole history."""
+    lines = []
+    for msg in wm.history:
+        if msg.get("role") in ["user", "assistant", "system"]:
+            lines.append(f"{msg.get('name', msg['role'])}: {msg['content']}")
+    return "\n".join(lines)
+
+def make_entry(i: int):
+    if i % 3 == 2:
+        return {"role": "thought", "type": "thought", "content": f"thinking about message {i}", "actionData": {}}
+    role = "user" if i % 3 == 0 else "assistant"
+    return {"role": role, "content": f"message {i} " + "lorem ipsum dolor sit amet " * 4}
+
+def bench(size: int, number: int):
+    wm = WorkingMemory(user_id=f"bench_wm_{size}", max_history=size)
+    for i in range(size):
+        wm._apply({"op": "append", "item": make_entry(i)})
+    for i in range(10):
+        wm._apply({"op": "instant", "item": f"[sight] observation {i}"})
+    counter = iter(range(size, size + 10 ** 9))
+
+    def incremental_cycle():
+        wm._apply({"op": "append", "item": make_entry(next(counter))})
+        wm.get_context_string()
+        wm.get_instant_memory_string()
+
+    def full_cycle():
+        wm._apply({"op": "append", "item": make_entry(next(counter))})
+        full_render(wm)
+
+    def cached():
+        wm.get_context_string()
+        wm.get_instant_memory_string()
+
+    assert wm.get_context_string() == full_render(wm)
+    results = {
+        "append+render": min(timeit.repeat(incremental_cycle, number=number, repeat=5)) / number,
+        "append+full": min(timeit.repeat(full_cycle, number=number, repeat=5)) / number,
+        "cached": min(timeit.repeat(cached, number=number, repeat=5)) / number,
+        "full re-render": min(timeit.repeat(lambda: full_render(wm), number=number, repeat=5)) / number,
+    }
+    assert wm.get_context_string() == full_render(wm)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, nargs="+", default=[20, 200, 1000, 5000], help="history sizes (entries)")
+    parser.add_argument("--number", type=int, default=200, help="calls per timing")
+    args = parser.parse_args()
+
+    columns = ["append+render", "append+full", "cached", "full re-render"]
+    print(f"\n{'entries':<10}" + "".join(f"{c + ' (us)':>20}" for c in columns))
+    for size in args.history:
+        results = bench(size, args.number)
+        print(f"{size:<10}" + "".join(f"{results[c] * 1e6:>20.2f}" for c in columns))
+
+if __name__ == "__main__":
+    main()
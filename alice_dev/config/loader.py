@@ -0,0 +1,22 @@
+import os
+import json
+from typing import Dict, Any, Optional, Tuple
+
+# Parsed JSON configs shared by every agent in the process, keyed by path.
+# A file is parsed again only when its mtime changes. Callers must treat the
+# returned dict as read-only.
+_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+def load_json_config(full_path: str) -> Optional[Dict[str, Any]]:
+    """Returns the parsed config, or None if the file does not exist."""
+    try:
+        mtime = os.path.getmtime(full_path)
+    except OSError:
+        return None
+    cached = _cache.get(full_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(full_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    _cache[full_path] = (mtime, data)
+    return data
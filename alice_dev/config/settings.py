@@ -20,13 +20,25 @@ def _get_conf(key, default):
     """Helper to get config value with priority: Env Var > JSON Config > Default"""
     return os.getenv(key, _llm_config.get(key, default))
 
+def _per_worker(path):
+    """In multi-process mode each worker writes its own copy of a file: name.<worker>.ext"""
+    worker_id = os.getenv("ALICE_WORKER_ID", "")
+    if not worker_id:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.{worker_id}{ext}"
+
 
 class Settings:
     # =========================================================================
     # 1. Base Configuration
     # =========================================================================
     LOG_DIR = os.getenv("LOG_DIR", "/logs")
-    LOG_DIR_BACKEND = os.path.join(LOG_DIR, "backend")
+    # Multi-process mode (python -m app.cluster): set by the supervisor in each worker's
+    # environment, empty in single-process mode. Files a process writes (agent logs,
+    # recorder, traces, LLM cache) are namespaced by it so no two workers share a writer.
+    WORKER_ID = os.getenv("ALICE_WORKER_ID", "")
+    LOG_DIR_BACKEND = os.path.join(LOG_DIR, "backend", WORKER_ID) if WORKER_ID else os.path.join(LOG_DIR, "backend")
     
     # =========================================================================
     # 2. LLM Provider Configuration
@@ -98,6 +110,25 @@ class Settings:
     def PERCEPTION_API_KEY(self):
         return os.getenv("PERCEPTION_API_KEY", self.LLM_API_KEY)
 
+    @property
+    def EMBEDDING_MODEL(self):
+        # Same embedding model Weaviate uses, addressed through litellm
+        if self.VECTORIZER_PROVIDER == "openai":
+            return os.getenv("EMBEDDING_MODEL", f"openai/{self.OPENAI_EMBEDDING_MODEL}")
+        return os.getenv("EMBEDDING_MODEL", f"ollama/{self.OLLAMA_EMBEDDING_MODEL}")
+
+    @property
+    def EMBEDDING_API_BASE(self):
+        if self.VECTORIZER_PROVIDER == "openai":
+            return os.getenv("EMBEDDING_API_BASE", self.OPENAI_BASE_URL)
+        return os.getenv("EMBEDDING_API_BASE", self.OLLAMA_BASE_URL)
+
+    @property
+    def EMBEDDING_API_KEY(self):
+        if self.VECTORIZER_PROVIDER == "openai":
+            return os.getenv("EMBEDDING_API_KEY", self.OPENAI_API_KEY)
+        return os.getenv("EMBEDDING_API_KEY", self.OLLAMA_API_KEY)
+
     # =========================================================================
     # 4. Model Parameters
     # =========================================================================
@@ -117,6 +148,91 @@ class Settings:
         "seed": int(os.getenv("PERCEPTION_SEED", "42")) if os.getenv("PERCEPTION_SEED") else None,
     }
     
+    # Per-section token limits for prompt assembly (see soul/budget.py).
+    # Override with a JSON object, e.g. PROMPT_BUDGET='{"memories": 2000}'
+    PROMPT_BUDGET = {
+        "memories": 1500,
+        "perception_queue": 1500,
+        "thinking_pool": 2000,
+        "goals": 300,
+        "social_state": 300,
+        "senses": 2000,
+        **json.loads(os.getenv("PROMPT_BUDGET", "{}"))
+    }
+    # Structured output for think/perception: 'auto' (JSON schema where the model
+    # supports it, else JSON mode), 'json_schema', 'json_object' or 'off'
+    STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "auto").lower()
+
+    # Stream the think completion and dispatch each action_queue entry as soon as it is complete
+    THINK_STREAMING = os.getenv("THINK_STREAMING", "false").lower() == "true"
+
+    # Thinking pool chains longer than this are shown as first step + latest steps
+    THINK_CHAIN_MAX_STEPS = int(os.getenv("THINK_CHAIN_MAX_STEPS", "6"))
+
+    # Response cache for LLM calls that opt in (see soul/llm/cache.py).
+    # Perception uses it so repeated senses text in idle loops / replays skips the model.
+    LLM_CACHE_PATH = _per_worker(os.getenv("LLM_CACHE_PATH", "/storage/llm_cache.sqlite"))
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+    LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+    PERCEPTION_CACHE = os.getenv("PERCEPTION_CACHE", "true").lower() == "true"
+
+    # Process-wide LLM scheduler (soul/llm/provider.py): max concurrent requests per
+    # endpoint (API base URL). Per-endpoint overrides as JSON, e.g.
+    # LLM_ENDPOINT_CONCURRENCY='{"http://ollama:11434": 1}'
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    LLM_ENDPOINT_CONCURRENCY = {
+        k.rstrip("/"): int(v) for k, v in json.loads(os.getenv("LLM_ENDPOINT_CONCURRENCY", "{}")).items()
+    }
+    # Identical completion requests in flight at the same time share one call
+    LLM_COALESCE_REQUESTS = os.getenv("LLM_COALESCE_REQUESTS", "true").lower() == "true"
+
+    # Timeout / retry policy (seconds). Timeouts apply per attempt (per chunk when streaming).
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+    PERCEPTION_TIMEOUT = float(os.getenv("PERCEPTION_TIMEOUT", "45"))
+    THINK_TIMEOUT = float(os.getenv("THINK_TIMEOUT", "120"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+    LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8.0"))
+    # Append the local Ollama models as the last fallback when using an OpenAI-compatible provider
+    LLM_FALLBACK_OLLAMA = os.getenv("LLM_FALLBACK_OLLAMA", "false").lower() == "true"
+
+    # Usage accounting (soul/llm/usage.py): rolling window kept for /usage summaries.
+    # LLM_PRICING overrides/extends litellm's price table (USD per 1k tokens), e.g.
+    # LLM_PRICING='{"deepseek-chat": [0.00027, 0.0011], "ollama/qwen3:14b": [0, 0]}'
+    USAGE_RETENTION = float(os.getenv("USAGE_RETENTION", "3600"))
+    USAGE_MAX_RECORDS = int(os.getenv("USAGE_MAX_RECORDS", "20000"))
+    LLM_PRICING = json.loads(os.getenv("LLM_PRICING", "{}"))
+
+    # Delay before retrying a failed cycle; only the failed stage is re-run (up to AGENT_MAX_STAGE_RESUMES times)
+    AGENT_RETRY_DELAY = float(os.getenv("AGENT_RETRY_DELAY", "2.0"))
+    AGENT_MAX_STAGE_RESUMES = int(os.getenv("AGENT_MAX_STAGE_RESUMES", "2"))
+
+    @property
+    def THINK_FALLBACKS(self):
+        """
+        Fallback chain for think: reasoning model -> chat model -> local Ollama (if enabled).
+        Override with a JSON list, e.g. THINK_FALLBACKS='[{"model": "deepseek-chat"}]'
+        """
+        if os.getenv("THINK_FALLBACKS"):
+            return json.loads(os.getenv("THINK_FALLBACKS"))
+        chain = []
+        if self.THINKING_MODEL != self.LLM_MODEL:
+            chain.append({"model": self.LLM_MODEL, "api_base": self.LLM_API_BASE, "api_key": self.LLM_API_KEY})
+        if self.LLM_FALLBACK_OLLAMA and self.LLM_PROVIDER == "openai":
+            chain.append({"model": self.OLLAMA_MODEL_MAIN, "api_base": self.OLLAMA_BASE_URL, "api_key": self.OLLAMA_API_KEY})
+        return chain
+
+    @property
+    def PERCEPTION_FALLBACKS(self):
+        """Fallback chain for perception (JSON override: PERCEPTION_FALLBACKS)."""
+        if os.getenv("PERCEPTION_FALLBACKS"):
+            return json.loads(os.getenv("PERCEPTION_FALLBACKS"))
+        chain = []
+        if self.LLM_FALLBACK_OLLAMA and self.LLM_PROVIDER == "openai":
+            chain.append({"model": self.OLLAMA_MODEL_PERCEPTION, "api_base": self.OLLAMA_BASE_URL, "api_key": self.OLLAMA_API_KEY})
+        return chain
+
     # =========================================================================
     # 5. System Settings
     # =========================================================================
@@ -131,6 +247,17 @@ class Settings:
     THINKING_INTERVAL = float(os.getenv("THINKING_INTERVAL", "0.1"))
     CONTINUOUS_THINKING = os.getenv("CONTINUOUS_THINKING", "false").lower() == "true"
 
+    # Action retrieval: only the top-k relevant actions (plus the pinned core set)
+    # are listed in the think prompt, so it stays flat as learned skills grow.
+    ACTION_RETRIEVAL_ENABLED = os.getenv("ACTION_RETRIEVAL_ENABLED", "true").lower() == "true"
+    ACTION_RETRIEVAL_TOP_K = int(os.getenv("ACTION_RETRIEVAL_TOP_K", "10"))
+    ACTION_RETRIEVAL_PINNED = [
+        name.strip() for name in os.getenv(
+            "ACTION_RETRIEVAL_PINNED",
+            "speak,express,daze,think_add,think_update,think_complete,recall,associate,memorize,add_belief"
+        ).split(",") if name.strip()
+    ]
+
     # =========================================================================
     # 6. Vector Database Settings
     # =========================================================================
@@ -144,4 +271,69 @@ class Settings:
     # =========================================================================
     ENABLE_LLM_LOGS = os.getenv("ENABLE_LLM_LOGS", "false").lower() == "true"
 
+    # LLM call recorder (soul/recorder.py): rotation and prompt block dedup
+    RECORDER_MAX_BYTES = int(os.getenv("RECORDER_MAX_BYTES", str(50 * 1024 * 1024)))
+    RECORDER_MAX_AGE = float(os.getenv("RECORDER_MAX_AGE", "86400"))
+    RECORDER_BACKUPS = int(os.getenv("RECORDER_BACKUPS", "10"))
+    RECORDER_QUEUE_SIZE = int(os.getenv("RECORDER_QUEUE_SIZE", "1000"))
+    RECORDER_DEDUP_PROMPTS = os.getenv("RECORDER_DEDUP_PROMPTS", "true").lower() == "true"
+    RECORDER_DEDUP_MIN_CHARS = int(os.getenv("RECORDER_DEDUP_MIN_CHARS", "200"))
+    # Paragraph hashes remembered for dedup (LRU)
+    RECORDER_DEDUP_CACHE = int(os.getenv("RECORDER_DEDUP_CACHE", "2000"))
+
+    # Per-agent log stream (backend/app/websockets/log_sink.py).
+    # Verbosity 'compact' strips the thought `_debug` block (system prompt, raw output); 'full' keeps it.
+    AGENT_LOG_VERBOSITY = os.getenv("AGENT_LOG_VERBOSITY", "compact").lower()
+    AGENT_LOG_FILE_VERBOSITY = os.getenv("AGENT_LOG_FILE_VERBOSITY", "compact").lower()
+    AGENT_LOG_QUEUE_SIZE = int(os.getenv("AGENT_LOG_QUEUE_SIZE", "200"))
+    AGENT_LOG_MAX_BYTES = int(os.getenv("AGENT_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+    AGENT_LOG_BACKUPS = int(os.getenv("AGENT_LOG_BACKUPS", "5"))
+
+    # Per-connection websocket send queue (backend/app/websockets/manager.py)
+    WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+    WS_SATURATION_TIMEOUT = float(os.getenv("WS_SATURATION_TIMEOUT", "30"))
+    # Seconds an agent keeps running after its last websocket subscriber disconnected
+    AGENT_IDLE_GRACE = float(os.getenv("AGENT_IDLE_GRACE", "60"))
+    # Agents without subscribers for this long are hibernated (state on disk, rebuilt on demand)
+    AGENT_HIBERNATE_AFTER = float(os.getenv("AGENT_HIBERNATE_AFTER", "900"))
+    AGENT_SWEEP_INTERVAL = float(os.getenv("AGENT_SWEEP_INTERVAL", "60"))
+
+    # Per-user agent state (memory/state_store.py): snapshot + journal under STATE_DIR/<user_id>/
+    STATE_DIR = os.getenv("STATE_DIR", "/storage/state")
+    STATE_FLUSH_DELAY = float(os.getenv("STATE_FLUSH_DELAY", "1.0"))
+    STATE_COMPACT_EVERY = int(os.getenv("STATE_COMPACT_EVERY", "200"))
+    # Working memory history: size budget and offloading of large event payloads to the blob store
+    HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", str(256 * 1024)))
+    HISTORY_BLOB_MIN_CHARS = int(os.getenv("HISTORY_BLOB_MIN_CHARS", "2048"))
+    HISTORY_PREVIEW_CHARS = int(os.getenv("HISTORY_PREVIEW_CHARS", "300"))
+    BLOB_DIR = os.getenv("BLOB_DIR", "/storage/blobs")
+    BLOB_MAX_BYTES = int(os.getenv("BLOB_MAX_BYTES", str(512 * 1024 * 1024)))
+    # 'files' (snapshot + journal per user) or 'sqlite' (one WAL database)
+    STATE_BACKEND = os.getenv("STATE_BACKEND", "files").lower()
+    STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", "/storage/state.sqlite")
+    STATE_SQLITE_HISTORY_KEEP = int(os.getenv("STATE_SQLITE_HISTORY_KEEP", "1000"))
+
+    # Sense bus (memory/sense_bus.py): per-agent in-memory sense queues.
+    # External producers can feed it through a socket ('/path.sock' or 'host:port')
+    # and/or a polled spool directory (<dir>/<user_id>/<sense>.txt); both off by default.
+    SENSE_QUEUE_SIZE = int(os.getenv("SENSE_QUEUE_SIZE", "200"))
+    SENSE_SOCKET = os.getenv("SENSE_SOCKET", "")
+    SENSE_FILE_DIR = os.getenv("SENSE_FILE_DIR", "")
+    SENSE_FILE_POLL = float(os.getenv("SENSE_FILE_POLL", "1.0"))
+
+    # Multi-process mode (python -m app.cluster): workers on unix sockets behind a gateway
+    CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", "4"))
+    CLUSTER_SOCKET_DIR = os.getenv("CLUSTER_SOCKET_DIR", "/tmp/alice-workers")
+    CLUSTER_RING_REPLICAS = int(os.getenv("CLUSTER_RING_REPLICAS", "160"))
+    CLUSTER_WATCH_INTERVAL = float(os.getenv("CLUSTER_WATCH_INTERVAL", "2"))
+    # Set by the supervisor in each worker's environment (see WORKER_ID)
+    CLUSTER_WORKER_NAMES = [w for w in os.getenv("ALICE_WORKERS", "").split(",") if w]
+
+    # OpenTelemetry tracing (soul/tracing.py): 'none', 'file', 'otlp' or 'console'
+    TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+    TRACE_FILE = _per_worker(os.getenv("TRACE_FILE", os.path.join(LOG_DIR, "traces", "spans.jsonl")))
+    OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+    TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "alice-backend")
+
 settings = Settings()
@@ -322,11 +322,16 @@ export const ChatWindow: React.FC<ChatWindowProps> = ({ messages, onSendMessage,
                                     {actionData.data.images && actionData.data.images.length > 0 && (
                                         <div className="pt-2 space-y-2">
                                             <div className="text-gray-500 text-[10px] mb-1 select-none">Generated Plots:</div>
-                                            {actionData.data.images.map((img: string, i: number) => (
-                                                <div key={i} className="bg-white rounded p-1">
-                                                    <img src={`data:image/png;base64,${img}`} alt={`Plot ${i+1}`} className="w-full rounded" />
-                                                </div>
-                                            ))}
+                                            {actionData.data.images.map((img: string, i: number) => {
+                                                // History entries reference large images in the blob store instead of inlining them
+                                                const blob = actionData.$blobs?.[`data.images.${i}`];
+                                                const src = blob ? `http://localhost:8000${blob.url}` : `data:image/png;base64,${img}`;
+                                                return (
+                                                    <div key={i} className="bg-white rounded p-1">
+                                                        <img src={src} alt={`Plot ${i+1}`} className="w-full rounded" />
+                                                    </div>
+                                                );
+                                            })}
                                         </div>
                                     )}
                                     
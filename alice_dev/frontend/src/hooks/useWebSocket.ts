@@ -23,6 +23,48 @@ export type VisualState = {
   face: string;
 };
 
+// Synced state kept in step with the backend via state_snapshot / state_patch events
+type SyncedState = {
+  agent_state: any;
+  action_queue: any[];
+};
+
+// Applies the JSON-patch (RFC 6902) subset the backend emits: add, remove, replace
+const applyPatch = (doc: any, ops: any[]) => {
+  for (const op of ops) {
+    const keys = op.path.split('/').slice(1).map((k: string) => k.replace(/~1/g, '/').replace(/~0/g, '~'));
+    const last = keys.pop();
+    let parent = doc;
+    for (const key of keys) {
+      parent = Array.isArray(parent) ? parent[Number(key)] : parent[key];
+    }
+    if (Array.isArray(parent)) {
+      const index = last === '-' ? parent.length : Number(last);
+      if (op.op === 'add') parent.splice(index, 0, op.value);
+      else if (op.op === 'remove') parent.splice(index, 1);
+      else parent[index] = op.value;
+    } else if (op.op === 'remove') {
+      delete parent[last];
+    } else {
+      parent[last] = op.value;
+    }
+  }
+};
+
+const historyToMessages = (history: any[]): Message[] => history.map((msg: any) => {
+    if (!msg) return { role: 'user', content: '' }; // Safe fallback
+    let role = msg.role || msg.type || 'user';
+    // Fix for legacy history where speak actions were stored as 'action' role
+    if (role === 'action' && msg.actionData?.event === 'speak') {
+        role = 'assistant';
+    }
+    return {
+        role: role,
+        content: msg.content || '',
+        actionData: msg.actionData
+    };
+});
+
 export const useWebSocket = (url: string) => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [agentState, setAgentState] = useState<AgentState | null>(null);
@@ -32,8 +74,13 @@ export const useWebSocket = (url: string) => {
   const [isConnected, setIsConnected] = useState(false);
   const ws = useRef<WebSocket | null>(null);
   const currentResponseRef = useRef<string>("");
+  const syncedStateRef = useRef<SyncedState>({ agent_state: {}, action_queue: [] });
+  const stateVersionRef = useRef<number>(-1);
+  // Set while a requested snapshot is on its way; patches received meanwhile are skipped
+  const resyncPendingRef = useRef<boolean>(false);
 
   useEffect(() => {
+    resyncPendingRef.current = false;
     ws.current = new WebSocket(url);
 
     ws.current.onopen = () => {
@@ -51,24 +98,40 @@ export const useWebSocket = (url: string) => {
         const data = JSON.parse(event.data);
         if (!data) return;
         
-        if (data.type === 'action_queue_update') {
+        if (data.type === 'state_snapshot') {
+            // Full state (on connect / resync); deltas are applied on top of this version
+            const state: SyncedState = data.state || { agent_state: {}, action_queue: [] };
+            syncedStateRef.current = state;
+            stateVersionRef.current = data.version;
+            resyncPendingRef.current = false;
+            setAgentState(state.agent_state);
+            setActionQueue(Array.isArray(state.action_queue) ? state.action_queue : []);
+            if (Array.isArray(data.history)) {
+                setMessages(historyToMessages(data.history));
+            }
+        } else if (data.type === 'state_patch') {
+            if (resyncPendingRef.current) {
+                return;
+            }
+            if (data.base !== stateVersionRef.current) {
+                // Missed a delta: ask for a fresh snapshot and ignore patches until it arrives
+                stateVersionRef.current = -1;
+                resyncPendingRef.current = true;
+                ws.current?.send(JSON.stringify({ type: 'resync' }));
+                return;
+            }
+            const next: SyncedState = structuredClone(syncedStateRef.current);
+            applyPatch(next, data.ops);
+            syncedStateRef.current = next;
+            stateVersionRef.current = data.version;
+            setAgentState(next.agent_state);
+            setActionQueue(Array.isArray(next.action_queue) ? next.action_queue : []);
+        } else if (data.type === 'action_queue_update') {
             setActionQueue(Array.isArray(data.data) ? data.data : []);
         } else if (data.type === 'history_update') {
             // Map history items to Message format
             const history = Array.isArray(data.history) ? data.history : [];
-            setMessages(history.map((msg: any) => {
-                if (!msg) return { role: 'user', content: '' }; // Safe fallback
-                let role = msg.role || msg.type || 'user';
-                // Fix for legacy history where speak actions were stored as 'action' role
-                if (role === 'action' && msg.actionData?.event === 'speak') {
-                    role = 'assistant';
-                }
-                return {
-                    role: role,
-                    content: msg.content || '',
-                    actionData: msg.actionData
-                };
-            }));
+            setMessages(historyToMessages(history));
         } else if (data.type === 'agent_state') {
             setAgentState((prev) => {
                 if (!prev) return data.data;
@@ -0,0 +1,107 @@
+import os
+import asyncio
+import base64
+import hashlib
+from typing import Dict, Any, Optional, Tuple
+from config.settings import settings
+
+# Stored type -> (file extension, media type)
+BLOB_TYPES = {
+    "text": (".txt", "text/plain; charset=utf-8"),
+    "png": (".png", "image/png")
+}
+
+class BlobStore:
+    """
+    Content-addressed store for large payloads moved out of working memory history.
+
+    A blob is written once to <dir>/<hash[:2]>/<hash><ext> (sha256 of the bytes);
+    identical payloads share the file. History keeps only the returned reference.
+    When the store grows past BLOB_MAX_BYTES the least recently stored blobs are
+    removed (checked every 100 writes, in a worker thread); storing an existing blob
+    again refreshes its mtime. References to removed blobs resolve to 404 and only
+    the preview kept in history remains.
+    """
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or settings.BLOB_DIR
+        self.max_bytes = settings.BLOB_MAX_BYTES if max_bytes is None else max_bytes
+        self._writes = 0
+        self._prune_task: Optional[asyncio.Task] = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name[:2], name)
+
+    def put(self, data: bytes, kind: str = "text") -> Dict[str, Any]:
+        digest = hashlib.sha256(data).hexdigest()
+        name = digest + BLOB_TYPES[kind][0]
+        path = self._path(name)
+        try:
+            # Dedup hit: mark as recently used so prune keeps it
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._writes += 1
+            if self.max_bytes and self._writes % 100 == 0:
+                self._schedule_prune()
+        return {"hash": digest, "size": len(data), "type": kind, "url": f"/blobs/{name}"}
+
+    def put_text(self, text: str) -> Dict[str, Any]:
+        return self.put(text.encode("utf-8"), "text")
+
+    def put_base64_image(self, encoded: str) -> Dict[str, Any]:
+        """Stores a base64 PNG (e.g. RunPython plots) decoded, so it can be served as an image."""
+        return self.put(base64.b64decode(encoded), "png")
+
+    def resolve(self, name: str) -> Optional[Tuple[str, str]]:
+        """(path, media type) of a blob file name like '<hash>.png', or None."""
+        digest, ext = os.path.splitext(name)
+        media_type = next((m for e, m in BLOB_TYPES.values() if e == ext), None)
+        if media_type is None or len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            return None
+        path = self._path(name)
+        return (path, media_type) if os.path.exists(path) else None
+
+    def _schedule_prune(self):
+        """Runs prune in a worker thread (put is called from the agent loop); inline without a loop."""
+        if self._prune_task is not None and not self._prune_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.prune()
+            return
+        self._prune_task = loop.create_task(self._prune_in_thread())
+
+    async def _prune_in_thread(self):
+        try:
+            await asyncio.to_thread(self.prune)
+        except Exception as e:
+            print(f"BlobStore prune error: {e}")
+
+    def prune(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for n in names:
+                p = os.path.join(root, n)
+                try:
+                    stat = os.stat(p)
+                except OSError:
+                    # Removed or replaced by a concurrent put
+                    continue
+                files.append((stat.st_mtime, stat.st_size, p))
+        total = sum(size for _, size, _ in files)
+        for _, size, p in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(p)
+                total -= size
+            except OSError:
+                pass
+
+# Global instance
+blob_store = BlobStore()
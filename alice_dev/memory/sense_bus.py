@@ -0,0 +1,207 @@
+import os
+import json
+import asyncio
+from typing import Dict, List, Optional, Callable, Awaitable
+from config.settings import settings
+
+SENSES = ["sight", "hearing", "smell", "taste", "touch", "mind"]
+
+class SenseBus:
+    """
+    In-process sense buffers of one agent: one bounded asyncio queue per sense.
+
+    Producers (user input, action feedback, perception actions, external adapters)
+    `put` lines; the observe node `drain`s everything once per cycle. No disk I/O.
+    When a sense queue is full its oldest line is dropped. `wait()` returns as soon
+    as anything is buffered, so the agent loop can wake on new senses instead of polling.
+    """
+    def __init__(self, user_id: str, max_lines: Optional[int] = None):
+        self.user_id = user_id
+        self.max_lines = max_lines or settings.SENSE_QUEUE_SIZE
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.dropped = 0
+        self._available = asyncio.Event()
+
+    def put(self, sense: str, content: str):
+        queue = self.queues.get(sense)
+        if queue is None:
+            queue = self.queues[sense] = asyncio.Queue(maxsize=self.max_lines)
+        for line in content.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(line)
+            self._available.set()
+
+    def drain(self) -> Dict[str, List[str]]:
+        """Returns and removes all buffered lines, grouped by sense (oldest first)."""
+        senses_data = {}
+        for sense, queue in self.queues.items():
+            lines = []
+            while not queue.empty():
+                lines.append(queue.get_nowait())
+            if lines:
+                senses_data[sense] = lines
+        self._available.clear()
+        return senses_data
+
+    async def wait(self):
+        """Returns once at least one sense line is buffered."""
+        await self._available.wait()
+
+    def pending(self) -> int:
+        return sum(queue.qsize() for queue in self.queues.values())
+
+# Buses of all agents in this process, so adapters can route by user_id
+buses: Dict[str, SenseBus] = {}
+
+def get_sense_bus(user_id: str) -> SenseBus:
+    if user_id not in buses:
+        buses[user_id] = SenseBus(user_id)
+    return buses[user_id]
+
+def deliver(user_id: Optional[str], sense: str, content: str) -> bool:
+    """
+    Routes external sense data to one agent, or to every agent when user_id is None.
+    Lines for a user whose agent was never loaded in this process are dropped (False).
+    """
+    if user_id is None:
+        for bus in list(buses.values()):
+            bus.put(sense, content)
+        return True
+    bus = buses.get(user_id)
+    if bus is None:
+        return False
+    bus.put(sense, content)
+    return True
+
+# --- Adapters for producers outside the process ---
+
+# Where adapters hand their lines: (user_id or None, sense, content)
+SenseSink = Callable[[Optional[str], str, str], Awaitable[None]]
+
+async def deliver_local(user_id: Optional[str], sense: str, content: str):
+    if not deliver(user_id, sense, content):
+        print(f"Sense data for {user_id} dropped: no agent loaded for this user")
+
+class SocketSenseAdapter:
+    """
+    Accepts JSON lines {"user_id": "...", "sense": "sight", "content": "..."} on a
+    unix socket path or a host:port (SENSE_SOCKET). Without user_id the line goes to
+    every agent.
+    """
+    def __init__(self, address: str, sink: SenseSink = deliver_local):
+        self.address = address
+        self.sink = sink
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if ":" in self.address and not self.address.startswith("/"):
+            host, port = self.address.rsplit(":", 1)
+            self.server = await asyncio.start_server(self._handle, host, int(port))
+        else:
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self.server = await asyncio.start_unix_server(self._handle, self.address)
+        print(f"Sense socket listening on {self.address}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                try:
+                    event = json.loads(line)
+                    await self.sink(event.get("user_id"), event["sense"], str(event["content"]))
+                except (json.JSONDecodeError, KeyError, TypeError) as e:
+                    print(f"Sense socket: invalid event {line[:200]!r}: {e}")
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+class FileSenseAdapter:
+    """
+    Polls a spool directory for producers that can only write files:
+      <dir>/<user_id>/<sense>.txt  -> that agent
+      <dir>/<sense>.txt            -> every agent
+    A file is renamed before it is read, so lines appended meanwhile land in a new file.
+    """
+    def __init__(self, directory: str, interval: float, sink: SenseSink = deliver_local):
+        self.directory = directory
+        self.interval = interval
+        self.sink = sink
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+        print(f"Sense file spool: {self.directory}")
+
+    async def _run(self):
+        while True:
+            try:
+                for user_id, sense, content in await asyncio.to_thread(self._collect):
+                    await self.sink(user_id, sense, content)
+            except Exception as e:
+                print(f"Sense file spool error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _collect(self):
+        collected = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                for sub in os.scandir(entry.path):
+                    collected.extend(self._take(sub, entry.name))
+            else:
+                collected.extend(self._take(entry, None))
+        return collected
+
+    def _take(self, entry: os.DirEntry, user_id: Optional[str]):
+        if not entry.name.endswith(".txt") or entry.stat().st_size == 0:
+            return []
+        processing = entry.path + ".processing"
+        try:
+            os.replace(entry.path, processing)
+            with open(processing, "r", encoding="utf-8") as f:
+                content = f.read()
+            os.remove(processing)
+        except FileNotFoundError:
+            # Taken by another reader meanwhile; the rest of the pass goes on
+            return []
+        return [(user_id, entry.name[:-len(".txt")], content)]
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+_adapters = []
+
+async def start_sense_adapters(sink: SenseSink = deliver_local):
+    """
+    Starts the adapters enabled in settings (SENSE_SOCKET, SENSE_FILE_DIR). Only one
+    process may run them (the socket is bound, spool files are consumed); in
+    multi-process mode that is the first worker, with a sink that forwards each line
+    to the worker owning the user (see app.cluster.senses).
+    """
+    if settings.SENSE_SOCKET:
+        adapter = SocketSenseAdapter(settings.SENSE_SOCKET, sink)
+        await adapter.start()
+        _adapters.append(adapter)
+    if settings.SENSE_FILE_DIR:
+        adapter = FileSenseAdapter(settings.SENSE_FILE_DIR, settings.SENSE_FILE_POLL, sink)
+        adapter.start()
+        _adapters.append(adapter)
+
+async def stop_sense_adapters():
+    for adapter in _adapters:
+        await adapter.stop()
+    _adapters.clear()
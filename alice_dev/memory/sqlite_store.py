@@ -0,0 +1,149 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Any, List, Callable, Optional
+from config.settings import settings
+from .state_store import StateStore
+
+# One database for all users; every row carries its user_id.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, item TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS history_user ON history (user_id, id);
+CREATE TABLE IF NOT EXISTS instant_memory (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, item TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS instant_memory_user ON instant_memory (user_id, id);
+CREATE TABLE IF NOT EXISTS persona (user_id TEXT PRIMARY KEY, state TEXT NOT NULL);
+-- Component state of the user lives here (possibly cleared); older backends are not consulted again
+CREATE TABLE IF NOT EXISTS migrated (user_id TEXT NOT NULL, name TEXT NOT NULL, PRIMARY KEY (user_id, name));
+"""
+
+_connections: Dict[str, sqlite3.Connection] = {}
+# Agents share the connection; statements are short and serialized by this lock
+_lock = threading.RLock()
+
+def get_connection(path: Optional[str] = None) -> sqlite3.Connection:
+    path = path or settings.STATE_SQLITE_PATH
+    with _lock:
+        if path not in _connections:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            _connections[path] = conn
+        return _connections[path]
+
+class SQLiteStateStore(StateStore):
+    """
+    StateStore kept as per-user rows in a SQLite (WAL) database (STATE_BACKEND=sqlite).
+
+    Same op protocol and debounced flush as the file store, but each flush is one
+    transaction of incremental inserts: 'append' adds a history row, 'instant' an
+    instant memory row, 'clear' deletes the user's rows, 'state' replaces the persona
+    row. Loading reads only the newest `history_limit` / `instant_limit` rows; older
+    history is pruned beyond STATE_SQLITE_HISTORY_KEEP rows per user.
+    Every write also sets the user's `migrated` marker, so state that was cleared
+    (no rows left) is not re-imported from the file backend or legacy files.
+    """
+    def __init__(self, user_id: str, name: str, snapshot_fn: Callable[[], Dict[str, Any]],
+                 history_limit: int = 20, instant_limit: int = 10, fallback: Optional[StateStore] = None):
+        super().__init__(os.path.dirname(settings.STATE_SQLITE_PATH), name, snapshot_fn)
+        self.directory = f"{settings.STATE_SQLITE_PATH} ({user_id})"
+        self.user_id = user_id
+        self.name = name
+        self.history_limit = history_limit
+        self.instant_limit = instant_limit
+        self.fallback = fallback
+        self.conn = get_connection()
+
+    def exists(self) -> bool:
+        with _lock:
+            if self.conn.execute("SELECT 1 FROM migrated WHERE user_id = ? AND name = ?", (self.user_id, self.name)).fetchone():
+                return True
+            if self.name == "persona":
+                return self.conn.execute("SELECT 1 FROM persona WHERE user_id = ?", (self.user_id,)).fetchone() is not None
+            return any(
+                self.conn.execute(f"SELECT 1 FROM {table} WHERE user_id = ? LIMIT 1", (self.user_id,)).fetchone()
+                for table in ("history", "instant_memory")
+            )
+
+    def _latest(self, table: str, limit: int) -> List[Any]:
+        rows = self.conn.execute(
+            f"SELECT item FROM {table} WHERE user_id = ? ORDER BY id DESC LIMIT ?", (self.user_id, limit)
+        ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def load(self, restore: Callable[[Dict[str, Any]], None], apply: Callable[[Dict[str, Any]], None]) -> bool:
+        if not self.exists():
+            # Migrate state written by the file backend
+            if self.fallback is not None and self.fallback.exists() and self.fallback.load(restore, apply):
+                self.compact()
+                return True
+            return False
+        with _lock:
+            self._mark_migrated()
+            if self.name == "persona":
+                row = self.conn.execute("SELECT state FROM persona WHERE user_id = ?", (self.user_id,)).fetchone()
+                if row:
+                    restore(json.loads(row[0]))
+            else:
+                restore({
+                    "history": self._latest("history", self.history_limit),
+                    "instant_memory_queue": self._latest("instant_memory", self.instant_limit)
+                })
+        return True
+
+    def _write(self, ops: List[Dict[str, Any]]):
+        with _lock:
+            self.conn.execute("BEGIN")
+            try:
+                self._mark_migrated()
+                appended = False
+                for op in ops:
+                    self._execute(op)
+                    appended = appended or op.get("op") in ("append", "instant")
+                if appended:
+                    self._prune()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _mark_migrated(self):
+        self.conn.execute("INSERT OR IGNORE INTO migrated (user_id, name) VALUES (?, ?)", (self.user_id, self.name))
+
+    def _execute(self, op: Dict[str, Any]):
+        kind = op.get("op")
+        if kind == "append":
+            self.conn.execute("INSERT INTO history (user_id, item) VALUES (?, ?)", (self.user_id, json.dumps(op["item"], ensure_ascii=False)))
+        elif kind == "instant":
+            self.conn.execute("INSERT INTO instant_memory (user_id, item) VALUES (?, ?)", (self.user_id, json.dumps(op["item"], ensure_ascii=False)))
+        elif kind == "clear":
+            self.conn.execute("DELETE FROM history WHERE user_id = ?", (self.user_id,))
+            self.conn.execute("DELETE FROM instant_memory WHERE user_id = ?", (self.user_id,))
+        elif kind == "state":
+            self.conn.execute("INSERT OR REPLACE INTO persona (user_id, state) VALUES (?, ?)", (self.user_id, json.dumps(op["value"], ensure_ascii=False)))
+
+    def _prune(self):
+        for table, keep in (("history", settings.STATE_SQLITE_HISTORY_KEEP), ("instant_memory", self.instant_limit)):
+            self.conn.execute(
+                f"DELETE FROM {table} WHERE user_id = ? AND id NOT IN "
+                f"(SELECT id FROM {table} WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+                (self.user_id, self.user_id, keep)
+            )
+
+    def compact(self):
+        """Replaces the user's rows with the current in-memory state (used for migration)."""
+        self._cancel_scheduled()
+        self._pending = []
+        state = self.snapshot_fn()
+        if self.name == "persona":
+            ops = [{"op": "state", "value": state}]
+        else:
+            ops = [{"op": "clear"}]
+            ops += [{"op": "append", "item": item} for item in state.get("history", [])]
+            ops += [{"op": "instant", "item": item} for item in state.get("instant_memory_queue", [])]
+        try:
+            self._write(ops)
+        except Exception as e:
+            print(f"Error writing state {self.directory}: {e}")
@@ -0,0 +1,161 @@
+import os
+import json
+import asyncio
+from typing import Dict, Any, List, Callable, Optional
+from config.settings import settings
+
+class StateStore:
+    """
+    Durable state of one component of one user's agent (working memory, persona).
+
+    Layout in `directory`:
+      <name>.json           snapshot {"seq": n, "state": {...}}, replaced atomically (write tmp + rename)
+      <name>.journal.jsonl  append-only ops recorded after the snapshot, each with its seq
+
+    `record()` only queues an op; queued ops are appended to the journal in one write
+    after STATE_FLUSH_DELAY seconds (immediately when no event loop is running), so a
+    cycle that changes the state many times costs one small append. Ops recorded with
+    `replace_pending=True` replace queued ops of the same kind (for full-state ops
+    where only the latest matters). After STATE_COMPACT_EVERY journal entries the
+    current state is written as a new snapshot and the journal is truncated.
+    Ops with a seq not newer than the snapshot are skipped on replay, so a crash
+    between the snapshot rename and the journal truncation is harmless.
+    """
+    def __init__(self, directory: str, name: str, snapshot_fn: Callable[[], Dict[str, Any]],
+                 flush_delay: Optional[float] = None, compact_every: Optional[int] = None):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, f"{name}.json")
+        self.journal_path = os.path.join(directory, f"{name}.journal.jsonl")
+        self.snapshot_fn = snapshot_fn
+        self.flush_delay = settings.STATE_FLUSH_DELAY if flush_delay is None else flush_delay
+        self.compact_every = settings.STATE_COMPACT_EVERY if compact_every is None else compact_every
+        self.seq = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._journal_entries = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    def load(self, restore: Callable[[Dict[str, Any]], None], apply: Callable[[Dict[str, Any]], None]) -> bool:
+        """Restores the snapshot, then replays newer journal ops. Returns False if nothing is stored."""
+        found = False
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            restore(data.get("state", {}))
+            self.seq = data.get("seq", 0)
+            found = True
+        if os.path.exists(self.journal_path):
+            good_end = 0
+            torn = False
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        # Torn last line from a crash mid-append
+                        torn = True
+                        break
+                    good_end += len(line)
+                    torn = not line.endswith(b"\n")
+                    self._journal_entries += 1
+                    if op.get("seq", 0) <= self.seq:
+                        continue
+                    apply(op)
+                    self.seq = op["seq"]
+                    found = True
+            if torn:
+                self._repair_journal(good_end)
+        return found
+
+    def _repair_journal(self, good_end: int):
+        """Cuts the journal after its last complete line, so the next append starts a fresh line."""
+        print(f"Repairing torn journal {self.journal_path} at offset {good_end}")
+        with open(self.journal_path, 'r+b') as f:
+            f.truncate(good_end)
+            if good_end:
+                f.seek(good_end - 1)
+                if f.read(1) != b"\n":
+                    # Complete op whose newline was not written
+                    f.write(b"\n")
+
+    def record(self, op: Dict[str, Any], replace_pending: bool = False):
+        if replace_pending:
+            self._pending = [p for p in self._pending if p.get("op") != op.get("op")]
+        self._pending.append(op)
+        self._schedule()
+
+    def _schedule(self):
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts): write through
+            self.flush()
+            return
+        self._flush_handle = loop.call_later(self.flush_delay, self.flush)
+
+    def _cancel_scheduled(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    def flush(self):
+        """Appends queued ops to the journal (and compacts when it got long)."""
+        self._cancel_scheduled()
+        if not self._pending:
+            return
+        ops, self._pending = self._pending, []
+        try:
+            self._write(ops)
+        except Exception as e:
+            print(f"Error writing state {self.directory}: {e}")
+
+    def _write(self, ops: List[Dict[str, Any]]):
+        lines = []
+        for op in ops:
+            self.seq += 1
+            lines.append(json.dumps({**op, "seq": self.seq}, ensure_ascii=False))
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        self._journal_entries += len(lines)
+        if self._journal_entries >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Writes the current state as the snapshot and truncates the journal."""
+        self._cancel_scheduled()
+        # Queued ops are already part of the in-memory state
+        self.seq += len(self._pending)
+        self._pending = []
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"seq": self.seq, "state": self.snapshot_fn()}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            open(self.journal_path, 'w').close()
+            self._journal_entries = 0
+        except Exception as e:
+            print(f"Error writing state snapshot {self.snapshot_path}: {e}")
+
+def user_state_dir(user_id: str) -> str:
+    return os.path.join(settings.STATE_DIR, user_id)
+
+def open_state_store(user_id: str, name: str, snapshot_fn: Callable[[], Dict[str, Any]], **limits) -> StateStore:
+    """
+    State store for the configured STATE_BACKEND: 'files' (snapshot + journal) or
+    'sqlite' (rows in a shared WAL database, see memory/sqlite_store.py).
+    `limits` (history_limit, instant_limit) are used by the sqlite backend.
+    """
+    file_store = StateStore(user_state_dir(user_id), name, snapshot_fn)
+    if settings.STATE_BACKEND == "sqlite":
+        from .sqlite_store import SQLiteStateStore
+        # The file store is read once to migrate existing state
+        return SQLiteStateStore(user_id, name, snapshot_fn, fallback=file_store, **limits)
+    return file_store
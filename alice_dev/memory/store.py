@@ -1,11 +1,34 @@
 import weaviate
 import os
+import functools
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 from .schema import MemorySchema
 import weaviate.classes.config as wc
 from weaviate.classes.query import Filter, Sort, MetadataQuery
 from config.settings import settings
+from prometheus_client import Histogram
+from opentelemetry import trace
+
+# Weaviate round-trip latency per store method (served at /metrics)
+WEAVIATE_QUERY_SECONDS = Histogram(
+    "alice_weaviate_query_seconds", "Weaviate query latency", ["operation"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+tracer = trace.get_tracer("alice.memory")
+
+def _timed(operation: str):
+    """Records latency (Prometheus) and a tracing span for a store method."""
+    histogram = WEAVIATE_QUERY_SECONDS.labels(operation=operation)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(f"weaviate.{operation}"), histogram.time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
 
 class WeaviateStore:
     def __init__(self, url: str = None, openai_api_key: Optional[str] = None):
@@ -81,6 +104,7 @@ class WeaviateStore:
             properties=MemorySchema.get_properties()
         )
 
+    @_timed("add_memory")
     def add_memory(self, content: str, user_id: str, memory_type: str = "episodic", importance: float = 0.5, tags: List[str] = None, attributes: str = None):
         """
         Adds a new memory item to Weaviate.
@@ -96,6 +120,7 @@ class WeaviateStore:
             "attributes": attributes or "{}"
         })
 
+    @_timed("get_social_state")
     def get_social_state(self, user_id: str) -> Dict[str, Any]:
         """
         Retrieves the latest social state for the user.
@@ -148,6 +173,7 @@ class WeaviateStore:
             tags=tags
         )
 
+    @_timed("search_memories")
     def search_memories(self, query: str, user_id: str, limit: int = 5, memory_type: str = None) -> List[Dict[str, Any]]:
         """
         Semantic search for memories related to the query.
@@ -188,6 +214,7 @@ class WeaviateStore:
             results.append(props)
         return results
 
+    @_timed("get_all_memories")
     def get_all_memories(self, user_id: str, limit: int = 100) -> List[Dict[str, Any]]:
         """
         Retrieve recent memories for a user.
@@ -207,6 +234,7 @@ class WeaviateStore:
             results.append(props)
         return results
 
+    @_timed("delete_memory")
     def delete_memory(self, memory_id: str):
         """
         Delete a memory by UUID.
@@ -214,6 +242,7 @@ class WeaviateStore:
         collection = self.client.collections.get(MemorySchema.CLASS_NAME)
         collection.data.delete_by_id(memory_id)
 
+    @_timed("update_memory")
     def update_memory(self, memory_id: str, properties: Dict[str, Any]):
         """
         Update a memory by UUID.
@@ -1,16 +1,40 @@
-from typing import List, Dict, Deque, Any
+from typing import List, Dict, Deque, Any, Optional
 from collections import deque
 import json
 import os
+from config.settings import settings
+from .state_store import open_state_store
+from .sense_bus import get_sense_bus
+from .blob_store import blob_store
 
 class WorkingMemory:
     """
     Manages the short-term context window (chat history) and perception queue.
+
+    History is a ring buffer bounded by max_history entries and HISTORY_MAX_BYTES of
+    serialized size. Large strings in event payloads (page content, command output,
+    base64 plots) are moved to the blob store; the history entry keeps a preview and
+    an `actionData["$blobs"]` map from payload path to blob reference (on the entry
+    itself, `msg["$blobs"]`, when the payload is not an object).
+
+    The prompt renderings (`get_context_string`, `get_instant_memory_string`) are kept
+    incrementally: each history entry's context line is rendered once when it is
+    appended and dropped with it on eviction, and the joined strings are cached per
+    `history_version` / `instant_version`, which change whenever history or the
+    instant memory queue change. Prompt builders can compare versions to skip work.
     """
     def __init__(self, user_id: str = "default", max_history: int = 20, perception_size: int = 10):
         self.user_id = user_id
-        self.history: List[Dict[str, str]] = []
+        self.history: Deque[Dict[str, Any]] = deque()
+        self._history_sizes: Deque[int] = deque()
+        self._history_bytes = 0
+        # Rendered context line per history entry (None for non-chat events)
+        self._context_lines: Deque[Optional[str]] = deque()
         self.max_history = max_history
+        self.history_version = 0
+        self.instant_version = 0
+        self._context_cache = (-1, "")
+        self._instant_cache = (-1, "")
         
         # Raw Perception Buffer: Accumulates raw sensory data before summarization
         self.perception_buffer: List[str] = []
@@ -18,142 +42,163 @@ class WorkingMemory:
         # Instant Memory Queue: FIFO queue for summarized perceptions (Short-term/Instant Memory)
         self.instant_memory_queue: Deque[str] = deque(maxlen=perception_size)
         
-        self.senses_dir = "/storage/senses"
-        os.makedirs(self.senses_dir, exist_ok=True)
+        # Per-agent in-memory sense buffers (also fed by the external sense adapters)
+        self.senses = get_sense_bus(user_id)
         
+        # History / instant memory ops, persisted by the configured backend (see StateStore)
+        self.store = open_state_store(user_id, "working_memory", self._snapshot,
+                                      history_limit=max_history, instant_limit=perception_size)
         self._load_persistence()
 
     def write_to_sense(self, sense: str, content: str):
-        """Writes content to a specific sense file."""
-        try:
-            file_path = os.path.join(self.senses_dir, f"{sense}.txt")
-            with open(file_path, "a", encoding="utf-8") as f:
-                f.write(content + "\n")
-        except Exception as e:
-            print(f"Error writing to sense {sense}: {e}")
+        """Adds content (one or more lines) to a sense of this agent."""
+        self.senses.put(sense, content)
 
     def read_and_clear_senses(self) -> Dict[str, List[str]]:
-        """Reads all sense files and clears them."""
-        senses_data = {}
-        sense_files = ["sight", "hearing", "smell", "taste", "touch", "mind"]
-        
-        for sense in sense_files:
-            file_path = os.path.join(self.senses_dir, f"{sense}.txt")
-            if os.path.exists(file_path):
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        lines = [line.strip() for line in f.readlines() if line.strip()]
-                    
-                    if lines:
-                        senses_data[sense] = lines
-                        
-                    # Clear the file
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        pass
-                except Exception as e:
-                    print(f"Error reading/clearing sense {sense}: {e}")
-        
-        return senses_data
+        """Returns all buffered sense lines and clears them."""
+        return self.senses.drain()
+
+    def has_senses(self) -> bool:
+        return self.senses.pending() > 0
+
+    async def wait_for_senses(self):
+        """Awaitable "senses available" signal: returns once new sense data is buffered."""
+        await self.senses.wait()
 
     def _get_persistence_path(self):
+        # Legacy whole-file persistence, only read for migration
         return f"/storage/working_memory_{self.user_id}.json"
 
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            "history": list(self.history),
+            "instant_memory_queue": list(self.instant_memory_queue)
+        }
+
+    def _restore(self, data: Dict[str, Any]):
+        if "history" in data:
+            self._clear_history()
+            for item in data["history"][-self.max_history:]:
+                self._append_history(item)
+        if "instant_memory_queue" in data:
+            self.instant_memory_queue = deque(data["instant_memory_queue"], maxlen=self.instant_memory_queue.maxlen)
+            self.instant_version += 1
+
+    def _apply(self, op: Dict[str, Any]):
+        """Applies a journaled op (also used for replay on load)."""
+        kind = op.get("op")
+        if kind == "append":
+            self._append_history(op["item"])
+        elif kind == "instant":
+            self.instant_memory_queue.append(op["item"])
+            self.instant_version += 1
+        elif kind == "clear":
+            self._clear_history()
+            self.instant_memory_queue.clear()
+            self.instant_version += 1
+
+    def _append_history(self, item: Dict[str, Any]):
+        size = len(json.dumps(item, ensure_ascii=False, default=str))
+        self.history.append(item)
+        self._history_sizes.append(size)
+        self._context_lines.append(self._render_context_line(item))
+        self._history_bytes += size
+        # Evict oldest entries by count, then by total size (the newest entry always stays)
+        while len(self.history) > self.max_history or (self._history_bytes > settings.HISTORY_MAX_BYTES and len(self.history) > 1):
+            self.history.popleft()
+            self._context_lines.popleft()
+            self._history_bytes -= self._history_sizes.popleft()
+        self.history_version += 1
+
+    def _clear_history(self):
+        self.history.clear()
+        self._history_sizes.clear()
+        self._context_lines.clear()
+        self._history_bytes = 0
+        self.history_version += 1
+
+    def _offload(self, value: Any, path: str, blobs: Dict[str, Any]) -> Any:
+        """Copy of `value` with large strings moved to the blob store; refs are collected in `blobs`."""
+        if isinstance(value, dict):
+            return {k: self._offload(v, f"{path}.{k}" if path else str(k), blobs) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._offload(v, f"{path}.{i}" if path else str(i), blobs) for i, v in enumerate(value)]
+        if isinstance(value, str) and len(value) > settings.HISTORY_BLOB_MIN_CHARS:
+            try:
+                if path.split(".")[-2:-1] == ["images"]:
+                    # Base64 plots: stored decoded and served as images
+                    blobs[path] = blob_store.put_base64_image(value)
+                    return ""
+                blobs[path] = blob_store.put_text(value)
+            except Exception as e:
+                print(f"Error storing history blob for {path}: {e}")
+            return value[:settings.HISTORY_PREVIEW_CHARS] + " …"
+        return value
+
+    def _record(self, op: Dict[str, Any]):
+        self._apply(op)
+        self.store.record(op)
+
     def _load_persistence(self):
-        """Loads state from persistence file."""
+        """Loads state from the state store, migrating older whole-file JSON persistence."""
         try:
-            path = self._get_persistence_path()
-            
-            # Migration: Check for old file if new one doesn't exist
-            if not os.path.exists(path):
-                # Check for previous locations
-                old_path_v1 = f"/memory/working_memory_{self.user_id}.json"
-                old_path_v0 = "/memory/working_memory.json"
-                
-                source_path = None
-                if os.path.exists(old_path_v1):
-                    source_path = old_path_v1
-                elif os.path.exists(old_path_v0):
-                    source_path = old_path_v0
-                    
+            if not self.store.load(self._restore, self._apply):
+                # Migration: Check for old files (newest location first)
+                candidates = [
+                    self._get_persistence_path(),
+                    f"/memory/working_memory_{self.user_id}.json",
+                    "/memory/working_memory.json"
+                ]
+                source_path = next((p for p in candidates if os.path.exists(p)), None)
                 if source_path:
-                    print(f"Migrating working memory from {source_path} to {path}")
-                    try:
-                        with open(source_path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                        # Load data
-                        if "history" in data:
-                            self.history = data["history"]
-                        if "instant_memory_queue" in data:
-                            self.instant_memory_queue = deque(data["instant_memory_queue"], maxlen=self.instant_memory_queue.maxlen)
-                        
-                        # Normalize roles immediately upon migration
-                        for msg in self.history:
-                            if msg.get("role") == "User":
-                                msg["role"] = "user"
-                            if msg.get("role") == "Alice":
-                                msg["role"] = "assistant"
-
-                        # Save to new path immediately
-                        self._save_persistence()
-                        return
-                    except Exception as e:
-                        print(f"Error migrating working memory: {e}")
-
-            if os.path.exists(path):
-                print(f"Loading working memory from {path}")
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                if "history" in data:
-                    self.history = data["history"]
-                    # Normalize roles for frontend compatibility
-                    for msg in self.history:
-                        if msg.get("role") == "User":
-                            msg["role"] = "user"
-                        if msg.get("role") == "Alice":
-                            msg["role"] = "assistant"
-                            
-                if "instant_memory_queue" in data:
-                    self.instant_memory_queue = deque(data["instant_memory_queue"], maxlen=self.instant_memory_queue.maxlen)
+                    print(f"Migrating working memory from {source_path} to {self.store.directory}")
+                    with open(source_path, 'r', encoding='utf-8') as f:
+                        self._restore(json.load(f))
+                    self._normalize_roles()
+                    self.store.compact()
+                return
+            print(f"Loaded working memory from {self.store.directory}")
+            self._normalize_roles()
         except Exception as e:
             print(f"Error loading working memory persistence: {e}")
 
-    def _save_persistence(self):
-        """Saves current state to persistence file."""
-        try:
-            path = self._get_persistence_path()
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            
-            data = {
-                "history": self.history,
-                "instant_memory_queue": list(self.instant_memory_queue)
-            }
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error saving working memory persistence: {e}")
+    def _normalize_roles(self):
+        # Normalize roles for frontend compatibility
+        for msg in self.history:
+            if msg.get("role") == "User":
+                msg["role"] = "user"
+            if msg.get("role") == "Alice":
+                msg["role"] = "assistant"
+        self._context_lines = deque(self._render_context_line(msg) for msg in self.history)
+        self.history_version += 1
+
+    def flush(self):
+        """Writes pending changes now (normally they are flushed after STATE_FLUSH_DELAY)."""
+        self.store.flush()
 
     def add_message(self, role: str, content: str, **kwargs):
         """Adds a message to the conversation history."""
         msg = {"role": role, "content": content}
         msg.update(kwargs)
-        self.history.append(msg)
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
-        self._save_persistence()
+        self._record({"op": "append", "item": msg})
 
     def add_event(self, type: str, content: str, data: Dict[str, Any] = None):
         """Adds a system event (thought, action, etc.) to history."""
+        # Large payload fields go to the blob store; the live event keeps the full data
+        blobs: Dict[str, Any] = {}
+        data = self._offload(data, "", blobs)
+        if blobs and isinstance(data, dict):
+            data["$blobs"] = blobs
         msg = {
             "role": type, # Use type as role for internal storage if convenient, or separate
             "type": type,
             "content": content,
             "actionData": data
         }
-        self.history.append(msg)
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
-        self._save_persistence()
+        if blobs and not isinstance(data, dict):
+            # A list / scalar payload has no place for the refs; keep them on the entry
+            msg["$blobs"] = blobs
+        self._record({"op": "append", "item": msg})
 
     def add_to_buffer(self, content: str):
         """Adds raw data to the perception buffer."""
@@ -169,49 +214,51 @@ class WorkingMemory:
 
     def add_instant_memory(self, content: str):
         """Adds a summarized memory to the instant memory queue."""
-        self.instant_memory_queue.append(content)
-        self._save_persistence()
+        self._record({"op": "instant", "item": content})
+
+    @staticmethod
+    def _render_context_line(msg: Dict[str, Any]) -> Optional[str]:
+        role = msg.get("role")
+        # Only include standard chat roles for the LLM context
+        if role in ["user", "assistant", "system"]:
+            # The prompt expects "User: ..." or "Alice: ..."
+            # If we stored role="user", content="...", name="Bob" -> "Bob: ..."
+            name = msg.get("name", role)
+            return f"{name}: {msg['content']}"
+        # We skip 'thought', 'action', 'thinking_process' for the LLM context string
+        # as they are usually internal or already summarized in perception.
+        return None
 
     def get_context_string(self) -> str:
         """
         Returns the history formatted as a string for the LLM prompt.
-        Filters out non-chat events (thoughts, actions) to keep context clean,
-        unless we decide they are relevant.
+        Filters out non-chat events (thoughts, actions) to keep context clean.
+        Lines are rendered on append; the joined string is cached per history_version.
         """
-        context_msgs = []
-        for msg in self.history:
-            role = msg.get("role")
-            # Only include standard chat roles for the LLM context
-            if role in ["user", "assistant", "system"]:
-                # If name is present, use it? Or just role?
-                # The prompt expects "User: ..." or "Alice: ..."
-                # If we stored role="user", content="...", name="Bob"
-                # We might want to format as "Bob: ..."
-                name = msg.get("name", role)
-                context_msgs.append(f"{name}: {msg['content']}")
-            # We skip 'thought', 'action', 'thinking_process' for the LLM context string
-            # as they are usually internal or already summarized in perception.
-            
-        return "\n".join(context_msgs)
+        version, text = self._context_cache
+        if version != self.history_version:
+            text = "\n".join(line for line in self._context_lines if line is not None)
+            self._context_cache = (self.history_version, text)
+        return text
 
     def get_instant_memory_string(self) -> str:
         """
-        Returns the instant memory queue formatted string.
+        Returns the instant memory queue formatted string (cached per instant_version).
         """
+        version, text = self._instant_cache
+        if version == self.instant_version:
+            return text
         if not self.instant_memory_queue:
-            return "（瞬时记忆为空）"
-        
-        lines = []
-        # 队列顺序：由远至近 (Oldest to Newest)
-        # index 0 是最早的记忆，最后一个 index 是最新的记忆
-        for i, item in enumerate(self.instant_memory_queue):
-            # Mark the latest item
-            prefix = f"[{i+1}]"
-            lines.append(f"{prefix} {item}")
-        return "\n".join(lines)
+            text = "（瞬时记忆为空）"
+        else:
+            # 队列顺序：由远至近 (Oldest to Newest)
+            # index 0 是最早的记忆，最后一个 index 是最新的记忆
+            # (numbers shift when the oldest item is evicted, so the queue is re-rendered;
+            # it holds at most perception_size items)
+            text = "\n".join(f"[{i+1}] {item}" for i, item in enumerate(self.instant_memory_queue))
+        self._instant_cache = (self.instant_version, text)
+        return text
 
     def clear(self):
-        self.history = []
         self.perception_buffer.clear()
-        self.instant_memory_queue.clear()
-        self._save_persistence()
+        self._record({"op": "clear"})
@@ -16,6 +16,15 @@ from . import learned
 import importlib
 from memory.store import WeaviateStore
 
+# Actions without per-user state (no memory store or registry reference) are
+# created once per process and shared by every agent's registry.
+_shared_actions: Dict[type, Action] = {}
+
+def shared_action(action_class: type) -> Action:
+    if action_class not in _shared_actions:
+        _shared_actions[action_class] = action_class()
+    return _shared_actions[action_class]
+
 class ActionRegistry:
     def __init__(self, memory_store: WeaviateStore):
         self.actions: Dict[str, Action] = {}
@@ -26,10 +35,10 @@ class ActionRegistry:
 
     def _init_innate(self):
         innate = [
-            Daze(),
-            Speak(),
-            ThinkAdd(),
-            ThinkUpdate(),
+            shared_action(Daze),
+            shared_action(Speak),
+            shared_action(ThinkAdd),
+            shared_action(ThinkUpdate),
             ThinkComplete(self.memory_store),
             Recall(self.memory_store),
             Associate(self.memory_store),
@@ -37,23 +46,23 @@ class ActionRegistry:
             LearnSkill(self),
             UpdateRelationship(self.memory_store),
             AddBelief(self.memory_store),
-            Express(),
+            shared_action(Express),
             ManageSkill(self),
-            RunPython(),
-            RunBash(),
-            BrowseWeb(),
-            VisitPage(),
+            shared_action(RunPython),
+            shared_action(RunBash),
+            shared_action(BrowseWeb),
+            shared_action(VisitPage),
             # MinecraftConnect(),
             # MinecraftDisconnect(),
-            MinecraftStatus(),
-            MinecraftPerception(),
-            MinecraftChat(),
-            MinecraftMove(),
-            MinecraftMine(),
-            MinecraftPlace(),
-            MinecraftEquip(),
-            MinecraftCraft(),
-            MinecraftAttack()
+            shared_action(MinecraftStatus),
+            shared_action(MinecraftPerception),
+            shared_action(MinecraftChat),
+            shared_action(MinecraftMove),
+            shared_action(MinecraftMine),
+            shared_action(MinecraftPlace),
+            shared_action(MinecraftEquip),
+            shared_action(MinecraftCraft),
+            shared_action(MinecraftAttack)
         ]
         for action in innate:
             self.innate_names.add(action.name)
@@ -0,0 +1,77 @@
+import hashlib
+import math
+from typing import Dict, Any, List, Optional
+from config.settings import settings
+
+class ActionRetriever:
+    """
+    Tool retrieval for the think prompt.
+    Action descriptions are embedded once (cached by content hash, shared by all agents),
+    and each cycle only the top-k actions most similar to the current context are listed,
+    together with a pinned core set that is always available.
+    """
+    def __init__(self, top_k: int = None, pinned: List[str] = None):
+        self.top_k = top_k if top_k is not None else settings.ACTION_RETRIEVAL_TOP_K
+        self.pinned = set(pinned if pinned is not None else settings.ACTION_RETRIEVAL_PINNED)
+        # text hash -> embedding vector
+        self._embeddings: Dict[str, List[float]] = {}
+
+    @staticmethod
+    def _action_text(schema: Dict[str, Any]) -> str:
+        params = ", ".join(schema.get("parameters", {}).keys())
+        return f"{schema['name']}({params}): {schema.get('description', '')} [{schema.get('category', '')}]"
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _cosine(a: List[float], b: List[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    async def _ensure_embedded(self, schemas: List[Dict[str, Any]], llm) -> Dict[str, str]:
+        """Embeds any action not seen before (e.g. a newly learned skill). Returns name -> text hash."""
+        keys = {}
+        missing = {}
+        for schema in schemas:
+            text = self._action_text(schema)
+            key = self._hash(text)
+            keys[schema["name"]] = key
+            if key not in self._embeddings:
+                missing[key] = text
+
+        if missing:
+            vectors = await llm.embed(list(missing.values()))
+            for key, vector in zip(missing.keys(), vectors):
+                self._embeddings[key] = vector
+        return keys
+
+    async def select(self, schemas: List[Dict[str, Any]], query: str, llm, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the pinned actions plus the top-k actions relevant to `query`,
+        in registry order. Falls back to the full list if embedding is unavailable.
+        """
+        top_k = self.top_k if top_k is None else top_k
+        if len(schemas) <= top_k + len(self.pinned) or not query or not query.strip():
+            return schemas
+
+        try:
+            keys = await self._ensure_embedded(schemas, llm)
+            query_vector = (await llm.embed([query]))[0]
+        except Exception as e:
+            print(f"ActionRetriever: embedding failed, listing all actions: {e}")
+            return schemas
+
+        candidates = [s for s in schemas if s["name"] not in self.pinned]
+        scored = sorted(
+            candidates,
+            key=lambda s: self._cosine(query_vector, self._embeddings[keys[s["name"]]]),
+            reverse=True
+        )
+        selected = {s["name"] for s in scored[:top_k]} | self.pinned
+        return [s for s in schemas if s["name"] in selected]
+
+# Global instance (embedding cache is shared across agents)
+action_retriever = ActionRetriever()
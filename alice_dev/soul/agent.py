@@ -1,24 +1,29 @@
 import asyncio
 import json
 import os
+import time
 from typing import Dict, Any, AsyncGenerator, Optional, Callable
 from .persona.manager import PersonaManager
 from .llm.provider import LLMProvider
 from .nodes.observe import observe_node
 from .nodes.think import think_node
-from .nodes.act import act_node
-from .nodes.write import write_node
-from .graph import create_graph
+from .nodes.act import act_node, ActionDispatcher
+from .graph import shared_graph
 from .actions.registry import ActionRegistry
 from .actions.executor import ActionExecutor
 from memory.store import WeaviateStore
 from memory.working_memory import WorkingMemory
 from config.settings import settings
+from config.loader import load_json_config
+from .metrics import CYCLE_SECONDS, CYCLE_ERRORS, NODE_SECONDS, ACTIVE_AGENTS
+from .tracing import tracer
+from opentelemetry import trace, context as otel_context
+from opentelemetry.trace import Status, StatusCode
 
 class AliceAgent:
     def __init__(self, user_id: str, connection_manager=None):
         self.user_id = user_id
-        self.persona = PersonaManager()
+        self.persona = PersonaManager(user_id=user_id)
         self.user_profile = self._load_user_config()
         self.llm = LLMProvider()
         self.memory_store = WeaviateStore() # In real app, pass config
@@ -29,15 +34,25 @@ class AliceAgent:
         self.action_executor = ActionExecutor(self.action_registry)
         self.connection_manager = connection_manager # Needed for broadcasting actions
 
-        self.graph = create_graph(self)
+        # Compiled once per process; the nodes find this agent in config["configurable"]
+        self.graph = shared_graph()
+        self._graph_config = {"configurable": {"agent": self}}
         
         self.input_queue = asyncio.Queue()
+        # Set by on_message; the loop waits on it together with the senses signal
+        self._input_ready = asyncio.Event()
         self.is_running = False
         self.output_callback: Optional[Callable[[str], Any]] = None
         self.log_callback: Optional[Callable[[Dict[str, Any]], Any]] = None
         self.current_task: Optional[asyncio.Task] = None
         self._lifecycle_lock = asyncio.Lock()
 
+        # Stage checkpoint: state after the last successful observe of the current cycle.
+        # If think fails, the next cycle resumes from it instead of re-running observe.
+        self._checkpoint: Optional[Dict[str, Any]] = None
+        self._resume_state: Optional[Dict[str, Any]] = None
+        self._resume_count = 0
+
     def _load_user_config(self) -> Dict[str, Any]:
         try:
             path = "config/user.json"
@@ -48,12 +63,10 @@ class AliceAgent:
             else:
                 full_path = path
                 
-            if os.path.exists(full_path):
-                print(f"Loading user config from: {full_path}")
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    print(f"Loaded user config: {data}")
-                    return data
+            # Parsed once per process and shared by all agents
+            data = load_json_config(full_path)
+            if data is not None:
+                return data
             print(f"User config not found at: {full_path}")
             return {}
         except Exception as e:
@@ -61,7 +74,9 @@ class AliceAgent:
             return {}
 
     async def run_observe(self, state: Dict[str, Any]):
-        result = await observe_node(state, self.memory_store, self.working_memory, self.llm)
+        with tracer.start_as_current_span("observe"), NODE_SECONDS.labels(node="observe").time():
+            result = await observe_node(state, self.memory_store, self.working_memory, self.llm)
+        self._checkpoint = dict(result)
         
         # Broadcast instant memory update
         if self.connection_manager:
@@ -80,8 +95,30 @@ class AliceAgent:
         agent_name = self.persona.config.get("basic_info", {}).get("name", "Alice")
         state['agent_name'] = agent_name
         
-        result = await think_node(state, self.persona, self.llm, self.action_registry)
+        if not settings.THINK_STREAMING:
+            with tracer.start_as_current_span("think"), NODE_SECONDS.labels(node="think").time():
+                result = await think_node(state, self.persona, self.llm, self.action_registry)
+            result['agent_name'] = agent_name
+            # Think succeeded: act failures must not replay its actions
+            self._checkpoint = None
+            return result
+
+        # Streaming: actions start executing while the think model is still generating.
+        # act_node picks up the dispatcher and waits for the remaining actions.
+        dispatcher = ActionDispatcher(state, self.action_executor, self.connection_manager, self.working_memory, self.persona)
+        try:
+            with tracer.start_as_current_span("think"), NODE_SECONDS.labels(node="think").time():
+                result = await think_node(state, self.persona, self.llm, self.action_registry, dispatcher=dispatcher)
+        except Exception:
+            # Let actions that were already dispatched finish before the cycle fails
+            await dispatcher.finish()
+            if dispatcher.submitted:
+                # Some actions already ran; re-running think would repeat them
+                self._checkpoint = None
+            raise
+        self._checkpoint = None
         result['agent_name'] = agent_name
+        result['action_dispatcher'] = dispatcher
         return result
 
     async def run_act(self, state: Dict[str, Any]):
@@ -90,7 +127,8 @@ class AliceAgent:
         if not self.connection_manager:
             # Try to find a way to broadcast or just log
             pass
-        return await act_node(state, self.action_executor, self.connection_manager, self.working_memory, self.persona)
+        with tracer.start_as_current_span("act"), NODE_SECONDS.labels(node="act").time():
+            return await act_node(state, self.action_executor, self.connection_manager, self.working_memory, self.persona)
 
     def set_output_callback(self, callback: Callable[[str], Any]):
         self.output_callback = callback
@@ -104,12 +142,14 @@ class AliceAgent:
                 return
             self.is_running = True
             self.current_task = asyncio.create_task(self._run_loop())
+            ACTIVE_AGENTS.inc()
             print(f"Agent {self.user_id} started thinking loop.")
 
     async def stop(self):
         async with self._lifecycle_lock:
             self.is_running = False
             if self.current_task:
+                ACTIVE_AGENTS.dec()
                 self.current_task.cancel()
                 try:
                     await self.current_task
@@ -119,20 +159,66 @@ class AliceAgent:
             print(f"Agent {self.user_id} stopped.")
         print(f"Agent {self.user_id} stopped.")
 
+    async def close(self):
+        """Stops the loop, flushes persona and working memory to disk and releases the Weaviate client."""
+        await self.stop()
+        self.persona.flush()
+        self.working_memory.flush()
+        try:
+            self.memory_store.close()
+        except Exception as e:
+            print(f"Error closing memory store for {self.user_id}: {e}")
+
     async def on_message(self, message: str):
         """
         Push user message to input queue.
         """
         await self.input_queue.put(message)
+        self._input_ready.set()
+
+    async def _wait_for_activity(self, timeout: float) -> str:
+        """
+        Waits up to `timeout` seconds for user input or new sense data, whichever comes
+        first. Returns what ended the wait: 'input', 'senses' or 'timeout'.
+        """
+        if not self.input_queue.empty():
+            return "input"
+        if self.working_memory.has_senses():
+            return "senses"
+        self._input_ready.clear()
+        waiters = {
+            asyncio.create_task(self._input_ready.wait()): "input",
+            asyncio.create_task(self.working_memory.wait_for_senses()): "senses"
+        }
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        return waiters[next(iter(done))] if done else "timeout"
 
     async def _run_loop(self):
         while self.is_running:
+            # Root span of the cycle; graph nodes, LLM, Weaviate and action spans nest under it
+            cycle_span = tracer.start_span("agent.cycle", attributes={"user_id": self.user_id})
+            span_token = otel_context.attach(trace.set_span_in_context(cycle_span))
             try:
+                cycle_started = time.monotonic()
+                self._checkpoint = None
+                resume_state, self._resume_state = self._resume_state, None
+                
                 # Check for new input (non-blocking or with timeout)
-                try:
-                    user_input = self.input_queue.get_nowait()
-                except asyncio.QueueEmpty:
-                    user_input = None
+                # A resumed cycle already carries its input; new input waits for the next cycle.
+                if resume_state:
+                    user_input = resume_state.get("input")
+                else:
+                    try:
+                        user_input = self.input_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        user_input = None
+
+                cycle_span.set_attribute("has_input", bool(user_input))
+                cycle_span.set_attribute("resumed", bool(resume_state))
 
                 if self.log_callback:
                     await self.log_callback({
@@ -150,13 +236,24 @@ class AliceAgent:
                     "persona_prompt": self.persona.get_persona_prompt(self.user_profile),
                     "history_str": self.working_memory.get_context_string(),
                     "perception_queue_str": self.working_memory.get_instant_memory_string(),
+                    "perception_queue_version": self.working_memory.instant_version,
                     "memories": [],
                     "thought_data": {},
-                    "output": ""
+                    "output": "",
+                    "prompt_tokens": {}
                 }
                 
+                if resume_state:
+                    # Re-enter at think with the perception of the failed cycle. Observe
+                    # doesn't run again, so the same perception is the checkpoint in
+                    # case think fails once more.
+                    initial_state = {**resume_state, "resume_stage": "think"}
+                    self._checkpoint = dict(resume_state)
+                
                 # Run graph
-                final_state = await self.graph.ainvoke(initial_state)
+                final_state = await self.graph.ainvoke(initial_state, config=self._graph_config)
+                self._resume_count = 0
+                CYCLE_SECONDS.observe(time.monotonic() - cycle_started)
                 
                 # Check if agent wants to speak
                 thought_data = final_state.get("thought_data", {})
@@ -166,6 +263,11 @@ class AliceAgent:
                 has_spoken = any(action.get("name") == "speak" for action in action_queue)
 
                 if self.log_callback:
+                    # Per-section prompt token use of this cycle (for budget tuning)
+                    await self.log_callback({
+                        "type": "prompt_budget",
+                        "content": final_state.get("prompt_tokens", {})
+                    })
                     await self.log_callback({
                         "type": "thought",
                         "content": thought_data
@@ -201,9 +303,10 @@ class AliceAgent:
                             "content": "Decided to stay silent."
                         })
                 
-                # Wait a bit before next thought cycle to prevent tight loop
-                # In a real autonomous agent, this might be dynamic.
-                await asyncio.sleep(settings.THINKING_INTERVAL) 
+                # Wait a bit before next thought cycle to prevent tight loop.
+                # New input or sense data (action feedback, perception, external producers)
+                # ends the wait right away; otherwise the idle cycle rate is unchanged.
+                await self._wait_for_activity(settings.THINKING_INTERVAL)
 
             except asyncio.CancelledError:
                 break
@@ -211,9 +314,24 @@ class AliceAgent:
                 import traceback
                 traceback.print_exc()
                 print(f"Error in agent loop: {e}")
+                CYCLE_ERRORS.inc()
+                cycle_span.record_exception(e)
+                cycle_span.set_status(Status(StatusCode.ERROR, str(e)))
+                # Remember the failed stage so only that stage is retried
+                if self._checkpoint and self._resume_count < settings.AGENT_MAX_STAGE_RESUMES:
+                    self._resume_state = self._checkpoint
+                    self._resume_count += 1
+                    print(f"Agent {self.user_id}: think failed, resuming at think (attempt {self._resume_count}/{settings.AGENT_MAX_STAGE_RESUMES})")
+                else:
+                    self._resume_count = 0
+                self._checkpoint = None
                 if self.log_callback:
                     await self.log_callback({
                         "type": "error",
-                        "content": str(e)
+                        "content": str(e),
+                        "resume_stage": "think" if self._resume_state else None
                     })
-                await asyncio.sleep(5)
+                await asyncio.sleep(settings.AGENT_RETRY_DELAY)
+            finally:
+                otel_context.detach(span_token)
+                cycle_span.end()
@@ -0,0 +1,124 @@
+import json
+from typing import Dict, Any, List, Callable, Optional
+from config.settings import settings
+
+try:
+    from litellm import token_counter
+except ImportError:
+    token_counter = None
+
+class PromptBudget:
+    """
+    Per-section token budget for prompt assembly.
+    Each section has a token limit (settings.PROMPT_BUDGET). Lists are cut by priority
+    (callers pass items from most to least important), plain text is truncated.
+    The token use of every section is kept in `report()` so limits can be tuned.
+    """
+    def __init__(self, model: str = None, limits: Dict[str, int] = None):
+        self.model = model or settings.LLM_MODEL
+        self.limits = limits if limits is not None else settings.PROMPT_BUDGET
+        self.usage: Dict[str, Dict[str, Any]] = {}
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if token_counter:
+            try:
+                return token_counter(model=self.model, text=text)
+            except Exception:
+                pass
+        # Rough fallback: CJK text averages ~1.5 chars/token, English ~4
+        return max(1, len(text) // 2)
+
+    def _record(self, section: str, tokens: int, original: int, dropped: int = 0):
+        self.usage[section] = {
+            "tokens": tokens,
+            "limit": self.limits.get(section),
+            "original": original,
+            "truncated": tokens < original,
+            "dropped_items": dropped
+        }
+
+    def _truncate(self, text: str, limit: int, keep_tail: bool = False) -> str:
+        marker = "…"
+        for _ in range(4):
+            tokens = self.count(text)
+            if tokens <= limit:
+                return text
+            keep = max(0, int(len(text) * limit / tokens * 0.9))
+            text = marker + text[-keep:] if keep_tail else text[:keep] + marker
+        return text
+
+    def fit_text(self, section: str, text: str, keep_tail: bool = False) -> str:
+        """Truncates `text` to the section limit (keeping the head, or the tail if keep_tail)."""
+        original = self.count(text)
+        limit = self.limits.get(section)
+        if limit is None or original <= limit:
+            self._record(section, original, original)
+            return text
+        fitted = self._truncate(text, limit, keep_tail=keep_tail)
+        self._record(section, self.count(fitted), original)
+        return fitted
+
+    def fit_items(self, section: str, items: List[Any], render: Callable[[Any], str] = str) -> List[Any]:
+        """
+        Keeps the longest prefix of `items` (ordered by priority) that fits the section limit.
+        Returns the kept items; callers re-order them for display if needed.
+        """
+        limit = self.limits.get(section)
+        costs = [self.count(render(item)) for item in items]
+        original = sum(costs)
+        if limit is None or original <= limit:
+            self._record(section, original, original)
+            return list(items)
+
+        kept = []
+        used = 0
+        for item, cost in zip(items, costs):
+            if used + cost > limit:
+                break
+            kept.append(item)
+            used += cost
+        self._record(section, used, original, dropped=len(items) - len(kept))
+        return kept
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        return dict(self.usage)
+
+    def total(self) -> int:
+        return sum(u["tokens"] for u in self.usage.values())
+
+def compact_json(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def summarize_chain(item: Dict[str, Any], max_steps: int) -> Dict[str, Any]:
+    """
+    Shortens a thinking pool chain for the prompt: keeps the first step (the question)
+    and the latest `max_steps - 1` steps, replacing the middle with a marker.
+    The stored chain in PersonaManager is not modified.
+    """
+    content = item.get("content")
+    if not isinstance(content, list) or len(content) <= max_steps:
+        return item
+    omitted = len(content) - max_steps
+    summarized = dict(item)
+    summarized["content"] = [content[0], f"…（省略 {omitted} 步）…"] + content[-(max_steps - 1):]
+    return summarized
+
+def memory_priority(memory: Dict[str, Any]) -> tuple:
+    """Sort key for recalled memories: most important, then closest, first."""
+    importance = memory.get("importance") or 0
+    distance = memory.get("distance")
+    return (-importance, distance if distance is not None else 1.0)
+
+def dedupe_memories(memories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Recall and Associate often return the same objects; keep the first of each id/content."""
+    seen = set()
+    unique = []
+    for m in memories:
+        key = (m.get("id") or m.get("content")) if isinstance(m, dict) else str(m)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(m)
+    return unique
@@ -9,28 +9,55 @@ class AgentState(TypedDict):
     persona_prompt: str
     history_str: str
     perception_queue_str: str
+    perception_queue_version: int
     memories: List[Dict[str, Any]]
     thought_data: Dict[str, Any]
     output: str
+    latest_perception: str
+    prompt_tokens: Dict[str, Any]
+    action_dispatcher: Any
+    resume_stage: str
 
-def create_graph(agent_instance):
+def _agent_node(method_name: str):
+    # The compiled graph is shared by all agents; each run passes its agent
+    # in config["configurable"]["agent"].
+    async def node(state: AgentState, config):
+        agent_instance = config["configurable"]["agent"]
+        return await getattr(agent_instance, method_name)(state)
+    node.__name__ = method_name
+    return node
+
+def create_graph():
     """
     Creates the LangGraph for the agent.
     """
     graph = StateGraph(AgentState)
 
     # Define nodes
-    # We wrap the async methods to match LangGraph signature if needed, 
-    # but here we assume the agent_instance methods handle the signature.
-    
-    graph.add_node("observe", agent_instance.run_observe)
-    graph.add_node("think", agent_instance.run_think)
-    graph.add_node("act", agent_instance.run_act)
+    # Each node calls the matching method of the agent that runs the graph.
+    graph.add_node("observe", _agent_node("run_observe"))
+    graph.add_node("think", _agent_node("run_think"))
+    graph.add_node("act", _agent_node("run_act"))
     
     graph.add_edge("observe", "think")
     graph.add_edge("think", "act")
     graph.add_edge("act", END)
 
-    graph.set_entry_point("observe")
+    # A cycle normally starts at observe. When the previous cycle failed in think,
+    # the agent re-enters at think with the saved post-observe state instead of
+    # repeating perception (see AliceAgent._run_loop).
+    graph.set_conditional_entry_point(
+        lambda state: state.get("resume_stage") or "observe",
+        {"observe": "observe", "think": "think"}
+    )
 
     return graph.compile()
+
+_shared_graph = None
+
+def shared_graph():
+    """The compiled graph, built once per process and shared by all agents."""
+    global _shared_graph
+    if _shared_graph is None:
+        _shared_graph = create_graph()
+    return _shared_graph
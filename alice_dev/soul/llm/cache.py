@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from config.settings import settings
+
+class ResponseCache:
+    """
+    Two-level cache for LLM completions: an in-memory LRU in front of a SQLite table.
+    Entries expire after `ttl` seconds; the table is trimmed to `max_entries`
+    (least recently used first). Only used by call sites that opt in.
+    """
+    def __init__(self, path: str = None, ttl: float = None, max_entries: int = None, memory_entries: int = None):
+        self.path = path or settings.LLM_CACHE_PATH
+        self.ttl = ttl if ttl is not None else settings.LLM_CACHE_TTL
+        self.max_entries = max_entries if max_entries is not None else settings.LLM_CACHE_MAX_ENTRIES
+        self.memory_entries = memory_entries if memory_entries is not None else settings.LLM_CACHE_MEMORY_ENTRIES
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, content)
+        self._conn: Optional[sqlite3.Connection] = None
+        # The connection is shared by to_thread workers; creation and every statement are serialized
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, content TEXT, expires_at REAL, last_used REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: str, expires_at: float, content: str):
+        self._memory[key] = (expires_at, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            now = time.time()
+            db = self._db()
+            row = db.execute("SELECT content, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                db.commit()
+                return None
+            db.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            db.commit()
+            return row[0], row[1]
+
+    def _disk_set(self, key: str, content: str, expires_at: float):
+        with self._lock:
+            now = time.time()
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, content, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, content, expires_at, now)
+            )
+            # Evict expired entries, then the least recently used beyond the size limit
+            db.execute("DELETE FROM llm_cache WHERE expires_at < ?", (now,))
+            db.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            db.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry:
+            if entry[0] >= time.time():
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._memory[key]
+
+        try:
+            row = await asyncio.to_thread(self._disk_get, key)
+        except Exception as e:
+            print(f"ResponseCache read error: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        content, expires_at = row
+        self._remember(key, expires_at, content)
+        self.hits += 1
+        return content
+
+    async def set(self, key: str, content: str):
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, content)
+        try:
+            await asyncio.to_thread(self._disk_set, key, content, expires_at)
+        except Exception as e:
+            print(f"ResponseCache write error: {e}")
+
+# Global instance (shared by all agents)
+response_cache = ResponseCache()
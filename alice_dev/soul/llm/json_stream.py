@@ -0,0 +1,199 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+class StreamingJSONParser:
+    """
+    Incremental parser for a JSON object arriving in chunks from a streaming LLM call.
+
+    It tracks the JSON structure character by character (without building the whole
+    document) and reports, for the top-level array `items_key`:
+      ("item", index, item)            when an element is complete
+      ("delta", index, fields, text)   new decoded text of the string at `stream_path`
+                                       inside an element (e.g. parameters.content),
+                                       while it is still being generated; `fields` are
+                                       the element's string fields seen so far (e.g. name)
+      ("delta_end", index, fields)     when that string is closed
+
+    Text before the root object (```json fences, <think>...</think> blocks) is skipped.
+    """
+    def __init__(self, items_key: str = "action_queue", stream_path: Tuple[str, ...] = ("parameters", "content")):
+        self.items_key = items_key
+        self.stream_path = tuple(stream_path)
+        self.buffer = ""        # Raw text from the root '{' onwards
+        self.prefix = ""        # Text before the root object
+        self.started = False
+        self.finished = False
+        self.emitted = 0
+
+        # Parser state
+        self._pos = 0
+        self._stack: List[Dict[str, Any]] = []  # {"type": "obj"/"arr", "key", "index", "start", "fields"}
+        self._in_string = False
+        self._escape = False
+        self._unicode_left = 0
+        self._string_start = 0
+        self._string_safe = 0
+        self._expect_key = False
+        self._events: List[tuple] = []
+
+        # Streamed string state
+        self._streaming = False
+        self._stream_from = 0   # Raw position up to which text has been reported
+
+    def _find_root(self, text: str) -> Optional[str]:
+        self.prefix += text
+        # Reasoning models may wrap their reasoning (which can contain braces) in <think> tags
+        think_open = self.prefix.find("<think>")
+        search_from = 0
+        if think_open != -1:
+            think_close = self.prefix.find("</think>", think_open)
+            if think_close == -1:
+                return None
+            search_from = think_close + len("</think>")
+        start = self.prefix.find("{", search_from)
+        if start == -1:
+            return None
+        self.started = True
+        rest = self.prefix[start:]
+        self.prefix = self.prefix[:start]
+        return rest
+
+    def feed(self, chunk: str) -> List[tuple]:
+        """Consumes a chunk and returns the events it completes (see class docstring)."""
+        if self.finished or not chunk:
+            return []
+        if not self.started:
+            chunk = self._find_root(chunk)
+            if chunk is None:
+                return []
+
+        self.buffer += chunk
+        self._events = []
+        while self._pos < len(self.buffer) and not self.finished:
+            self._step(self.buffer[self._pos])
+            self._pos += 1
+
+        # Report what has been generated of the streamed string so far
+        if self._streaming:
+            delta = self._decode_stream(self._pos)
+            if delta:
+                self._events.append(("delta", self._item_index(), self._item_fields(), delta))
+        return self._events
+
+    def _in_items(self) -> bool:
+        return len(self._stack) >= 2 and self._stack[0]["key"] == self.items_key and self._stack[1]["type"] == "arr"
+
+    def _item_index(self) -> int:
+        return self._stack[1]["index"]
+
+    def _item_fields(self) -> Dict[str, Any]:
+        return dict(self._stack[2]["fields"])
+
+    def _at_stream_path(self) -> bool:
+        # root obj -> items arr -> item obj -> stream_path objects...
+        depth = 2 + len(self.stream_path)
+        if len(self._stack) != depth or not self._in_items():
+            return False
+        keys = tuple(frame["key"] for frame in self._stack[2:])
+        return keys == self.stream_path and all(frame["type"] == "obj" for frame in self._stack[2:])
+
+    def _decode_stream(self, end: int) -> str:
+        # Only decode up to a position that is not inside an escape sequence
+        end = min(end, self._string_safe)
+        if end <= self._stream_from:
+            return ""
+        raw = self.buffer[self._stream_from:end]
+        try:
+            text = json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            return ""
+        # Hold back the first half of a surrogate pair until the second arrives
+        if text and "\ud800" <= text[-1] <= "\udbff":
+            end -= 6
+            text = text[:-1]
+        self._stream_from = end
+        return text
+
+    def _step(self, ch: str):
+        if self._in_string:
+            if self._unicode_left:
+                self._unicode_left -= 1
+            elif self._escape:
+                self._escape = False
+                if ch == "u":
+                    self._unicode_left = 4
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._close_string()
+                return
+            if not self._escape and not self._unicode_left:
+                self._string_safe = self._pos + 1
+            return
+
+        if ch == '"':
+            self._in_string = True
+            self._string_start = self._pos
+            self._string_safe = self._pos + 1
+            if not self._expect_key and self._at_stream_path():
+                self._streaming = True
+                self._stream_from = self._pos + 1
+        elif ch == "{":
+            self._stack.append({"type": "obj", "key": None, "index": None, "start": self._pos, "fields": {}})
+            self._expect_key = True
+        elif ch == "[":
+            self._stack.append({"type": "arr", "key": None, "index": 0, "start": self._pos, "fields": {}})
+            self._expect_key = False
+        elif ch == ":":
+            self._expect_key = False
+        elif ch == ",":
+            if self._stack:
+                frame = self._stack[-1]
+                if frame["type"] == "arr":
+                    frame["index"] += 1
+                else:
+                    self._expect_key = True
+        elif ch in "}]":
+            if not self._stack:
+                return
+            frame = self._stack.pop()
+            if not self._stack:
+                self.finished = True
+                return
+            parent = self._stack[-1]
+            self._expect_key = False
+            # An element of the top-level items array just closed
+            if ch == "}" and len(self._stack) == 2 and parent["type"] == "arr" and self._in_items():
+                try:
+                    item = json.loads(self.buffer[frame["start"]:self._pos + 1])
+                except json.JSONDecodeError:
+                    return
+                self.emitted += 1
+                self._events.append(("item", parent["index"], item))
+
+    def _close_string(self):
+        self._in_string = False
+        frame = self._stack[-1] if self._stack else None
+        if frame is None or frame["type"] != "obj":
+            return
+
+        if self._expect_key:
+            try:
+                frame["key"] = json.loads(self.buffer[self._string_start:self._pos + 1])
+            except json.JSONDecodeError:
+                frame["key"] = None
+            return
+
+        # Remember string fields of items (e.g. "name") so deltas can be attributed
+        if len(self._stack) == 3 and self._in_items():
+            try:
+                frame["fields"][frame["key"]] = json.loads(self.buffer[self._string_start:self._pos + 1])
+            except json.JSONDecodeError:
+                pass
+
+        if self._streaming:
+            self._streaming = False
+            delta = self._decode_stream(self._pos)
+            if delta:
+                self._events.append(("delta", self._item_index(), self._item_fields(), delta))
+            self._events.append(("delta_end", self._item_index(), self._item_fields()))
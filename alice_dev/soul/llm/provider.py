@@ -1,9 +1,20 @@
 import os
+import time
+import random
+import heapq
+import asyncio
+import itertools
 import litellm
 import warnings
-from litellm import acompletion
-from typing import List, Dict, Any, AsyncGenerator
+from collections import deque
+from contextlib import asynccontextmanager
+from litellm import acompletion, aembedding
+from typing import List, Dict, Any, AsyncGenerator, Optional, Callable
 from config.settings import settings
+from .cache import response_cache
+from .usage import usage_tracker, estimate_cost, count_tokens
+from ..metrics import LLM_QUEUE_WAIT_SECONDS
+from ..tracing import tracer
 
 # Suppress Pydantic serializer warnings from litellm internals
 warnings.filterwarnings("ignore", message=".*Pydantic serializer warnings.*")
@@ -13,100 +24,456 @@ warnings.filterwarnings("ignore", category=RuntimeWarning, message=".*BaseLLMHTT
 # Configure litellm to drop unsupported parameters
 litellm.drop_params = True
 
+# Request priorities: lower runs first. Cycles triggered by user input go ahead of
+# idle continuous-thinking cycles when an endpoint is saturated.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_IDLE = 10
+
+def priority_name(priority: int) -> str:
+    return {PRIORITY_INTERACTIVE: "interactive", PRIORITY_IDLE: "idle"}.get(priority, str(priority))
+
+class _EndpointGate:
+    """Concurrency cap for one endpoint; waiters are admitted by (priority, arrival order)."""
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters: List[tuple] = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter (active count unchanged)
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+class _LeaderCancelled(Exception):
+    """Set on a coalesced call whose leader was cancelled; followers then run their own call."""
+
+class LLMScheduler:
+    """
+    Process-wide scheduler shared by every agent's LLMProvider:
+    - per-endpoint concurrency caps (settings.LLM_MAX_CONCURRENCY / LLM_ENDPOINT_CONCURRENCY)
+    - priority admission (interactive before idle) when an endpoint is full
+    - coalescing: identical completion requests already in flight share one call
+    Queue-wait metrics are available from `snapshot()`.
+    """
+    def __init__(self):
+        self._gates: Dict[str, _EndpointGate] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    def _gate(self, endpoint: str) -> _EndpointGate:
+        gate = self._gates.get(endpoint)
+        if gate is None:
+            limit = settings.LLM_ENDPOINT_CONCURRENCY.get(endpoint, settings.LLM_MAX_CONCURRENCY)
+            gate = self._gates[endpoint] = _EndpointGate(limit)
+        return gate
+
+    def _record_wait(self, endpoint: str, priority: int, wait: float):
+        m = self.metrics.setdefault(endpoint, {"requests": 0, "coalesced": 0, "waits": {}})
+        m["requests"] += 1
+        waits = m["waits"].setdefault(priority, {"count": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=200)})
+        waits["count"] += 1
+        waits["total"] += wait
+        waits["max"] = max(waits["max"], wait)
+        waits["recent"].append(wait)
+        LLM_QUEUE_WAIT_SECONDS.labels(endpoint=endpoint, priority=priority_name(priority)).observe(wait)
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str, priority: int = PRIORITY_INTERACTIVE):
+        gate = self._gate(endpoint)
+        queued_at = time.monotonic()
+        await gate.acquire(priority)
+        self._record_wait(endpoint, priority, time.monotonic() - queued_at)
+        try:
+            yield
+        finally:
+            gate.release()
+
+    async def run(self, endpoint: str, priority: int, key: Optional[str], call):
+        """
+        Runs `call()` inside an endpoint slot; concurrent calls with the same key share the result.
+        Only results and ordinary exceptions are shared: when the leading call is cancelled
+        (its agent stopped), the followers retry with their own call.
+        """
+        while key is not None and key in self._inflight:
+            self.metrics.setdefault(endpoint, {"requests": 0, "coalesced": 0, "waits": {}})["coalesced"] += 1
+            try:
+                return await asyncio.shield(self._inflight[key])
+            except _LeaderCancelled:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self._inflight[key] = future
+        try:
+            async with self.slot(endpoint, priority):
+                result = await call()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Only followers observe this; avoid "exception was never retrieved" warnings
+            future.exception()
+            raise
+        except BaseException:
+            # Cancellation of this caller must not cancel the followers
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        finally:
+            if key is not None and self._inflight.get(key) is future:
+                self._inflight.pop(key)
+
+    def snapshot(self) -> Dict[str, Any]:
+        result = {}
+        for endpoint, gate in self._gates.items():
+            m = self.metrics.get(endpoint, {"requests": 0, "coalesced": 0, "waits": {}})
+            waits = {}
+            for priority, w in m["waits"].items():
+                recent = sorted(w["recent"])
+                waits[priority_name(priority)] = {
+                    "count": w["count"],
+                    "avg_wait": w["total"] / w["count"] if w["count"] else 0.0,
+                    "max_wait": w["max"],
+                    "p95_wait": recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+                }
+            result[endpoint] = {
+                "limit": gate.limit,
+                "active": gate.active,
+                "queued": gate.queued,
+                "in_flight_keys": len(self._inflight),
+                "requests": m["requests"],
+                "coalesced": m["coalesced"],
+                "queue_wait": waits
+            }
+        return result
+
+# Global instance (one scheduler per process, shared by all agents)
+llm_scheduler = LLMScheduler()
+
+# =============================================================================
+# Timeout / retry / fallback policy
+# =============================================================================
+
+# litellm exception classes (and HTTP statuses) worth retrying on the same model
+TRANSIENT_ERRORS = {
+    "Timeout", "TimeoutError", "APIConnectionError", "RateLimitError",
+    "ServiceUnavailableError", "InternalServerError", "APIError"
+}
+TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+def is_transient_error(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in TRANSIENT_ERRORS:
+        return True
+    return getattr(error, "status_code", None) in TRANSIENT_STATUS
+
+def should_retry(attempt: int, error: BaseException) -> bool:
+    return attempt < settings.LLM_MAX_RETRIES and is_transient_error(error)
+
+async def backoff(attempt: int, error: BaseException, model: str):
+    """Exponential backoff with jitter, so agents hit by the same brownout don't retry in lockstep."""
+    ceiling = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+    delay = random.uniform(ceiling / 2, ceiling)
+    print(f"LLM transient error on {model} ({type(error).__name__}: {error}); retry {attempt + 1}/{settings.LLM_MAX_RETRIES} in {delay:.1f}s")
+    await asyncio.sleep(delay)
+
+def normalize_model(model: str) -> str:
+    # Auto-fix model name for OpenAI Proxy (e.g. Yunwu, DeepSeek)
+    # If using OpenAI provider but model name doesn't start with 'openai/', prepend it.
+    # This forces litellm to use the OpenAI protocol for models like 'Doubao/...' or 'anthropic/...'
+    # Explicit 'ollama/' models (e.g. a local fallback) keep their own protocol.
+    if settings.LLM_PROVIDER == "openai" and not model.startswith(("openai/", "ollama/")):
+        return f"openai/{model}"
+    return model
+
+def endpoint_of(model: str, api_base: Optional[str]) -> str:
+    """Scheduler key: the API base URL, or the litellm provider prefix when none is set."""
+    if api_base:
+        return api_base.rstrip("/")
+    return model.split("/", 1)[0] if "/" in model else "default"
+
 class LLMProvider:
     def __init__(self, model: str = None, api_base: str = None, api_key: str = None):
         self.model = model or settings.LLM_MODEL
         self.api_base = api_base or settings.LLM_API_BASE
         self.api_key = api_key or settings.LLM_API_KEY
 
-    async def generate(self, messages: List[Dict[str, str]], model: str = None, api_base: str = None, api_key: str = None, **kwargs) -> str:
+    def _targets(self, model: str, api_base: str, api_key: str, fallbacks: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+        """The requested model followed by the fallback chain; missing fields inherit from the first."""
+        primary = {
+            "model": model or self.model,
+            "api_base": api_base or self.api_base,
+            "api_key": api_key or self.api_key
+        }
+        targets = [primary]
+        for fb in fallbacks or []:
+            target = {
+                "model": fb.get("model") or primary["model"],
+                "api_base": fb.get("api_base") or primary["api_base"],
+                "api_key": fb.get("api_key") or primary["api_key"]
+            }
+            if all(target != t for t in targets):
+                targets.append(target)
+        for t in targets:
+            t["model"] = normalize_model(t["model"])
+        return targets
 
-        # Merge default params if not provided? 
-        # Actually, the caller should provide params. 
-        # But for backward compatibility or ease of use, we might want defaults.
-        # However, since we are moving to explicit params in settings, let's rely on caller passing them.
-        
-        current_model = model or self.model
-        current_base = api_base or self.api_base
-        current_key = api_key or self.api_key
-        
-        # Auto-fix model name for OpenAI Proxy (e.g. Yunwu, DeepSeek)
-        # If using OpenAI provider but model name doesn't start with 'openai/', prepend it.
-        # This forces litellm to use the OpenAI protocol for models like 'Doubao/...' or 'anthropic/...'
-        if settings.LLM_PROVIDER == "openai" and not current_model.startswith("openai/"):
-            current_model = f"openai/{current_model}"
+    async def generate(self, messages: List[Dict[str, str]], model: str = None, api_base: str = None, api_key: str = None,
+                       cache: bool = False, priority: int = PRIORITY_INTERACTIVE, timeout: float = None,
+                       fallbacks: List[Dict[str, str]] = None, node: str = None, user_id: str = None,
+                       cache_validator: Optional[Callable[[str], None]] = None, **kwargs) -> str:
+        """
+        Chat completion. With cache=True the response is looked up in / stored to the
+        response cache, keyed by (model, api_base, messages, params). Only use it for
+        calls where replaying an earlier answer to the same prompt is acceptable.
+        `cache_validator(content)` raises ValueError for answers that must not be cached
+        (e.g. malformed structured output); such answers are returned but not stored.
+        Requests go through the process-wide scheduler (endpoint cap, `priority`, coalescing).
+
+        Each attempt is limited to `timeout` seconds (default settings.LLM_TIMEOUT); transient
+        errors are retried with jittered backoff, and once a model is exhausted the next
+        entry of `fallbacks` ({"model", "api_base", "api_key"}) is tried.
+
+        Tokens, latency and cost of every attempt are recorded in usage_tracker,
+        tagged with `node` and `user_id`.
+        """
+        targets = self._targets(model, api_base, api_key, fallbacks)
+        timeout = timeout if timeout is not None else settings.LLM_TIMEOUT
         
         # Debug logging
         if settings.ENABLE_LLM_LOGS:
             print(f"\n========== [LLM Request] ==========")
-            print(f"Model: {current_model}")
+            print(f"Model: {targets[0]['model']}")
             print(f"Messages: {messages}")
             print(f"===================================\n")
 
-        try:
-            response = await acompletion(
-                model=current_model,
-                messages=messages,
-                api_base=current_base,
-                api_key=current_key,
-                **kwargs
-            )
-            content = response.choices[0].message.content
-            
-            if settings.ENABLE_LLM_LOGS:
-                print(f"\n========== [LLM Response] ==========")
-                print(f"Model: {current_model}")
-                print(f"Content: {content}")
-                print(f"====================================\n")
-                
-            return content
-        except Exception as e:
-            error_msg = str(e)
-            print(f"LLM Generation Error: {error_msg}")
-            print(f"Params: model={current_model}, base={current_base}, key_configured={'Yes' if current_key else 'No'}")
-            
-            if "ServiceUnavailableError" in error_msg or "No available channels" in error_msg:
-                print("提示: 您的模型代理服务似乎无法处理此模型请求。请检查 docker-compose.yml 中的 OPENAI_MODEL_MAIN 配置是否正确，或联系您的 API 提供商。")
-            
-            # traceback.print_exc()
-            raise e
+        request_key = response_cache.make_key(targets[0]["model"], messages, {"api_base": targets[0]["api_base"], **kwargs})
+        if cache:
+            cached = await response_cache.get(request_key)
+            if cached is not None and not self._cacheable(cached, cache_validator):
+                cached = None
+            if cached is not None:
+                if settings.ENABLE_LLM_LOGS:
+                    print(f"[LLM Cache] Hit for {targets[0]['model']}")
+                usage_tracker.record(node, targets[0]["model"], user_id, cached=True)
+                return cached
+
+        last_error = None
+        for i, target in enumerate(targets):
+            key = request_key if i == 0 else response_cache.make_key(target["model"], messages, {"api_base": target["api_base"], **kwargs})
+
+            async def call(target=target):
+                started = time.monotonic()
+                with tracer.start_as_current_span("llm.generate", attributes={"llm.model": target["model"], "llm.node": node or "other"}) as span:
+                    try:
+                        response = await asyncio.wait_for(acompletion(
+                            model=target["model"],
+                            messages=messages,
+                            api_base=target["api_base"],
+                            api_key=target["api_key"],
+                            **kwargs
+                        ), timeout)
+                    except Exception:
+                        usage_tracker.record(node, target["model"], user_id, latency=time.monotonic() - started, ok=False)
+                        raise
+                    usage = getattr(response, "usage", None)
+                    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+                    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+                    span.set_attribute("llm.prompt_tokens", prompt_tokens)
+                    span.set_attribute("llm.completion_tokens", completion_tokens)
+                    usage_tracker.record(
+                        node, target["model"], user_id, prompt_tokens, completion_tokens,
+                        latency=time.monotonic() - started,
+                        cost=estimate_cost(target["model"], prompt_tokens, completion_tokens, response)
+                    )
+                    return response.choices[0].message.content
 
-    async def generate_stream(self, messages: List[Dict[str, str]], api_base: str = None, api_key: str = None, **kwargs) -> AsyncGenerator[str, None]:
-        # Check if we should add /no_think tag (default to True for backward compatibility)
+            for attempt in range(settings.LLM_MAX_RETRIES + 1):
+                try:
+                    content = await llm_scheduler.run(
+                        endpoint_of(target["model"], target["api_base"]), priority,
+                        key if settings.LLM_COALESCE_REQUESTS else None, call
+                    )
 
-        current_model = self.model
-        current_base = api_base or self.api_base
-        current_key = api_key or self.api_key
+                    if settings.ENABLE_LLM_LOGS:
+                        print(f"\n========== [LLM Response] ==========")
+                        print(f"Model: {target['model']}")
+                        print(f"Content: {content}")
+                        print(f"====================================\n")
+
+                    # Only answers of the requested model are cached
+                    if cache and content and i == 0 and self._cacheable(content, cache_validator):
+                        await response_cache.set(request_key, content)
+                    return content
+                except Exception as e:
+                    last_error = e
+                    if not should_retry(attempt, e):
+                        break
+                    await backoff(attempt, e, target["model"])
+
+            self._report_error(last_error, target)
+            if i + 1 < len(targets):
+                print(f"LLM falling back from {target['model']} to {targets[i + 1]['model']}")
+
+        raise last_error
+
+    @staticmethod
+    def _cacheable(content: str, validator: Optional[Callable[[str], None]]) -> bool:
+        if validator is None:
+            return True
+        try:
+            validator(content)
+            return True
+        except ValueError:
+            return False
+
+    def _report_error(self, error: Exception, target: Dict[str, str]):
+        error_msg = str(error) or type(error).__name__
+        print(f"LLM Generation Error: {error_msg}")
+        print(f"Params: model={target['model']}, base={target['api_base']}, key_configured={'Yes' if target['api_key'] else 'No'}")
+        
+        if "ServiceUnavailableError" in error_msg or "No available channels" in error_msg:
+            print("提示: 您的模型代理服务似乎无法处理此模型请求。请检查 docker-compose.yml 中的 OPENAI_MODEL_MAIN 配置是否正确，或联系您的 API 提供商。")
 
-        # Auto-fix model name for OpenAI Proxy
-        if settings.LLM_PROVIDER == "openai" and not current_model.startswith("openai/"):
-            current_model = f"openai/{current_model}"
+    async def generate_stream(self, messages: List[Dict[str, str]], model: str = None, api_base: str = None, api_key: str = None,
+                              priority: int = PRIORITY_INTERACTIVE, timeout: float = None,
+                              fallbacks: List[Dict[str, str]] = None, node: str = None, user_id: str = None,
+                              **kwargs) -> AsyncGenerator[str, None]:
+        """
+        Streaming chat completion with the same timeout/retry/fallback policy as `generate`.
+        `timeout` bounds the wait for each chunk. Retries and fallbacks only happen before
+        the first token is yielded; a stream that breaks midway raises to the caller.
+        """
+        targets = self._targets(model, api_base, api_key, fallbacks)
+        timeout = timeout if timeout is not None else settings.LLM_TIMEOUT
 
         if settings.ENABLE_LLM_LOGS:
             print(f"\n========== [LLM Stream Request] ==========")
-            print(f"Model: {current_model}")
+            print(f"Model: {targets[0]['model']}")
             print(f"Messages: {messages}")
             print(f"==========================================\n")
 
-        response = await acompletion(
-            model=current_model,
-            messages=messages,
-            stream=True,
-            api_base=current_base,
-            api_key=current_key,
-            **kwargs
-        )
-        
-        full_content = ""
-        async for chunk in response:
-            if chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
+        last_error = None
+        for i, target in enumerate(targets):
+            for attempt in range(settings.LLM_MAX_RETRIES + 1):
+                full_content = ""
+                started = time.monotonic()
+                ttft = None
+                usage = None
+                # Not attached as the current span: a generator's context changes between yields
+                span = tracer.start_span("llm.generate_stream", attributes={"llm.model": target["model"], "llm.node": node or "other"})
+                try:
+                    # The endpoint slot is held until the stream is fully consumed (or closed)
+                    async with llm_scheduler.slot(endpoint_of(target["model"], target["api_base"]), priority):
+                        response = await asyncio.wait_for(acompletion(
+                            model=target["model"],
+                            messages=messages,
+                            stream=True,
+                            api_base=target["api_base"],
+                            api_key=target["api_key"],
+                            **kwargs
+                        ), timeout)
+
+                        chunks = response.__aiter__()
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                            except StopAsyncIteration:
+                                break
+                            # Some providers report usage on the final chunk
+                            usage = getattr(chunk, "usage", None) or usage
+                            if not chunk.choices:
+                                continue
+                            content = chunk.choices[0].delta.content
+                            if content:
+                                if ttft is None:
+                                    ttft = time.monotonic() - started
+                                    span.set_attribute("llm.ttft", ttft)
+                                full_content += content
+                                yield content
+                except Exception as e:
+                    span.record_exception(e)
+                    usage_tracker.record(node, target["model"], user_id, latency=time.monotonic() - started,
+                                         ttft=ttft, ok=False, stream=True)
+                    if full_content:
+                        # Tokens were already delivered; the caller has to deal with it
+                        raise
+                    last_error = e
+                    if not should_retry(attempt, e):
+                        break
+                    await backoff(attempt, e, target["model"])
+                    continue
+                finally:
+                    span.end()
+
+                prompt_tokens = getattr(usage, "prompt_tokens", 0) or count_tokens(target["model"], messages=messages)
+                completion_tokens = getattr(usage, "completion_tokens", 0) or count_tokens(target["model"], text=full_content)
+                usage_tracker.record(
+                    node, target["model"], user_id, prompt_tokens, completion_tokens,
+                    latency=time.monotonic() - started, ttft=ttft,
+                    cost=estimate_cost(target["model"], prompt_tokens, completion_tokens), stream=True
+                )
+
                 if settings.ENABLE_LLM_LOGS:
-                    full_content += content
-                yield content
-        
-        if settings.ENABLE_LLM_LOGS:
-            print(f"\n========== [LLM Stream Response] ==========")
-            print(f"Model: {current_model}")
-            print(f"Full Content: {full_content}")
-            print(f"===========================================\n")
+                    print(f"\n========== [LLM Stream Response] ==========")
+                    print(f"Model: {target['model']}")
+                    print(f"Full Content: {full_content}")
+                    print(f"===========================================\n")
+                return
+
+            self._report_error(last_error, target)
+            if i + 1 < len(targets):
+                print(f"LLM falling back from {target['model']} to {targets[i + 1]['model']}")
+
+        raise last_error
+
+    async def embed(self, texts: List[str], model: str = None, api_base: str = None, api_key: str = None,
+                    priority: int = PRIORITY_INTERACTIVE) -> List[List[float]]:
+        """Embeds a batch of texts. Returns one vector per input, in order."""
+        if not texts:
+            return []
+
+        current_model = model or settings.EMBEDDING_MODEL
+        current_base = api_base or settings.EMBEDDING_API_BASE
+        current_key = api_key or settings.EMBEDDING_API_KEY
+
+        try:
+            async with llm_scheduler.slot(endpoint_of(current_model, current_base), priority):
+                response = await aembedding(
+                    model=current_model,
+                    input=texts,
+                    api_base=current_base,
+                    api_key=current_key
+                )
+            # litellm returns plain dicts for most providers, objects for some
+            data = [d if isinstance(d, dict) else d.model_dump() for d in response.data]
+            data.sort(key=lambda d: d.get("index", 0))
+            return [d["embedding"] for d in data]
+        except Exception as e:
+            print(f"LLM Embedding Error: {e}")
+            print(f"Params: model={current_model}, base={current_base}")
+            raise e
@@ -0,0 +1,225 @@
+import json
+from typing import Dict, Any, List, Optional, Callable
+from config.settings import settings
+
+try:
+    import litellm
+except ImportError:
+    litellm = None
+
+# =============================================================================
+# JSON Schemas for structured output
+# =============================================================================
+
+PERCEPTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "association_params": {
+            "anyOf": [
+                {"type": "object", "properties": {"concept": {"type": "string"}}, "required": ["concept"]},
+                {"type": "null"}
+            ]
+        },
+        "recall_params": {
+            "anyOf": [
+                {"type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"]},
+                {"type": "null"}
+            ]
+        }
+    },
+    "required": ["summary", "association_params", "recall_params"]
+}
+
+def _number_map() -> Dict[str, Any]:
+    return {"type": "object", "additionalProperties": {"type": "number"}}
+
+def build_think_schema(action_schemas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    JSON schema of the think output contract (`state_update` + `action_queue`).
+    Each action_queue entry is constrained to a registered action name and its parameter names.
+    Parameter values are left untyped since actions only document them as text.
+    """
+    action_variants = []
+    for a in action_schemas:
+        action_variants.append({
+            "type": "object",
+            "properties": {
+                "name": {"const": a["name"]},
+                "parameters": {
+                    "type": "object",
+                    "properties": {p: {"description": desc} for p, desc in a.get("parameters", {}).items()},
+                    "additionalProperties": False
+                }
+            },
+            "required": ["name", "parameters"]
+        })
+
+    return {
+        "type": "object",
+        "properties": {
+            "state_update": {
+                "type": "object",
+                "properties": {
+                    "emotions": _number_map(),
+                    "desires": _number_map(),
+                    "intent": {
+                        "type": "object",
+                        "properties": {"short_term_goal": {"type": ["string", "null"]}}
+                    },
+                    "social": {
+                        "type": "object",
+                        "properties": {
+                            "intimacy": {"type": "number"},
+                            "trust": {"type": "number"},
+                            "stage": {"type": "string"},
+                            "summary": {"type": "string"}
+                        }
+                    }
+                }
+            },
+            "action_queue": {
+                "type": "array",
+                "items": {"anyOf": action_variants} if action_variants else {"type": "object"}
+            }
+        },
+        "required": ["state_update", "action_queue"]
+    }
+
+def response_format_for(model: str, schema: Dict[str, Any], name: str) -> Optional[Dict[str, Any]]:
+    """
+    Picks the strongest structured output mode the model supports (settings.STRUCTURED_OUTPUT):
+    'auto' uses a JSON schema where litellm reports support, else plain JSON mode.
+    """
+    mode = settings.STRUCTURED_OUTPUT
+    if mode == "off":
+        return None
+    if mode == "auto":
+        supported = False
+        if litellm:
+            try:
+                supported = litellm.supports_response_schema(model=model)
+            except Exception:
+                supported = False
+        mode = "json_schema" if supported else "json_object"
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+    return {"type": "json_object"}
+
+# =============================================================================
+# Parsing, validation and repair
+# =============================================================================
+
+class ParseStats:
+    """Counts structured output parse results per node, to track the failure rate."""
+    def __init__(self):
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, node: str, outcome: str):
+        node_counts = self.counts.setdefault(node, {"ok": 0, "repaired": 0, "failed": 0})
+        node_counts[outcome] += 1
+
+    def failure_rate(self, node: str) -> float:
+        c = self.counts.get(node)
+        if not c:
+            return 0.0
+        total = c["ok"] + c["repaired"] + c["failed"]
+        return c["failed"] / total if total else 0.0
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {node: {**c, "failure_rate": self.failure_rate(node)} for node, c in self.counts.items()}
+
+parse_stats = ParseStats()
+
+def extract_json(text: str) -> Dict[str, Any]:
+    """Parses the JSON object in a model response. Raises ValueError with a specific reason."""
+    if not isinstance(text, str):
+        if isinstance(text, dict):
+            return text
+        text = str(text)
+    # Skip reasoning blocks that may contain braces
+    if "</think>" in text:
+        text = text.split("</think>", 1)[1]
+    start = text.find("{")
+    end = text.rfind("}") + 1
+    if start == -1 or end <= start:
+        raise ValueError("no JSON object found in the output")
+    try:
+        data = json.loads(text[start:end])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("top-level JSON value must be an object")
+    return data
+
+def make_think_validator(action_names: List[str]) -> Callable[[Dict[str, Any]], None]:
+    """
+    Validator for the think output. Items naming an unknown action are dropped from
+    `action_queue` (names compared case-insensitively, like ActionRegistry.get_action)
+    instead of failing the whole response.
+    """
+    known = {name.lower() for name in action_names}
+
+    def validate(data: Dict[str, Any]):
+        if "state_update" in data and not isinstance(data["state_update"], dict):
+            raise ValueError("`state_update` must be an object")
+        queue = data.get("action_queue", [])
+        if not isinstance(queue, list):
+            raise ValueError("`action_queue` must be an array")
+        kept = []
+        for i, item in enumerate(queue):
+            if not isinstance(item, dict) or not isinstance(item.get("name"), str):
+                raise ValueError(f"action_queue[{i}] must be an object with a string `name`")
+            params = item.get("parameters", {})
+            if params is not None and not isinstance(params, dict):
+                raise ValueError(f"action_queue[{i}].parameters must be an object")
+            if known and item["name"].lower() not in known:
+                print(f"[think] Dropping unknown action '{item['name']}'")
+                continue
+            kept.append(item)
+        if "action_queue" in data:
+            data["action_queue"] = kept
+    return validate
+
+def validate_perception(data: Dict[str, Any]):
+    if not isinstance(data.get("summary", ""), str):
+        raise ValueError("`summary` must be a string")
+    for key, field in (("association_params", "concept"), ("recall_params", "query")):
+        value = data.get(key)
+        if value is not None and not isinstance(value, dict):
+            raise ValueError(f"`{key}` must be an object with `{field}` or null")
+
+REPAIR_PROMPT = "你上一次的输出无法解析：{error}。请只输出修正后的完整 JSON，不要包含任何其他内容。"
+
+async def parse_with_repair(llm, messages: List[Dict[str, str]], response_text: str, node: str,
+                            validator: Callable[[Dict[str, Any]], None] = None, **generate_kwargs) -> Optional[Dict[str, Any]]:
+    """
+    Parses and validates a structured response. On failure, asks the model once to fix
+    its own output, pointing at the specific error. Returns None if the repair fails too.
+    """
+    try:
+        data = extract_json(response_text)
+        if validator:
+            validator(data)
+        parse_stats.record(node, "ok")
+        return data
+    except ValueError as e:
+        error = str(e)
+    print(f"[{node}] Structured output error: {error}. Attempting repair.")
+
+    repair_messages = messages + [
+        {"role": "assistant", "content": str(response_text)[-4000:]},
+        {"role": "user", "content": REPAIR_PROMPT.format(error=error)}
+    ]
+    try:
+        repaired_text = await llm.generate(repair_messages, **generate_kwargs)
+        data = extract_json(repaired_text)
+        if validator:
+            validator(data)
+        parse_stats.record(node, "repaired")
+        return data
+    except Exception as e:
+        print(f"[{node}] Repair failed: {e}")
+        parse_stats.record(node, "failed")
+        print(f"[{node}] Parse failure rate: {parse_stats.failure_rate(node):.1%}")
+        return None
@@ -0,0 +1,180 @@
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+from config.settings import settings
+from ..metrics import LLM_REQUEST_SECONDS, LLM_TOKENS, LLM_ERRORS
+
+try:
+    import litellm
+except ImportError:
+    litellm = None
+
+GROUP_FIELDS = ("node", "model", "user_id")
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, response: Any = None) -> float:
+    """
+    USD cost of a call. settings.LLM_PRICING ({model: [input_per_1k, output_per_1k]}) wins,
+    so local/proxy models litellm doesn't know can be priced; otherwise litellm's price table.
+    """
+    pricing = settings.LLM_PRICING.get(model) or settings.LLM_PRICING.get(model.split("/", 1)[-1])
+    if pricing:
+        return prompt_tokens / 1000 * pricing[0] + completion_tokens / 1000 * pricing[1]
+    if litellm:
+        try:
+            if response is not None:
+                return float(litellm.completion_cost(completion_response=response) or 0.0)
+            prompt_cost, completion_cost = litellm.cost_per_token(
+                model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+            )
+            return float(prompt_cost + completion_cost)
+        except Exception:
+            pass
+    return 0.0
+
+def count_tokens(model: str, messages: List[Dict[str, str]] = None, text: str = None) -> int:
+    """Token estimate for streams that don't report usage."""
+    if litellm:
+        try:
+            if messages is not None:
+                return litellm.token_counter(model=model, messages=messages)
+            return litellm.token_counter(model=model, text=text or "")
+        except Exception:
+            pass
+    if messages is not None:
+        text = "".join(str(m.get("content", "")) for m in messages)
+    return len(text or "") // 2
+
+class UsageTracker:
+    """
+    Records tokens, latency, time-to-first-token and estimated cost of every LLM call,
+    tagged with node (perception/think/...), model and user_id.
+    Recent calls are kept for rolling-window summaries (settings.USAGE_RETENTION seconds);
+    lifetime totals per (node, model, user_id) are kept separately.
+    """
+    def __init__(self, retention: float = None, max_records: int = None):
+        self.retention = retention if retention is not None else settings.USAGE_RETENTION
+        self.records: deque = deque(maxlen=max_records or settings.USAGE_MAX_RECORDS)
+        self.totals: Dict[tuple, Dict[str, Any]] = {}
+        self.started_at = time.time()
+
+    def record(self, node: Optional[str], model: str, user_id: Optional[str],
+               prompt_tokens: int = 0, completion_tokens: int = 0,
+               latency: float = 0.0, ttft: Optional[float] = None, cost: float = 0.0,
+               ok: bool = True, cached: bool = False, stream: bool = False):
+        entry = {
+            "time": time.time(),
+            "node": node or "other",
+            "model": model,
+            "user_id": user_id or "-",
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "latency": latency,
+            "ttft": ttft if ttft is not None else latency,
+            "cost": cost or 0.0,
+            "ok": ok,
+            "cached": cached,
+            "stream": stream
+        }
+        self.records.append(entry)
+        self._prune(entry["time"])
+
+        # Prometheus counters (user_id is left out to keep label cardinality bounded)
+        if not ok:
+            LLM_ERRORS.labels(node=entry["node"], model=model).inc()
+        elif not cached:
+            LLM_REQUEST_SECONDS.labels(node=entry["node"], model=model).observe(latency)
+            LLM_TOKENS.labels(node=entry["node"], model=model, kind="prompt").inc(entry["prompt_tokens"])
+            LLM_TOKENS.labels(node=entry["node"], model=model, kind="completion").inc(entry["completion_tokens"])
+
+        key = tuple(entry[f] for f in GROUP_FIELDS)
+        total = self.totals.setdefault(key, self._empty())
+        self._add(total, entry)
+
+    def _prune(self, now: float):
+        while self.records and now - self.records[0]["time"] > self.retention:
+            self.records.popleft()
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {
+            "calls": 0, "errors": 0, "cached": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+            "latency_total": 0.0, "ttft_total": 0.0
+        }
+
+    @staticmethod
+    def _add(agg: Dict[str, Any], entry: Dict[str, Any]):
+        agg["calls"] += 1
+        if not entry["ok"]:
+            agg["errors"] += 1
+        if entry["cached"]:
+            agg["cached"] += 1
+        agg["prompt_tokens"] += entry["prompt_tokens"]
+        agg["completion_tokens"] += entry["completion_tokens"]
+        agg["cost"] += entry["cost"]
+        agg["latency_total"] += entry["latency"]
+        agg["ttft_total"] += entry["ttft"]
+
+    @staticmethod
+    def _finish(agg: Dict[str, Any], latencies: List[float] = None) -> Dict[str, Any]:
+        calls = agg["calls"] or 1
+        result = {
+            "calls": agg["calls"],
+            "errors": agg["errors"],
+            "cached": agg["cached"],
+            "prompt_tokens": agg["prompt_tokens"],
+            "completion_tokens": agg["completion_tokens"],
+            "cost": round(agg["cost"], 6),
+            "avg_latency": agg["latency_total"] / calls,
+            "avg_ttft": agg["ttft_total"] / calls
+        }
+        if latencies:
+            latencies = sorted(latencies)
+            result["p95_latency"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return result
+
+    def summary(self, window: float = None, group_by: List[str] = None, user_id: str = None) -> Dict[str, Any]:
+        """
+        Aggregates the calls of the last `window` seconds (default: whole retention)
+        grouped by any of node/model/user_id, e.g. group_by=["node"] for perception vs think.
+        """
+        now = time.time()
+        self._prune(now)
+        window = min(window or self.retention, self.retention)
+        group_by = [g for g in (group_by or ["node"]) if g in GROUP_FIELDS]
+
+        groups: Dict[str, Dict[str, Any]] = {}
+        latencies: Dict[str, List[float]] = {}
+        overall = self._empty()
+        for entry in self.records:
+            if now - entry["time"] > window:
+                continue
+            if user_id and entry["user_id"] != user_id:
+                continue
+            key = "|".join(str(entry[g]) for g in group_by) or "all"
+            self._add(groups.setdefault(key, self._empty()), entry)
+            latencies.setdefault(key, []).append(entry["latency"])
+            self._add(overall, entry)
+
+        elapsed = max(1.0, min(window, now - self.started_at))
+        total = self._finish(overall)
+        total["tokens_per_minute"] = (overall["prompt_tokens"] + overall["completion_tokens"]) / elapsed * 60
+        total["cost_per_hour"] = overall["cost"] / elapsed * 3600
+        return {
+            "window": window,
+            "group_by": group_by,
+            "total": total,
+            "groups": {k: self._finish(v, latencies.get(k)) for k, v in groups.items()}
+        }
+
+    def lifetime(self) -> List[Dict[str, Any]]:
+        return [
+            {**dict(zip(GROUP_FIELDS, key)), **self._finish(agg)}
+            for key, agg in self.totals.items()
+        ]
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return list(self.records)[-limit:]
+
+# Global instance (shared by all agents)
+usage_tracker = UsageTracker()
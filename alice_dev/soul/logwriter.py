@@ -0,0 +1,132 @@
+import os
+import gzip
+import glob
+import json
+import time
+import shutil
+import asyncio
+from datetime import datetime
+from typing import Any, List, Optional
+
+class AsyncLogWriter:
+    """
+    Append-only JSONL writer that keeps file I/O off the event loop.
+
+    `write()` never blocks: lines go into a bounded queue (dropped and counted when
+    full) and a background task writes them in batches from a worker thread.
+    The file is rotated when it exceeds `max_bytes` or gets older than `max_age`
+    seconds; rotated files are gzip-compressed and only the newest `backups` are kept.
+    """
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, max_age: float = 86400,
+                 backups: int = 10, compress: bool = True, queue_size: int = 1000,
+                 batch_size: int = 100, flush_interval: float = 1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.dropped = 0
+        # Incremented on every rotation (read by writers that mirror state into the file)
+        self.rotations = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._opened_at: Optional[float] = None
+
+    def write(self, entry: Any) -> bool:
+        """
+        Queues a line (str) or a JSON-serializable object. Safe to call from sync code on the loop.
+        Returns False if the line was dropped because the queue is full.
+        """
+        line = entry if isinstance(entry, str) else json.dumps(entry, ensure_ascii=False, default=str)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts): write directly
+            self._write_batch([line])
+            return True
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=self.queue_size)
+            self._task = loop.create_task(self._run())
+        try:
+            self._queue.put_nowait(line)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                print(f"AsyncLogWriter: queue full for {self.path}, dropped {self.dropped} lines so far")
+            return False
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                print(f"AsyncLogWriter: error writing {self.path}: {e}")
+            for _ in batch:
+                self._queue.task_done()
+
+    async def flush(self):
+        """Waits until everything queued so far is on disk."""
+        if self._queue is not None and self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # --- Runs in the worker thread ---
+
+    def _write_batch(self, lines: List[str]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._maybe_rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _maybe_rotate(self):
+        if not os.path.exists(self.path):
+            self._opened_at = time.time()
+            return
+        if self._opened_at is None:
+            self._opened_at = os.path.getmtime(self.path)
+        size = os.path.getsize(self.path)
+        too_big = self.max_bytes and size >= self.max_bytes
+        too_old = self.max_age and size > 0 and time.time() - self._opened_at >= self.max_age
+        if too_big or too_old:
+            self._rotate()
+
+    def _rotate(self):
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        os.replace(self.path, rotated)
+        self._opened_at = time.time()
+        self.rotations += 1
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        # Keep only the newest backups
+        old_files = sorted(glob.glob(f"{glob.escape(base)}.*{ext}*"))
+        for old in old_files[:-self.backups] if self.backups else old_files:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
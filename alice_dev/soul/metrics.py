@@ -0,0 +1,37 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Prometheus metrics of the agent loop, served by the backend at /metrics.
+# Metric objects are module-level so hot paths only pay for a label lookup + observe.
+
+# Latency buckets (seconds): LLM-bound stages run from ~0.1s to minutes
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CYCLE_SECONDS = Histogram(
+    "alice_cycle_seconds", "Duration of a full agent cycle (observe -> think -> act)",
+    buckets=STAGE_BUCKETS
+)
+CYCLE_ERRORS = Counter("alice_cycle_errors_total", "Agent cycles that raised an exception")
+NODE_SECONDS = Histogram(
+    "alice_node_seconds", "Duration of a graph node", ["node"],
+    buckets=STAGE_BUCKETS
+)
+
+ACTIONS_TOTAL = Counter("alice_actions_total", "Executed actions", ["action", "status"])
+ACTION_SECONDS = Histogram(
+    "alice_action_seconds", "Action execution time (excluding the display delay)", ["action"],
+    buckets=FAST_BUCKETS
+)
+
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "alice_llm_queue_wait_seconds", "Time an LLM request waited for an endpoint slot", ["endpoint", "priority"],
+    buckets=FAST_BUCKETS + (30, 60)
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "alice_llm_request_seconds", "LLM call latency", ["node", "model"],
+    buckets=STAGE_BUCKETS
+)
+LLM_TOKENS = Counter("alice_llm_tokens_total", "LLM tokens", ["node", "model", "kind"])
+LLM_ERRORS = Counter("alice_llm_errors_total", "Failed LLM call attempts", ["node", "model"])
+
+ACTIVE_AGENTS = Gauge("alice_active_agents", "Agents with a running thinking loop")
@@ -1,65 +1,32 @@
-from typing import Dict, Any, TYPE_CHECKING
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
 import asyncio
+import time
 from ..actions.executor import ActionExecutor
 from ..actions.registry import ActionRegistry
 from memory.store import WeaviateStore
 from memory.working_memory import WorkingMemory
 from ..utils import SYSTEM_RECALL_MSG
+from ..speech import SpeechStream
+from ..metrics import ACTIONS_TOTAL, ACTION_SECONDS
+from ..tracing import tracer
 
 if TYPE_CHECKING:
     from app.websockets.manager import ConnectionManager
 
 from ..persona.manager import PersonaManager
 
-async def act_node(state: Dict[str, Any], action_executor: ActionExecutor, connection_manager: "ConnectionManager", working_memory: WorkingMemory, persona: PersonaManager = None):
-    """
-    Executes the actions decided by the Think node.
-    """
-    thought_data = state.get("thought_data", {})
-    raw_action_queue = thought_data.get("action_queue", [])
-    user_id = state.get("user_id")
-    
-    # Enrich with status and ensure list copy
-    action_queue = []
-    for item in raw_action_queue:
-        # Create a copy to avoid modifying the original thought data in place if that matters, 
-        # but mainly to add status without affecting other things if shared.
-        new_item = item.copy()
-        new_item["status"] = "pending"
-        # Ensure parameters is a dict to prevent frontend crashes
-        if "parameters" not in new_item or new_item["parameters"] is None:
-            new_item["parameters"] = {}
-        action_queue.append(new_item)
-    
-    # 0. Broadcast Full Agent State (Sync with Frontend)
-    # This ensures that even if no actions are taken, the frontend receives the latest
-    # emotions, desires, and goals (including short_term_goal) updated by the Think node.
-    if connection_manager and user_id and persona:
-        current_state = persona.get_state()
-        # Map to frontend expected format
-        frontend_state = {
-            "emotions": current_state.get("emotions", {}),
-            "desires": current_state.get("desires", {}),
-            "goals": current_state.get("intent", {})
-        }
-        await connection_manager.send_event(user_id, {
-            "type": "agent_state",
-            "data": frontend_state
-        })
-
-    # 1. Broadcast Action Queue (Start)
-    if connection_manager and user_id and action_queue:
-        await connection_manager.send_event(user_id, {
-            "type": "action_queue_update",
-            "data": action_queue
-        })
-
-    if not action_queue:
-        return state
+def prepare_action_item(raw_item: Dict[str, Any]) -> Dict[str, Any]:
+    """Copies a raw action_queue entry from the Think node and adds its display status."""
+    # Create a copy to avoid modifying the original thought data in place if that matters, 
+    # but mainly to add status without affecting other things if shared.
+    item = dict(raw_item) if isinstance(raw_item, dict) else {"name": str(raw_item)}
+    item["status"] = "pending"
+    # Ensure parameters is a dict to prevent frontend crashes
+    if "parameters" not in item or item["parameters"] is None:
+        item["parameters"] = {}
+    return item
 
-    # Execute actions sequentially
-    results = []
-    
+def inject_action_context(state: Dict[str, Any], working_memory: WorkingMemory, persona: PersonaManager = None):
     # Inject persona into state for actions that need it (like Think)
     if persona:
         state["persona"] = persona
@@ -67,253 +34,399 @@ async def act_node(state: Dict[str, Any], action_executor: ActionExecutor, conne
     # Inject working_memory into state for actions that need it (like MinecraftPerception)
     if working_memory:
         state["working_memory"] = working_memory
+
+async def execute_action_item(item: Dict[str, Any], action_queue: List[Dict[str, Any]], state: Dict[str, Any], action_executor: ActionExecutor, connection_manager: "ConnectionManager", working_memory: WorkingMemory, persona: PersonaManager = None, speech_stream: Optional[SpeechStream] = None) -> Dict[str, Any]:
+    """
+    Executes a single action_queue item, feeds its result back into perception,
+    persists it and broadcasts it to the frontend. Returns the action result.
+    For `speak`, `speech_stream` carries text already streamed while it was generated.
+    """
+    user_id = state.get("user_id")
+
+    # Update status to executing
+    item["status"] = "executing"
+    if connection_manager and user_id:
+        await connection_manager.send_event(user_id, {
+            "type": "action_queue_update",
+            "data": action_queue
+        })
     
-    for i, item in enumerate(action_queue):
-        # Update status to executing
-        item["status"] = "executing"
-        if connection_manager and user_id:
-            await connection_manager.send_event(user_id, {
-                "type": "action_queue_update",
-                "data": action_queue
-            })
-        
-        # Add delay for visual effect
+    # Add delay for visual effect
+    with tracer.start_as_current_span("action.display_delay"):
         await asyncio.sleep(0.5)
-            
-        name = item.get("name")
-        params = item.get("parameters", {})
         
-        # Execute using registry
-        action = action_executor.registry.get_action(name)
-        res = {}
-        
-        if action:
+    name = item.get("name")
+    params = item.get("parameters", {})
+    
+    # Execute using registry
+    action = action_executor.registry.get_action(name)
+    res = {}
+    
+    if action:
+        started = time.monotonic()
+        with tracer.start_as_current_span(f"action.{name}", attributes={"action": name}) as span:
             try:
                 res = await action.execute(state, **params)
                 item["status"] = "completed"
                 item["result"] = res
             except Exception as e:
+                span.record_exception(e)
                 res = {"error": f"Failed to execute {name}: {str(e)}"}
                 item["status"] = "failed"
                 item["result"] = res
-        else:
-            res = {"error": f"Action {name} not found"}
-            item["status"] = "failed"
-            item["result"] = res
-            
-        results.append(res)
+            span.set_attribute("status", item["status"])
+        ACTION_SECONDS.labels(action=name).observe(time.monotonic() - started)
+    else:
+        res = {"error": f"Action {name} not found"}
+        item["status"] = "failed"
+        item["result"] = res
+    ACTIONS_TOTAL.labels(action=name if action else "unknown", status=item["status"]).inc()
 
-        # Add to perception queue so agent knows what it did
-        action_name = name
-        agent_name = state.get("agent_name", "Alice")
+    # Add to perception queue so agent knows what it did
+    action_name = name
+    agent_name = state.get("agent_name", "Alice")
+    
+    if "error" not in res:
+        # Include result summary in perception
+        result_summary = res.get("message", "")
         
-        if "error" not in res:
-            # Include result summary in perception
-            result_summary = res.get("message", "")
+        if "data" in res:
+            data = res["data"]
             
-            if "data" in res:
-                data = res["data"]
+            # 1. Handle List Data (Recall/Associate)
+            if isinstance(data, list):
+                # Try to extract content from memory objects
+                mem_texts = []
+                for mem in data:
+                    if hasattr(mem, 'properties'):
+                        mem_texts.append(mem.properties.get("content", ""))
+                    elif isinstance(mem, dict):
+                        mem_texts.append(mem.get("content", str(mem)))
+                    else:
+                        mem_texts.append(str(mem))
                 
-                # 1. Handle List Data (Recall/Associate)
-                if isinstance(data, list):
-                    # Try to extract content from memory objects
-                    mem_texts = []
-                    for item in data:
-                        if hasattr(item, 'properties'):
-                            mem_texts.append(item.properties.get("content", ""))
-                        elif isinstance(item, dict):
-                            mem_texts.append(item.get("content", str(item)))
-                        else:
-                            mem_texts.append(str(item))
-                    
-                    if mem_texts:
-                        # Limit to top 3 for summary
-                        summary_text = "; ".join(mem_texts[:3])
-                        if len(mem_texts) > 3:
-                            summary_text += f" ... ({len(mem_texts)-3} more)"
-                        result_summary += f"\n内容: {summary_text}"
+                if mem_texts:
+                    # Limit to top 3 for summary
+                    summary_text = "; ".join(mem_texts[:3])
+                    if len(mem_texts) > 3:
+                        summary_text += f" ... ({len(mem_texts)-3} more)"
+                    result_summary += f"\n内容: {summary_text}"
 
-                # 2. Handle String Data (Memorize)
-                elif isinstance(data, str):
-                     if action_name == "memorize":
-                         result_summary += f"\n内容: {data}"
+            # 2. Handle String Data (Memorize)
+            elif isinstance(data, str):
+                 if action_name == "memorize":
+                     result_summary += f"\n内容: {data}"
 
-                # 3. Handle Dict Data (Web/Code)
-                elif isinstance(data, dict):
-                    # Special handling for web browse to include title
-                    if "title" in data:
-                        result_summary += f" (Title: {data['title']})"
-                    
-                    # Special handling for web browse to include extracted links
-                    if "extracted_links" in data and data["extracted_links"]:
-                        links_str = "\n".join([f"- {link['text']}: {link['url']}" for link in data["extracted_links"][:5]]) # Limit to 5 for brevity in memory
-                        result_summary += f"\n发现链接:\n{links_str}"
-
-                    # Special handling for web browse to include content
-                    if "content" in data and data["content"]:
-                        # Limit content length to avoid overwhelming the context, though web.py already truncates to 2000
-                        content_preview = data["content"][:1000] + "..." if len(data["content"]) > 1000 else data["content"]
-                        result_summary += f"\n页面内容摘要:\n{content_preview}"
-                    
-                    # Special handling for code execution (Python/Bash) to include full output
-                    if "output" in data and data["output"]:
-                        # Avoid duplicating if message already contains it (simple check)
-                        if str(data["output"])[:50] not in result_summary:
-                            result_summary += f"\n执行输出:\n{data['output']}"
-                    
-                    if "error" in data and data["error"]:
-                        result_summary += f"\n执行错误:\n{data['error']}"
-            
-            # --- New Perception Logic ---
-            # 1. Action Itself -> Instant Memory (What I did)
-            # Skip for speak/think as they are internal/output only or handled elsewhere
-            if not action_name.startswith("think_") and action_name != "speak":
-                # Construct a natural language description of the action
-                # We can use the 'message' from the result which is usually "Alice is doing X..."
-                # Or construct it from name and params.
-                # The 'message' field in result is usually good: "Alice 正在回忆..."
-                action_desc = res.get("message", f"我执行了 {action_name}")
+            # 3. Handle Dict Data (Web/Code)
+            elif isinstance(data, dict):
+                # Special handling for web browse to include title
+                if "title" in data:
+                    result_summary += f" (Title: {data['title']})"
                 
-                # For memory actions, use the full result summary (which includes content) 
-                # so the agent immediately knows what it recalled/memorized without checking senses
-                if action_name in ["recall", "associate", "memorize"]:
-                    action_desc = result_summary
+                # Special handling for web browse to include extracted links
+                if "extracted_links" in data and data["extracted_links"]:
+                    links_str = "\n".join([f"- {link['text']}: {link['url']}" for link in data["extracted_links"][:5]]) # Limit to 5 for brevity in memory
+                    result_summary += f"\n发现链接:\n{links_str}"
 
-                working_memory.add_instant_memory(f"[自我行为] {action_desc}")
-
-            # 2. Action Result -> Senses (What happened)
-            # Skip for speak/think
-            if not action_name.startswith("think_") and action_name != "speak":
-                # Determine target sense based on action type
-                target_senses = ["sight"] # Default
+                # Special handling for web browse to include content
+                if "content" in data and data["content"]:
+                    # Limit content length to avoid overwhelming the context, though web.py already truncates to 2000
+                    content_preview = data["content"][:1000] + "..." if len(data["content"]) > 1000 else data["content"]
+                    result_summary += f"\n页面内容摘要:\n{content_preview}"
                 
-                if action_name in ["recall", "associate", "memorize", "think_add", "think_update", "think_complete"]:
-                    target_senses = ["mind"]
-                elif action_name in ["listen"]:
-                    target_senses = ["hearing"]
-                elif action_name in ["daze"]:
-                    target_senses = ["mind", "body"] # Daze affects energy (body) and mind
-                elif action_name in ["run_python", "run_bash", "browse_web"]:
-                    target_senses = ["sight"] # Code output and web pages are visual
+                # Special handling for code execution (Python/Bash) to include full output
+                if "output" in data and data["output"]:
+                    # Avoid duplicating if message already contains it (simple check)
+                    if str(data["output"])[:50] not in result_summary:
+                        result_summary += f"\n执行输出:\n{data['output']}"
                 
-                # Write result to senses
-                for sense in target_senses:
-                    working_memory.write_to_sense(sense, f"动作 {action_name} 的反馈: {result_summary}")
+                if "error" in data and data["error"]:
+                    result_summary += f"\n执行错误:\n{data['error']}"
+        
+        # --- New Perception Logic ---
+        # 1. Action Itself -> Instant Memory (What I did)
+        # Skip for speak/think as they are internal/output only or handled elsewhere
+        if not action_name.startswith("think_") and action_name != "speak":
+            # Construct a natural language description of the action
+            # We can use the 'message' from the result which is usually "Alice is doing X..."
+            # Or construct it from name and params.
+            # The 'message' field in result is usually good: "Alice 正在回忆..."
+            action_desc = res.get("message", f"我执行了 {action_name}")
+            
+            # For memory actions, use the full result summary (which includes content) 
+            # so the agent immediately knows what it recalled/memorized without checking senses
+            if action_name in ["recall", "associate", "memorize"]:
+                action_desc = result_summary
+
+            working_memory.add_instant_memory(f"[自我行为] {action_desc}")
+
+        # 2. Action Result -> Senses (What happened)
+        # Skip for speak/think
+        if not action_name.startswith("think_") and action_name != "speak":
+            # Determine target sense based on action type
+            target_senses = ["sight"] # Default
+            
+            if action_name in ["recall", "associate", "memorize", "think_add", "think_update", "think_complete"]:
+                target_senses = ["mind"]
+            elif action_name in ["listen"]:
+                target_senses = ["hearing"]
+            elif action_name in ["daze"]:
+                target_senses = ["mind", "body"] # Daze affects energy (body) and mind
+            elif action_name in ["run_python", "run_bash", "browse_web"]:
+                target_senses = ["sight"] # Code output and web pages are visual
+            
+            # Write result to senses
+            for sense in target_senses:
+                working_memory.write_to_sense(sense, f"动作 {action_name} 的反馈: {result_summary}")
+
+    # else:
+    #      # Error case
+    #      working_memory.add_instant_memory(f"[自我行为] 尝试执行 {action_name} 但失败了")
+    #      working_memory.write_to_sense("sight", f"错误信息: {res.get('error')}")
 
-        # else:
-        #      # Error case
-        #      working_memory.add_instant_memory(f"[自我行为] 尝试执行 {action_name} 但失败了")
-        #      working_memory.write_to_sense("sight", f"错误信息: {res.get('error')}")
+    # 2. Send to Frontend
+    if connection_manager and user_id:
+        if name == "speak":
+             # Send as speech
+             content = res.get("data", "")
+             
+             # Text streamed token by token during generation: just finish that response
+             streamed = speech_stream is not None and speech_stream.started
+             if speech_stream:
+                 await speech_stream.close()
 
-        # 2. Send to Frontend
-        if connection_manager and user_id:
-            if name == "speak":
-                 # Send as speech
-                 content = res.get("data", "")
+             # Only record and send if there's actual content and no error
+             if content and "error" not in res:
+                 # 1. Record in memory FIRST to ensure persistence
+                 working_memory.add_message("assistant", content, actionData=res)
                  
-                 # Only record and send if there's actual content and no error
-                 if content and "error" not in res:
-                     # 1. Record in memory FIRST to ensure persistence
-                     working_memory.add_message("assistant", content, actionData=res)
-                     
-                     # 2. Send to Frontend
+                 # 2. Send to Frontend
+                 if not streamed:
                      await connection_manager.send_event(user_id, {"type": "agent_response_start"})
                      await connection_manager.send_event(user_id, {
                         "type": "agent_stream",
                         "chunk": content
                      })
                      await connection_manager.send_event(user_id, {"type": "agent_response_end"})
-                 elif "error" in res:
-                     # Handle error case
-                     error_msg = res.get("error")
-                     working_memory.add_event("action_error", f"说话失败: {error_msg}", data=res)
-                     await connection_manager.send_event(user_id, {
-                        "type": "agent_action",
-                        "data": res
-                     })
+             elif "error" in res:
+                 # Handle error case
+                 error_msg = res.get("error")
+                 working_memory.add_event("action_error", f"说话失败: {error_msg}", data=res)
+                 await connection_manager.send_event(user_id, {
+                    "type": "agent_action",
+                    "data": res
+                 })
 
-            else:
-                # Send action result
-                if "message" in res:
-                    # Persist action event FIRST
-                    working_memory.add_event("action", res.get("message", ""), data=res)
-                    
-                    await connection_manager.send_event(user_id, {
-                        "type": "agent_action",
-                        "data": res
-                    })
+        else:
+            # Send action result
+            if "message" in res:
+                # Persist action event FIRST
+                working_memory.add_event("action", res.get("message", ""), data=res)
+                
+                await connection_manager.send_event(user_id, {
+                    "type": "agent_action",
+                    "data": res
+                })
+        
+        # Send updated queue (with completed/failed status)
+        await connection_manager.send_event(user_id, {
+            "type": "action_queue_update",
+            "data": action_queue
+        })
+        
+    # 3. Update State (if applicable)
+    if "state_update" in res:
+        updates = res["state_update"]
+        # Handle specific updates like working memory
+        if "working_memory_append" in updates:
+            current_memories = state.get("memories", [])
+            new_mems = updates["working_memory_append"]
+            # Update current state memories (for Write node if it uses them)
+            state["memories"] = current_memories + [m.properties for m in new_mems if hasattr(m, 'properties')]
             
-            # Send updated queue (with completed/failed status)
-            await connection_manager.send_event(user_id, {
+            # Persist to WorkingMemory for next turn
+            # We add a system note so the agent knows what it recalled
+            # Extract content from memories
+            mem_contents = [m.properties.get("content", "") for m in new_mems if hasattr(m, 'properties')]
+            if mem_contents:
+                note = SYSTEM_RECALL_MSG.format('; '.join(mem_contents))
+                # Also add to instant memory for immediate awareness
+                working_memory.add_instant_memory(f"[记忆检索] {note}")
+                # working_memory.add_message("system", note) # Optional: Keep in history if needed, but instant memory is better for "thought" context
+
+        if "emotions" in updates:
+            # This is tricky because PersonaManager manages emotions.
+            # We might need to pass PersonaManager to Act node too, or return updates to be applied.
+            # For now, let's just log it.
+            pass
+        
+        # Broadcast generic state update if present (e.g. thinking_pool from Think action)
+        # We filter out internal keys like working_memory_append
+        broadcast_updates = {k: v for k, v in updates.items() if k not in ["working_memory_append"]}
+        if broadcast_updates and connection_manager and user_id:
+             # If we have persona, we might want to get the full updated state to be safe, 
+             # or just trust the partial update.
+             # For thinking_pool, the Think action returns the full pool in 'intent' -> 'thinking_pool' structure if we map it right.
+             # But Think action returns {"intent": {"thinking_pool": ...}} in state_update?
+             # Let's check Think action implementation.
+             # It does: persona.update_state({"intent": {"thinking_pool": current_pool}})
+             # But it doesn't return that in state_update in my previous edit. I need to fix Think action.
+             
+             # Assuming Think action returns proper structure for frontend:
+             # Frontend expects agent_state event with data matching AgentState type.
+             # AgentState has goals: { thinking_pool: ... }
+             # So we need to map intent -> goals.
+             
+             frontend_update = {}
+             if "intent" in broadcast_updates:
+                 # CRITICAL FIX: Merge with existing goals to avoid overwriting short_term_goal with None
+                 # if the action update only contains thinking_pool
+                 if persona:
+                     current_intent = persona.get_state()["intent"]
+                     # We use the current full intent state, which includes the short_term_goal set by Think node
+                     frontend_update["goals"] = current_intent
+                 else:
+                     frontend_update["goals"] = broadcast_updates["intent"]
+             
+             if "emotions" in broadcast_updates:
+                 frontend_update["emotions"] = broadcast_updates["emotions"]
+                 
+             if "desires" in broadcast_updates:
+                 frontend_update["desires"] = broadcast_updates["desires"]
+             
+             if frontend_update:
+                await connection_manager.send_event(user_id, {
+                    "type": "agent_state",
+                    "data": frontend_update
+                })
+
+    return res
+
+class ActionDispatcher:
+    """
+    Executes actions as soon as a streaming Think call produces them.
+    Items are run one at a time, in the order they were submitted, by a worker task,
+    so the first action (typically `speak`) starts before the model has finished.
+    """
+    def __init__(self, state: Dict[str, Any], action_executor: ActionExecutor, connection_manager: "ConnectionManager", working_memory: WorkingMemory, persona: PersonaManager = None):
+        self.state = state
+        self.action_executor = action_executor
+        self.connection_manager = connection_manager
+        self.working_memory = working_memory
+        self.persona = persona
+        self.action_queue: List[Dict[str, Any]] = []
+        self.results: List[Dict[str, Any]] = []
+        self._pending: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        # Streamed speech, keyed by the item's index in the model's action_queue
+        self._speech: Dict[int, SpeechStream] = {}
+        inject_action_context(state, working_memory, persona)
+
+    @property
+    def submitted(self) -> int:
+        return len(self.action_queue)
+
+    def speech_delta(self, index: int, fields: Dict[str, Any], text: str):
+        """Forwards generated `speak` content for item `index` before the item is complete."""
+        if fields.get("name") != "speak":
+            return
+        stream = self._speech.get(index)
+        if stream is None:
+            stream = self._speech[index] = SpeechStream(self.connection_manager, self.state.get("user_id"))
+        stream.push(text)
+
+    async def submit(self, raw_item: Dict[str, Any], index: Optional[int] = None):
+        item = prepare_action_item(raw_item)
+        speech_stream = self._speech.pop(index, None) if index is not None else None
+        self.action_queue.append(item)
+        user_id = self.state.get("user_id")
+        if self.connection_manager and user_id:
+            await self.connection_manager.send_event(user_id, {
                 "type": "action_queue_update",
-                "data": action_queue
+                "data": self.action_queue
             })
-            
-        # 3. Update State (if applicable)
-        if "state_update" in res:
-            updates = res["state_update"]
-            # Handle specific updates like working memory
-            if "working_memory_append" in updates:
-                current_memories = state.get("memories", [])
-                new_mems = updates["working_memory_append"]
-                # Update current state memories (for Write node if it uses them)
-                state["memories"] = current_memories + [m.properties for m in new_mems if hasattr(m, 'properties')]
-                
-                # Persist to WorkingMemory for next turn
-                # We add a system note so the agent knows what it recalled
-                # Extract content from memories
-                mem_contents = [m.properties.get("content", "") for m in new_mems if hasattr(m, 'properties')]
-                if mem_contents:
-                    note = SYSTEM_RECALL_MSG.format('; '.join(mem_contents))
-                    # Also add to instant memory for immediate awareness
-                    working_memory.add_instant_memory(f"[记忆检索] {note}")
-                    # working_memory.add_message("system", note) # Optional: Keep in history if needed, but instant memory is better for "thought" context
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        await self._pending.put((item, speech_stream))
 
-            if "emotions" in updates:
-                # This is tricky because PersonaManager manages emotions.
-                # We might need to pass PersonaManager to Act node too, or return updates to be applied.
-                # For now, let's just log it.
-                pass
-            
-            # Broadcast generic state update if present (e.g. thinking_pool from Think action)
-            # We filter out internal keys like working_memory_append
-            broadcast_updates = {k: v for k, v in updates.items() if k not in ["working_memory_append"]}
-            if broadcast_updates and connection_manager and user_id:
-                 # If we have persona, we might want to get the full updated state to be safe, 
-                 # or just trust the partial update.
-                 # For thinking_pool, the Think action returns the full pool in 'intent' -> 'thinking_pool' structure if we map it right.
-                 # But Think action returns {"intent": {"thinking_pool": ...}} in state_update?
-                 # Let's check Think action implementation.
-                 # It does: persona.update_state({"intent": {"thinking_pool": current_pool}})
-                 # But it doesn't return that in state_update in my previous edit. I need to fix Think action.
-                 
-                 # Assuming Think action returns proper structure for frontend:
-                 # Frontend expects agent_state event with data matching AgentState type.
-                 # AgentState has goals: { thinking_pool: ... }
-                 # So we need to map intent -> goals.
-                 
-                 frontend_update = {}
-                 if "intent" in broadcast_updates:
-                     # CRITICAL FIX: Merge with existing goals to avoid overwriting short_term_goal with None
-                     # if the action update only contains thinking_pool
-                     if persona:
-                         current_intent = persona.get_state()["intent"]
-                         # We use the current full intent state, which includes the short_term_goal set by Think node
-                         frontend_update["goals"] = current_intent
-                     else:
-                         frontend_update["goals"] = broadcast_updates["intent"]
-                 
-                 if "emotions" in broadcast_updates:
-                     frontend_update["emotions"] = broadcast_updates["emotions"]
-                     
-                 if "desires" in broadcast_updates:
-                     frontend_update["desires"] = broadcast_updates["desires"]
-                 
-                 if frontend_update:
-                    await connection_manager.send_event(user_id, {
-                        "type": "agent_state",
-                        "data": frontend_update
-                    })
+    async def _run(self):
+        while True:
+            entry = await self._pending.get()
+            if entry is None:
+                break
+            item, speech_stream = entry
+            res = await execute_action_item(
+                item, self.action_queue, self.state, self.action_executor,
+                self.connection_manager, self.working_memory, self.persona,
+                speech_stream=speech_stream
+            )
+            self.results.append(res)
+
+    async def finish(self) -> List[Dict[str, Any]]:
+        """Waits for every submitted action to complete and returns their results."""
+        if self._worker:
+            await self._pending.put(None)
+            await self._worker
+        # Close speech whose action never completed (e.g. truncated output)
+        for stream in self._speech.values():
+            await stream.close()
+        self._speech.clear()
+        return self.results
+
+async def act_node(state: Dict[str, Any], action_executor: ActionExecutor, connection_manager: "ConnectionManager", working_memory: WorkingMemory, persona: PersonaManager = None):
+    """
+    Executes the actions decided by the Think node.
+    """
+    thought_data = state.get("thought_data", {})
+    raw_action_queue = thought_data.get("action_queue", [])
+    user_id = state.get("user_id")
+    
+    # 0. Broadcast Full Agent State (Sync with Frontend)
+    # This ensures that even if no actions are taken, the frontend receives the latest
+    # emotions, desires, and goals (including short_term_goal) updated by the Think node.
+    if connection_manager and user_id and persona:
+        current_state = persona.get_state()
+        # Map to frontend expected format
+        frontend_state = {
+            "emotions": current_state.get("emotions", {}),
+            "desires": current_state.get("desires", {}),
+            "goals": current_state.get("intent", {})
+        }
+        await connection_manager.send_event(user_id, {
+            "type": "agent_state",
+            "data": frontend_state
+        })
+
+    # Streaming Think: actions were already dispatched while the model was generating.
+    # Submit whatever the stream parser could not pick up, then wait for the rest.
+    dispatcher = state.get("action_dispatcher")
+    if dispatcher:
+        for raw_item in raw_action_queue[dispatcher.submitted:]:
+            await dispatcher.submit(raw_item)
+        state["action_results"] = await dispatcher.finish()
+        state["action_dispatcher"] = None
+        return state
+
+    # Enrich with status and ensure list copy
+    action_queue = [prepare_action_item(item) for item in raw_action_queue]
+
+    # 1. Broadcast Action Queue (Start)
+    if connection_manager and user_id and action_queue:
+        await connection_manager.send_event(user_id, {
+            "type": "action_queue_update",
+            "data": action_queue
+        })
+
+    if not action_queue:
+        return state
+
+    # Execute actions sequentially
+    results = []
+    inject_action_context(state, working_memory, persona)
+    
+    for item in action_queue:
+        res = await execute_action_item(item, action_queue, state, action_executor, connection_manager, working_memory, persona)
+        results.append(res)
 
     state["action_results"] = results
     return state
\ No newline at end of file
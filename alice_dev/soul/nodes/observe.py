@@ -3,11 +3,16 @@ import json
 from ..persona.manager import PersonaManager
 from memory.store import WeaviateStore
 from memory.working_memory import WorkingMemory
-from ..llm.provider import LLMProvider
+from ..llm.provider import LLMProvider, PRIORITY_INTERACTIVE, PRIORITY_IDLE
 from config.settings import settings
 from ..recorder import recorder
 from ..prompts import PERCEPTION_SYSTEM_PROMPT
 from ..actions.innate import Associate, Recall
+from ..budget import PromptBudget
+from ..llm.structured import PERCEPTION_SCHEMA, response_format_for, parse_with_repair, validate_perception, extract_json
+
+# Senses kept first when the senses section exceeds its token budget
+SENSE_PRIORITY = ["hearing", "mind", "sight", "touch", "smell", "taste"]
 
 async def observe_node(state: Dict[str, Any], memory_store: WeaviateStore, working_memory: WorkingMemory, llm: LLMProvider):
     """
@@ -34,6 +39,7 @@ async def observe_node(state: Dict[str, Any], memory_store: WeaviateStore, worki
 
     # 2. Process Senses (Summarize into Instant Memory)
     senses_data = working_memory.read_and_clear_senses()
+    raw_senses = senses_data
     
     # 强制活跃模式：即使没有新的感官输入，也进行感知处理，以维持意识流
     if not senses_data and settings.CONTINUOUS_THINKING:
@@ -43,9 +49,19 @@ async def observe_node(state: Dict[str, Any], memory_store: WeaviateStore, worki
 
     if senses_data:
         # Construct prompt for Perception Model
+        # Fit senses into the token budget: by sense priority, newest lines first
+        budget = PromptBudget(model=settings.PERCEPTION_MODEL)
+        ranked = sorted(
+            ((sense, i, line) for sense, lines in senses_data.items() for i, line in reversed(list(enumerate(lines)))),
+            key=lambda x: SENSE_PRIORITY.index(x[0]) if x[0] in SENSE_PRIORITY else len(SENSE_PRIORITY)
+        )
+        kept = set((sense, i) for sense, i, _ in budget.fit_items("senses", ranked, render=lambda x: f"- {x[2]}"))
+
         senses_text = ""
         for sense, lines in senses_data.items():
-            senses_text += f"\n[{sense.upper()}]\n" + "\n".join([f"- {line}" for line in lines])
+            kept_lines = [line for i, line in enumerate(lines) if (sense, i) in kept]
+            if kept_lines:
+                senses_text += f"\n[{sense.upper()}]\n" + "\n".join([f"- {line}" for line in kept_lines])
 
         system_prompt = PERCEPTION_SYSTEM_PROMPT.format(
             persona_prompt=persona_prompt,
@@ -61,21 +77,50 @@ async def observe_node(state: Dict[str, Any], memory_store: WeaviateStore, worki
         """
         
         messages = [{"role": "system", "content": system_prompt},{"role": "user", "content": user_prompt}]
+        token_usage = {"sections": budget.report(), "system_prompt": budget.count(system_prompt)}
+        state.setdefault("prompt_tokens", {})["perception"] = token_usage
         
-        response_text = await llm.generate(
-            messages, 
-            model=settings.PERCEPTION_MODEL,
-            api_base=settings.PERCEPTION_API_BASE,
-            api_key=settings.PERCEPTION_API_KEY,
-            response_format={"type": "json_object"},
+        generate_kwargs = {
+            "model": settings.PERCEPTION_MODEL,
+            "api_base": settings.PERCEPTION_API_BASE,
+            "api_key": settings.PERCEPTION_API_KEY,
+            "node": "perception",
+            "user_id": user_id,
+            # User-input cycles are scheduled ahead of idle continuous-thinking cycles
+            "priority": PRIORITY_INTERACTIVE if state.get("input") else PRIORITY_IDLE,
+            "timeout": settings.PERCEPTION_TIMEOUT,
+            "fallbacks": settings.PERCEPTION_FALLBACKS,
             **settings.PERCEPTION_MODEL_PARAMS
-        )
+        }
+        response_format = response_format_for(settings.PERCEPTION_MODEL, PERCEPTION_SCHEMA, "perception")
+        if response_format:
+            generate_kwargs["response_format"] = response_format
+
+        # Perception is near-deterministic, so identical prompts may reuse a cached answer
+        try:
+            # Only answers that pass validation are cached, so a malformed one isn't replayed
+            response_text = await llm.generate(
+                messages, cache=settings.PERCEPTION_CACHE,
+                cache_validator=lambda text: validate_perception(extract_json(text)), **generate_kwargs
+            )
+        except Exception:
+            # Put the senses back so the retried cycle still perceives them
+            for sense, lines in raw_senses.items():
+                for line in lines:
+                    working_memory.write_to_sense(sense, line)
+            raise
         
         # Log Perception
-        recorder.log_perception(messages, response_text, metadata={"user_id": user_id})
+        recorder.log_perception(messages, response_text, metadata={"user_id": user_id, "prompt_tokens": token_usage})
+
+        # Validate against the perception contract; one targeted repair attempt on failure
+        perception_result = await parse_with_repair(
+            llm, messages, response_text, node="perception", validator=validate_perception, **generate_kwargs
+        )
         
         try:
-            perception_result = json.loads(response_text)
+            if perception_result is None:
+                raise json.JSONDecodeError("Unrepairable perception output", str(response_text), 0)
             summary = perception_result.get("summary", "")
             association_params = perception_result.get("association_params")
             recall_params = perception_result.get("recall_params")
@@ -134,8 +179,10 @@ async def observe_node(state: Dict[str, Any], memory_store: WeaviateStore, worki
     #             working_memory.add_instant_memory(f"[{sense}] {line}")
     #     # working_memory.clear_buffer() # No longer needed as we read_and_clear_senses
 
-    # 3. Update State for Think Node
-    state["perception_queue_str"] = working_memory.get_instant_memory_string()
+    # 3. Update State for Think Node (only re-read when observing changed the queue)
+    if state.get("perception_queue_version") != working_memory.instant_version:
+        state["perception_queue_str"] = working_memory.get_instant_memory_string()
+        state["perception_queue_version"] = working_memory.instant_version
     # Pass the latest perception summary (if any) to the state so Think node can highlight it
     # If summary was generated, it's the last item in the queue.
     # If fallback was used, it's the last few items.
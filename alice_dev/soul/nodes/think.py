@@ -1,5 +1,7 @@
-from typing import Dict, Any
-from ..llm.provider import LLMProvider
+from typing import Dict, Any, Optional, TYPE_CHECKING
+from ..llm.provider import LLMProvider, PRIORITY_INTERACTIVE, PRIORITY_IDLE
+from ..llm.json_stream import StreamingJSONParser
+from ..llm.structured import build_think_schema, response_format_for, parse_with_repair, make_think_validator, parse_stats, extract_json
 from ..persona.manager import PersonaManager
 from ..prompts import (
     THINK_NODE_SYSTEM_PROMPT, 
@@ -7,15 +9,22 @@ from ..prompts import (
 )
 from ..utils import get_chinese_time_desc, USER_SILENT_MSG, DEFAULT_ERROR_RESPONSE
 from ..actions.registry import ActionRegistry
+from ..actions.retrieval import action_retriever
 from ..memory.metacognition import get_metacognitive_prompt
 import json
 from datetime import datetime
 from config.settings import settings
 from ..recorder import recorder
+from ..budget import PromptBudget, compact_json, summarize_chain, memory_priority, dedupe_memories
 
-async def think_node(state: Dict[str, Any], persona: PersonaManager, llm: LLMProvider, action_registry: ActionRegistry):
+if TYPE_CHECKING:
+    from .act import ActionDispatcher
+
+async def think_node(state: Dict[str, Any], persona: PersonaManager, llm: LLMProvider, action_registry: ActionRegistry, dispatcher: Optional["ActionDispatcher"] = None):
     """
     Reasoning loop. Updates persona state and decides next action.
+    If `dispatcher` is given, the completion is streamed and every action_queue
+    entry is dispatched as soon as it has been generated.
     """
     # Construct prompt with Persona + Context
     persona_state = persona.get_state()
@@ -36,8 +45,43 @@ async def think_node(state: Dict[str, Any], persona: PersonaManager, llm: LLMPro
     time_desc = get_chinese_time_desc()
     spatial_desc = DEFAULT_SPATIAL_DESC
 
+    # Format Thinking Pool
+    thinking_pool = persona_state['intent'].get('thinking_pool', [])
+
+    # Fit the variable-size sections into their token budgets
+    budget = PromptBudget(model=settings.THINKING_MODEL)
+
+    # Active chains first; long chains keep their question and latest steps
+    pool_by_priority = sorted(
+        ((i, summarize_chain(t, settings.THINK_CHAIN_MAX_STEPS)) for i, t in enumerate(thinking_pool)),
+        key=lambda p: p[1].get("status") != "active"
+    )
+    pool_kept = budget.fit_items("thinking_pool", pool_by_priority, render=lambda p: compact_json(p[1]))
+    pool_kept = [t for _, t in sorted(pool_kept, key=lambda p: p[0])]
+    thinking_pool_str = compact_json(pool_kept) if pool_kept else "（空）"
+
+    memories_kept = budget.fit_items("memories", sorted(dedupe_memories(memories), key=memory_priority), render=compact_json)
+    # Oldest perceptions are dropped first
+    perception_queue = budget.fit_text("perception_queue", perception_queue, keep_tail=True)
+    # thinking_pool is rendered in its own section, not repeated under goals
+    goals = {k: v for k, v in persona_state['intent'].items() if k != 'thinking_pool'}
+    goals_str = budget.fit_text("goals", compact_json(goals))
+    social_state_str = budget.fit_text("social_state", compact_json(social_state))
+
+    latest_perception = state.get("latest_perception", "（无新感知）")
+
     # Format available actions
+    # Only actions relevant to the current perception, goals and thinking pool are listed
     actions_schema = action_registry.get_all_schemas()
+    if settings.ACTION_RETRIEVAL_ENABLED:
+        retrieval_query = "\n".join(filter(None, [
+            current_input,
+            latest_perception,
+            perception_queue,
+            persona_state['intent'].get('short_term_goal'),
+            " ".join(str(t.get("topic", "")) for t in thinking_pool if t.get("status") == "active")
+        ]))
+        actions_schema = await action_retriever.select(actions_schema, retrieval_query, llm)
     
     def format_actions_compact(actions):
         categories = {}
@@ -60,12 +104,6 @@ async def think_node(state: Dict[str, Any], persona: PersonaManager, llm: LLMPro
 
     actions_str = format_actions_compact(actions_schema)
 
-    # Format Thinking Pool
-    thinking_pool = persona_state['intent'].get('thinking_pool', [])
-    thinking_pool_str = json.dumps(thinking_pool, ensure_ascii=False, separators=(',', ':')) if thinking_pool else "（空）"
-
-    latest_perception = state.get("latest_perception", "（无新感知）")
-
     # Format rules with user_name
     # Use replace instead of format to avoid issues with JSON braces in the rules
     # formatted_rules = INTERACTION_RULES.replace("{user_name}", user_name)
@@ -83,26 +121,52 @@ async def think_node(state: Dict[str, Any], persona: PersonaManager, llm: LLMPro
         latest_perception=latest_perception,
         emotions=json.dumps(persona_state['emotions'], ensure_ascii=False, separators=(',', ':')),
         desires=json.dumps(persona_state['desires'], ensure_ascii=False, separators=(',', ':')),
-        goals=json.dumps(persona_state['intent'], ensure_ascii=False, separators=(',', ':')),
-        social_state=json.dumps(social_state, ensure_ascii=False, separators=(',', ':')),
-        memories=json.dumps(memories, ensure_ascii=False, separators=(',', ':')),
+        goals=goals_str,
+        social_state=social_state_str,
+        memories=compact_json(memories_kept),
         thinking_pool=thinking_pool_str
     )
+    token_usage = {"sections": budget.report(), "system_prompt": budget.count(system_prompt)}
+    state.setdefault("prompt_tokens", {})["think"] = token_usage
     
     messages = [
         {"role": "system", "content": system_prompt}
     ]
-    response_text = await llm.generate(
-        messages, 
-        model=settings.THINKING_MODEL, 
-        api_base=settings.LLM_API_BASE,
-        api_key=settings.LLM_API_KEY,
-        # response_format={"type": "json_object"},
+    generate_kwargs = {
+        "model": settings.THINKING_MODEL,
+        "api_base": settings.LLM_API_BASE,
+        "api_key": settings.LLM_API_KEY,
+        "node": "think",
+        "user_id": user_id,
+        # User-input cycles are scheduled ahead of idle continuous-thinking cycles
+        "priority": PRIORITY_INTERACTIVE if state.get("input") else PRIORITY_IDLE,
+        "timeout": settings.THINK_TIMEOUT,
+        "fallbacks": settings.THINK_FALLBACKS,
         **settings.THINK_MODEL_PARAMS
-    )
+    }
+    # Constrain the output to the state_update/action_queue contract where supported
+    response_format = response_format_for(settings.THINKING_MODEL, build_think_schema(actions_schema), "think_output")
+    if response_format:
+        generate_kwargs["response_format"] = response_format
+    if dispatcher:
+        # Streaming mode: hand each action_queue entry to the dispatcher as soon as
+        # its JSON object is complete, and speak content token by token, while the
+        # model keeps generating.
+        parser = StreamingJSONParser(items_key="action_queue")
+        chunks = []
+        async for chunk in llm.generate_stream(messages, **generate_kwargs):
+            chunks.append(chunk)
+            for event in parser.feed(chunk):
+                if event[0] == "item":
+                    await dispatcher.submit(event[2], index=event[1])
+                elif event[0] == "delta":
+                    dispatcher.speech_delta(event[1], event[2], event[3])
+        response_text = "".join(chunks)
+    else:
+        response_text = await llm.generate(messages, **generate_kwargs)
     
     # Log Thought
-    recorder.log_thought(messages, str(response_text), metadata={"user_id": user_id})
+    recorder.log_thought(messages, str(response_text), metadata={"user_id": user_id, "prompt_tokens": token_usage})
     
     if not isinstance(response_text, str):
         print(f"CRITICAL WARNING: response_text is not a string! Type: {type(response_text)}")
@@ -113,19 +177,29 @@ async def think_node(state: Dict[str, Any], persona: PersonaManager, llm: LLMPro
         else:
              response_text = str(response_text)
 
-    # Parse JSON (simple parsing for PoC)
-    # In production, use structured output or robust parsing
-    try:
-        start = response_text.find("{")
-        end = response_text.rfind("}") + 1
-        json_str = response_text[start:end]
-        thought_data = json.loads(json_str)
-    except Exception as e:
-        print(f"Error parsing JSON: {e}")
+    # Parse and validate JSON; one targeted repair attempt before giving up on the cycle
+    thought_data = await parse_with_repair(
+        llm, messages, response_text, node="think",
+        validator=make_think_validator(list(action_registry.actions.keys())),
+        **generate_kwargs
+    )
+    if thought_data is None:
         print(f"Raw response: {response_text}")
         # Fallback to empty thought data to avoid crash
         thought_data = {}
 
+    if dispatcher and dispatcher.submitted:
+        # Streamed items have already been dispatched, and act_node submits only the
+        # items after them. Keep the streamed response's own action_queue: a repaired
+        # (or filtered) queue would make actions run twice or be skipped.
+        try:
+            streamed_queue = extract_json(response_text).get("action_queue")
+        except ValueError:
+            streamed_queue = None
+        if not isinstance(streamed_queue, list):
+            streamed_queue = list(dispatcher.action_queue)
+        thought_data["action_queue"] = streamed_queue
+
     # --- Adapter for New Response Format ---
     
     # 1. Map State Updates
@@ -177,7 +251,9 @@ async def think_node(state: Dict[str, Any], persona: PersonaManager, llm: LLMPro
     # Add debug info for logging
     thought_data["_debug"] = {
         "system_prompt": system_prompt,
-        "raw_response": response_text
+        "raw_response": response_text,
+        "prompt_tokens": token_usage,
+        "parse_stats": parse_stats.snapshot()
     }
     
     # Update Persona
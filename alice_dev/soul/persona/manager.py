@@ -4,9 +4,12 @@ from .intent import Intent
 from typing import Dict, Any
 import json
 import os
+from config.loader import load_json_config
+from memory.state_store import open_state_store
 
 class PersonaManager:
-    def __init__(self, config_path: str = "config/persona.json"):
+    def __init__(self, config_path: str = "config/persona.json", user_id: str = "default"):
+        self.user_id = user_id
         self.config = self._load_config(config_path)
         
         self.emotions = Emotions(**self.config.get("emotions", {}))
@@ -19,82 +22,55 @@ class PersonaManager:
             short_term_goal=intent_data.get("short_term_goal", "提问以获取信息")
         )
         
-        # Load persistence if available
+        # Per-user state, persisted by the configured backend (see StateStore); load persistence if available
+        self.store = open_state_store(user_id, "persona", self.get_state)
         self._load_persistence()
 
     def _get_persistence_path(self):
+        # Legacy global persistence file, only read for migration
         return "/storage/persona_state.json"
 
+    def _apply_state(self, data: Dict[str, Any]):
+        if "emotions" in data:
+            self.emotions.update(data["emotions"])
+        if "desires" in data:
+            self.desires.update(data["desires"])
+        if "intent" in data:
+            intent_data = data["intent"]
+            if "short_term_goal" in intent_data:
+                self.intent.short_term_goal = intent_data["short_term_goal"]
+            if "life_goal" in intent_data:
+                self.intent.life_goal = intent_data["life_goal"]
+            if "long_term_goal" in intent_data:
+                self.intent.long_term_goal = intent_data["long_term_goal"]
+            if "thinking_pool" in intent_data:
+                self.intent.thinking_pool = intent_data["thinking_pool"]
+
     def _load_persistence(self):
-        """Loads state from persistence file."""
+        """Loads state from the state store, migrating the older global persona file."""
         try:
-            path = self._get_persistence_path()
-            
-            # Migration: Check for old file if new one doesn't exist
-            if not os.path.exists(path):
-                old_path = "/memory/persona_state.json"
-                if os.path.exists(old_path):
-                    print(f"Migrating persona state from {old_path} to {path}")
-                    try:
-                        with open(old_path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                        
-                        # Load data to memory
-                        if "emotions" in data:
-                            self.emotions.update(data["emotions"])
-                        if "desires" in data:
-                            self.desires.update(data["desires"])
-                        if "intent" in data:
-                            intent_data = data["intent"]
-                            if "short_term_goal" in intent_data:
-                                self.intent.short_term_goal = intent_data["short_term_goal"]
-                            if "life_goal" in intent_data:
-                                self.intent.life_goal = intent_data["life_goal"]
-                            if "long_term_goal" in intent_data:
-                                self.intent.long_term_goal = intent_data["long_term_goal"]
-                            if "thinking_pool" in intent_data:
-                                self.intent.thinking_pool = intent_data["thinking_pool"]
-                        
-                        # Save to new path immediately
-                        self._save_persistence()
-                        return
-                    except Exception as e:
-                        print(f"Error migrating persona state: {e}")
+            if self.store.load(self._apply_state, lambda op: self._apply_state(op["value"])):
+                print(f"Loaded persona state from {self.store.directory}")
+                return
 
-            if os.path.exists(path):
-                print(f"Loading persona state from {path}")
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                if "emotions" in data:
-                    self.emotions.update(data["emotions"])
-                if "desires" in data:
-                    self.desires.update(data["desires"])
-                if "intent" in data:
-                    intent_data = data["intent"]
-                    if "short_term_goal" in intent_data:
-                        self.intent.short_term_goal = intent_data["short_term_goal"]
-                    if "life_goal" in intent_data:
-                        self.intent.life_goal = intent_data["life_goal"]
-                    if "long_term_goal" in intent_data:
-                        self.intent.long_term_goal = intent_data["long_term_goal"]
-                    if "thinking_pool" in intent_data:
-                        self.intent.thinking_pool = intent_data["thinking_pool"]
+            # Migration: previous (shared by all users) locations
+            for old_path in [self._get_persistence_path(), "/memory/persona_state.json"]:
+                if os.path.exists(old_path):
+                    print(f"Migrating persona state from {old_path} to {self.store.directory}")
+                    with open(old_path, 'r', encoding='utf-8') as f:
+                        self._apply_state(json.load(f))
+                    self.store.compact()
+                    return
         except Exception as e:
             print(f"Error loading persona persistence: {e}")
 
     def _save_persistence(self):
-        """Saves current state to persistence file."""
-        try:
-            path = self._get_persistence_path()
-            # Ensure directory exists (it should, as it's a volume)
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            
-            state = self.get_state()
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(state, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error saving persona persistence: {e}")
+        """Records the current state; written to disk (coalesced) after STATE_FLUSH_DELAY."""
+        # Only the latest full state matters, so it replaces any still-queued one
+        self.store.record({"op": "state", "value": self.get_state()}, replace_pending=True)
+
+    def flush(self):
+        self.store.flush()
 
     def _load_config(self, path: str) -> Dict[str, Any]:
         try:
@@ -107,9 +83,10 @@ class PersonaManager:
             else:
                 full_path = path
                 
-            if os.path.exists(full_path):
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            # Parsed once per process and shared by all agents (read-only)
+            data = load_json_config(full_path)
+            if data is not None:
+                return data
             else:
                 print(f"Warning: Config file not found at {full_path}, using defaults.")
                 return {}
@@ -1,33 +1,120 @@
 import os
+import glob
+import gzip
 import json
+import hashlib
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Union, Optional
 from config.settings import settings
+from .logwriter import AsyncLogWriter
 
 class DataRecorder:
+    """
+    Records perception/think LLM calls as JSONL (when ENABLE_LLM_LOGS is on).
+
+    Writes go through AsyncLogWriter (background batched writes, rotation + gzip).
+    With RECORDER_DEDUP_PROMPTS, long prompts are split into paragraph blocks; each
+    block seen a second time is stored once in prompt_blocks.jsonl and later records
+    reference it by hash. The static parts of the system prompt (persona, rules) are
+    therefore written once instead of on every cycle, while paragraphs embedding
+    per-cycle state stay inline. The blocks file rotates by age with the logs, and
+    each new file gets the blocks it is referenced for again. Use `load_prompt_blocks`
+    and `expand_messages` to restore the original text.
+    """
     def __init__(self, storage_dir: str = "/storage"):
         self.storage_dir = storage_dir
         self.perception_log_path = os.path.join(storage_dir, "perception_logs.jsonl")
         self.thought_log_path = os.path.join(storage_dir, "thought_logs.jsonl")
-        
+        self.prompt_blocks_path = os.path.join(storage_dir, "prompt_blocks.jsonl")
+
         # Ensure directory exists
         os.makedirs(storage_dir, exist_ok=True)
 
+        rotation = {
+            "max_bytes": settings.RECORDER_MAX_BYTES,
+            "max_age": settings.RECORDER_MAX_AGE,
+            "backups": settings.RECORDER_BACKUPS,
+            "queue_size": settings.RECORDER_QUEUE_SIZE
+        }
+        self.writers = {
+            self.perception_log_path: AsyncLogWriter(self.perception_log_path, **rotation),
+            self.thought_log_path: AsyncLogWriter(self.thought_log_path, **rotation)
+        }
+        # Rotated by age only (like the logs, at least every RECORDER_MAX_AGE), so block
+        # backups cover at least the period of the log backups that reference them
+        self.blocks_writer = AsyncLogWriter(self.prompt_blocks_path, max_bytes=0, max_age=settings.RECORDER_MAX_AGE,
+                                            backups=settings.RECORDER_BACKUPS, queue_size=settings.RECORDER_QUEUE_SIZE)
+        # digest -> written to the current blocks file; LRU bounded by RECORDER_DEDUP_CACHE
+        self._seen_blocks: "OrderedDict[str, bool]" = OrderedDict()
+        self._blocks_rotations = 0
+
+    def _block_ref(self, block: str) -> Optional[str]:
+        """Hash under which `block` is stored in prompt_blocks.jsonl, or None to keep it inline."""
+        if self.blocks_writer.rotations != self._blocks_rotations:
+            # New blocks file: write blocks again so each file covers the logs of its period
+            self._blocks_rotations = self.blocks_writer.rotations
+            for digest in self._seen_blocks:
+                self._seen_blocks[digest] = False
+        digest = hashlib.sha1(block.encode("utf-8")).hexdigest()
+        written = self._seen_blocks.get(digest)
+        if written is None:
+            # First sighting stays inline: only paragraphs that repeat (the static parts of
+            # the prompt) become blocks, not the ones embedding per-cycle JSON
+            self._remember_block(digest, False)
+            return None
+        if not written:
+            # Marked written only once its write is queued, so every reference has its block
+            if not self.blocks_writer.write({"hash": digest, "text": block}):
+                return None
+            written = True
+        self._remember_block(digest, written)
+        return digest
+
+    def _remember_block(self, digest: str, written: bool):
+        self._seen_blocks[digest] = written
+        self._seen_blocks.move_to_end(digest)
+        while len(self._seen_blocks) > settings.RECORDER_DEDUP_CACHE:
+            self._seen_blocks.popitem(last=False)
+
+    def _dedup_content(self, content: str) -> Union[str, Dict[str, Any]]:
+        if not isinstance(content, str) or len(content) < settings.RECORDER_DEDUP_MIN_CHARS:
+            return content
+        blocks = []
+        for block in content.split("\n\n"):
+            ref = self._block_ref(block) if len(block) >= settings.RECORDER_DEDUP_MIN_CHARS else None
+            if ref is None:
+                # Short (usually dynamic) or not yet repeated blocks are kept inline
+                if blocks and isinstance(blocks[-1], str):
+                    blocks[-1] += "\n\n" + block
+                else:
+                    blocks.append(block)
+                continue
+            blocks.append({"$ref": ref})
+        return {"$blocks": blocks}
+
     def _append_log(self, file_path: str, data: Dict[str, Any]):
         try:
+            if settings.RECORDER_DEDUP_PROMPTS:
+                data = {
+                    **data,
+                    "input": [
+                        {**m, "content": self._dedup_content(m.get("content"))} if isinstance(m, dict) else m
+                        for m in data.get("input", [])
+                    ]
+                }
             entry = {
                 "timestamp": datetime.now().isoformat(),
                 **data
             }
-            with open(file_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.writers[file_path].write(entry)
         except Exception as e:
             print(f"Error writing to log {file_path}: {e}")
 
     def log_perception(self, input_messages: List[Dict[str, str]], output_content: str, metadata: Dict[str, Any] = None):
         if not settings.ENABLE_LLM_LOGS:
             return
-            
+
         data = {
             "input": input_messages,
             "output": output_content,
@@ -46,5 +133,38 @@ class DataRecorder:
         }
         self._append_log(self.thought_log_path, data)
 
-# Global instance
-recorder = DataRecorder()
+    async def flush(self):
+        for writer in list(self.writers.values()) + [self.blocks_writer]:
+            await writer.flush()
+
+def load_prompt_blocks(path: str) -> Dict[str, str]:
+    """Blocks of the current prompt_blocks.jsonl and its rotated (gzip) backups."""
+    base, ext = os.path.splitext(path)
+    paths = sorted(glob.glob(f"{glob.escape(base)}.*{ext}*"))
+    if os.path.exists(path):
+        paths.append(path)
+    blocks = {}
+    for p in paths:
+        opener = gzip.open if p.endswith(".gz") else open
+        with opener(p, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    blocks[entry["hash"]] = entry["text"]
+                except (json.JSONDecodeError, KeyError):
+                    continue
+    return blocks
+
+def expand_messages(messages: List[Dict[str, Any]], blocks: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Restores deduplicated message contents of a log record (see DataRecorder)."""
+    expanded = []
+    for m in messages:
+        content = m.get("content") if isinstance(m, dict) else None
+        if isinstance(content, dict) and "$blocks" in content:
+            parts = [b if isinstance(b, str) else blocks.get(b["$ref"], f"<missing block {b['$ref']}>") for b in content["$blocks"]]
+            m = {**m, "content": "\n\n".join(parts)}
+        expanded.append(m)
+    return expanded
+
+# Global instance (one directory per worker in multi-process mode)
+recorder = DataRecorder(os.path.join("/storage", settings.WORKER_ID) if settings.WORKER_ID else "/storage")
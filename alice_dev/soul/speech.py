@@ -0,0 +1,64 @@
+import asyncio
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.websockets.manager import ConnectionManager
+
+class SpeechStream:
+    """
+    Forwards `speak` text to the websocket while the model is still generating it.
+
+    `push` never blocks the LLM stream: text is appended to a pending buffer and a
+    sender task ships it as `agent_stream` chunks. While a send to a slow client is
+    in flight, new tokens keep accumulating and go out as one larger chunk next time,
+    so a slow client gets fewer, bigger messages instead of stalling generation.
+    """
+    def __init__(self, connection_manager: "ConnectionManager", user_id: str):
+        self.connection_manager = connection_manager
+        self.user_id = user_id
+        self.text = ""
+        self._pending = ""
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    def push(self, delta: str):
+        if not delta or self._closed:
+            return
+        self.text += delta
+        self._pending += delta
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._ready.set()
+
+    async def _send(self, event):
+        if not (self.connection_manager and self.user_id):
+            return
+        try:
+            await self.connection_manager.send_event(self.user_id, event)
+        except Exception as e:
+            print(f"SpeechStream: error sending {event.get('type')}: {e}")
+
+    async def _run(self):
+        await self._send({"type": "agent_response_start"})
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            chunk, self._pending = self._pending, ""
+            if chunk:
+                await self._send({"type": "agent_stream", "chunk": chunk})
+            if self._closed and not self._pending:
+                break
+        await self._send({"type": "agent_response_end"})
+
+    async def close(self) -> str:
+        """Flushes the remaining text, ends the response and returns the full text."""
+        self._closed = True
+        if self._task:
+            self._ready.set()
+            await self._task
+        return self.text
@@ -0,0 +1,46 @@
+import os
+from opentelemetry import trace
+from config.settings import settings
+
+# Spans are created through the OpenTelemetry API only. Without setup_tracing()
+# (e.g. scripts, tests) the API hands out no-op spans, so instrumentation is free.
+tracer = trace.get_tracer("alice.soul")
+
+_configured = False
+
+def setup_tracing():
+    """
+    Installs the tracer provider and exporter selected by settings.TRACING_EXPORTER:
+      'file'    - one JSON span per line in settings.TRACE_FILE (for offline flame views)
+      'otlp'    - OTLP/HTTP to settings.OTLP_ENDPOINT (Jaeger, Tempo, collector...)
+      'console' - stdout
+      'none'    - disabled
+    """
+    global _configured
+    exporter_name = settings.TRACING_EXPORTER
+    if _configured or exporter_name == "none":
+        return
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if exporter_name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=settings.OTLP_ENDPOINT)
+    elif exporter_name == "file":
+        os.makedirs(os.path.dirname(settings.TRACE_FILE) or ".", exist_ok=True)
+        trace_file = open(settings.TRACE_FILE, "a", encoding="utf-8")
+        exporter = ConsoleSpanExporter(out=trace_file, formatter=lambda span: span.to_json(indent=None) + "\n")
+    else:
+        exporter = ConsoleSpanExporter()
+
+    provider = TracerProvider(resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _configured = True
+    print(f"Tracing enabled ({exporter_name})")
+
+def shutdown_tracing():
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
@@ -0,0 +1,47 @@
+import asyncio
+import types
+import pytest
+
+agent_module = pytest.importorskip("soul.agent")
+from config.settings import settings
+
+class FailingThinkGraph:
+    """Runs observe (sets the agent's checkpoint) unless resuming, then fails in think."""
+    def __init__(self, agent, cycles):
+        self.agent = agent
+        self.cycles = cycles
+        self.calls = []
+
+    async def ainvoke(self, state, config=None):
+        self.calls.append(state.get("resume_stage"))
+        if len(self.calls) >= self.cycles:
+            self.agent.is_running = False
+        if state.get("resume_stage") != "think":
+            self.agent._checkpoint = {"input": state.get("input"), "perception_queue_str": "observed"}
+        raise RuntimeError("think failed")
+
+def make_agent(cycles):
+    agent = agent_module.AliceAgent.__new__(agent_module.AliceAgent)
+    agent.user_id = "test"
+    agent.user_profile = {}
+    agent.is_running = True
+    agent.input_queue = asyncio.Queue()
+    agent.log_callback = None
+    agent.persona = types.SimpleNamespace(config={}, get_persona_prompt=lambda profile: "")
+    agent.working_memory = types.SimpleNamespace(
+        get_context_string=lambda: "", get_instant_memory_string=lambda: "", instant_version=0
+    )
+    agent._graph_config = {}
+    agent._checkpoint = None
+    agent._resume_state = None
+    agent._resume_count = 0
+    agent.graph = FailingThinkGraph(agent, cycles)
+    return agent
+
+def test_think_failing_twice_is_resumed_up_to_the_limit(monkeypatch):
+    monkeypatch.setattr(settings, "AGENT_MAX_STAGE_RESUMES", 2)
+    monkeypatch.setattr(settings, "AGENT_RETRY_DELAY", 0)
+    agent = make_agent(cycles=4)
+    asyncio.run(agent._run_loop())
+    # Fresh cycle, two resumes at think, then a fresh cycle once the limit is reached
+    assert agent.graph.calls == [None, "think", "think", None]
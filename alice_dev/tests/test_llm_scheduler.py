@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+
+provider = pytest.importorskip("soul.llm.provider")
+
+def test_follower_retries_when_leader_is_cancelled():
+    async def scenario():
+        scheduler = provider.LLMScheduler()
+        started = asyncio.Event()
+        calls = []
+
+        async def leader_call():
+            calls.append("leader")
+            started.set()
+            await asyncio.sleep(10)
+            return "leader result"
+
+        async def follower_call():
+            calls.append("follower")
+            return "follower result"
+
+        leader = asyncio.create_task(scheduler.run("endpoint", provider.PRIORITY_IDLE, "same-key", leader_call))
+        await started.wait()
+        follower = asyncio.create_task(scheduler.run("endpoint", provider.PRIORITY_IDLE, "same-key", follower_call))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == "follower result"
+        assert calls == ["leader", "follower"]
+        assert "same-key" not in scheduler._inflight
+
+    asyncio.run(scenario())
+
+def test_follower_shares_leader_result_and_errors():
+    async def scenario():
+        scheduler = provider.LLMScheduler()
+        release = asyncio.Event()
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await release.wait()
+            return "shared"
+
+        tasks = [asyncio.create_task(scheduler.run("endpoint", provider.PRIORITY_IDLE, "key", call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(*tasks) == ["shared"] * 3
+        assert len(calls) == 1
+
+        async def failing():
+            await asyncio.sleep(0)
+            raise ValueError("bad request")
+
+        tasks = [asyncio.create_task(scheduler.run("endpoint", provider.PRIORITY_IDLE, "err", failing)) for _ in range(2)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(scenario())
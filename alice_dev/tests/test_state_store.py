@@ -0,0 +1,51 @@
+import json
+import pytest
+
+state_store = pytest.importorskip("memory.state_store")
+
+class Counter:
+    """Minimal component persisted through a StateStore: a list of appended values."""
+    def __init__(self, directory):
+        self.items = []
+        self.store = state_store.StateStore(str(directory), "counter", lambda: {"items": list(self.items)},
+                                            flush_delay=0, compact_every=1000)
+
+    def load(self):
+        return self.store.load(lambda state: self.items.extend(state.get("items", [])),
+                               lambda op: self.items.append(op["item"]))
+
+    def add(self, value):
+        self.items.append(value)
+        self.store.record({"op": "append", "item": value})
+
+def test_ops_after_torn_line_survive_restart(tmp_path):
+    first = Counter(tmp_path)
+    for i in range(3):
+        first.add(i)
+    # Crash in the middle of an append
+    with open(first.store.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "append", "item": 3, "se')
+
+    second = Counter(tmp_path)
+    assert second.load()
+    assert second.items == [0, 1, 2]
+    for i in range(4, 7):
+        second.add(i)
+
+    third = Counter(tmp_path)
+    assert third.load()
+    assert third.items == [0, 1, 2, 4, 5, 6]
+
+def test_complete_line_without_newline_is_kept(tmp_path):
+    first = Counter(tmp_path)
+    first.add(0)
+    with open(first.store.journal_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "append", "item": 1, "seq": 2}))
+
+    second = Counter(tmp_path)
+    assert second.load()
+    second.add(2)
+
+    third = Counter(tmp_path)
+    third.load()
+    assert third.items == [0, 1, 2]